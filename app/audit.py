@@ -0,0 +1,138 @@
+# app/audit.py
+"""
+Asynchroniczny audyt do tabeli audit_log.
+
+log() tylko wrzuca zdarzenie do ograniczonej kolejki – przy przeciążeniu
+zdarzenie jest odrzucane i liczone w stats()["dropped"], żeby żądanie nigdy
+nie czekało na bazę. Wątek w tle zapisuje paczki jednym executemany
+w jednej transakcji (SQLite w trybie WAL, patrz app/database.py).
+
+Włączanie: AUDIT_ENABLED=1.
+"""
+from __future__ import annotations
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+AUDIT_ENABLED = os.getenv("AUDIT_ENABLED", "0") == "1"
+QUEUE_MAX = int(os.getenv("AUDIT_QUEUE_MAX", "10000"))
+MAX_BATCH = int(os.getenv("AUDIT_MAX_BATCH", "500"))
+FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", "0.5"))   # sekundy
+
+_INSERT = "INSERT INTO audit_log (ts, client_id, event, meta) VALUES (?, ?, ?, ?)"
+_STOP = object()
+
+_q: "queue.Queue" = queue.Queue(maxsize=QUEUE_MAX)
+_thread: Optional[threading.Thread] = None
+_pid: Optional[int] = None
+_start_lock = threading.Lock()
+_stats = {"written": 0, "dropped": 0, "batches": 0, "errors": 0}
+
+
+def log(event: str, client_id: Optional[str] = None, **meta: Any):
+    """Rejestruje zdarzenie audytu. Nigdy nie blokuje i nie rzuca wyjątków."""
+    if not AUDIT_ENABLED:
+        return
+    _ensure_worker()
+    # format DateTime jak w SQLAlchemy dla SQLite
+    row = (datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S.%f"), client_id, event,
+           json.dumps(meta, ensure_ascii=False, default=str))
+    try:
+        _q.put_nowait(row)
+    except queue.Full:
+        _stats["dropped"] += 1
+
+
+def stats() -> Dict[str, int]:
+    return {**_stats, "queued": _q.qsize()}
+
+
+def _ensure_worker():
+    global _thread, _pid, _q
+    if _thread is not None and _pid == os.getpid():
+        return
+    with _start_lock:
+        if _thread is not None and _pid == os.getpid():
+            return
+        if _pid is not None:
+            _q = queue.Queue(maxsize=QUEUE_MAX)  # po fork() nie zapisujemy kolejki rodzica
+        _pid = os.getpid()
+        _thread = threading.Thread(target=_run, name="audit-writer", daemon=True)
+        _thread.start()
+
+
+def _connect():
+    from app.database import engine
+    from app.models import AuditLog
+    AuditLog.__table__.create(bind=engine, checkfirst=True)
+    return engine.raw_connection()
+
+
+def _drain(first) -> Tuple[List[tuple], bool]:
+    batch, stop = [], first is _STOP
+    if not stop:
+        batch.append(first)
+    deadline = time.monotonic() + FLUSH_INTERVAL
+    while not stop and len(batch) < MAX_BATCH:
+        left = deadline - time.monotonic()
+        if left <= 0:
+            break
+        try:
+            item = _q.get(timeout=left)
+        except queue.Empty:
+            break
+        if item is _STOP:
+            stop = True
+        else:
+            batch.append(item)
+    return batch, stop
+
+
+def _run():
+    conn = None
+    while True:
+        batch, stop = _drain(_q.get())
+        if batch:
+            try:
+                if conn is None:
+                    conn = _connect()
+                cur = conn.cursor()
+                cur.executemany(_INSERT, batch)
+                conn.commit()
+                cur.close()
+                _stats["written"] += len(batch)
+                _stats["batches"] += 1
+            except Exception:
+                import traceback
+                print("=== BŁĄD ZAPISU AUDYTU ===")
+                traceback.print_exc()
+                _stats["errors"] += 1
+                _stats["dropped"] += len(batch)
+                if conn is not None:
+                    conn.close()
+                    conn = None
+        if stop:
+            if conn is not None:
+                conn.close()
+            return
+
+
+def shutdown(timeout: float = 5.0):
+    """Zapisuje zaległe zdarzenia i zatrzymuje wątek (wywoływane przy wyjściu procesu)."""
+    global _thread
+    if _thread is None or _pid != os.getpid():
+        return
+    try:
+        _q.put(_STOP, timeout=timeout)
+    except queue.Full:
+        return
+    _thread.join(timeout)
+    _thread = None
+
+
+atexit.register(shutdown)
@@ -1,23 +1,79 @@
 # app/chat_agent.py
-from typing import List, Dict, Any
+import asyncio
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, AsyncIterator, Optional
 from pydantic import BaseModel
-from openai import OpenAI
 from app.pricing import estimate_offer
-from app.knr import find_knr_items
+from app.rules import rules_version
+from app.knr import find_knr_items, find_knr_items_many, current_version
+from app.completion_cache import CompletionCache, make_key
+from app.chat_sessions import ChatSession, sessions
+from app.fast_path import FastPath
+from app import upstream
+from app.upstream import Deadline
+from app import audit, metrics
 
-client = OpenAI()
+# Ponowienia i limity czasu obsługuje app/upstream.py (jeden deadline na całą odpowiedź).
+# Klientów (i SDK openai) tworzymy przy pierwszym użyciu – patrz openai_client().
+client = None
+aclient = None   # ścieżka strumieniowa
+_client_lock = threading.Lock()
+
+MODEL = "gpt-4o-mini"
+TEMPERATURE = 0.2
+# Ile rund wywołań narzędzi dopuszczamy, zanim wymusimy odpowiedź tekstową
+MAX_TOOL_ROUNDS = int(os.getenv("CHAT_MAX_TOOL_ROUNDS", "3"))
+# Narzędzia z jednej rundy wykonujemy równolegle
+_TOOL_POOL = ThreadPoolExecutor(max_workers=int(os.getenv("CHAT_TOOL_WORKERS", "8")),
+                                thread_name_prefix="chat-tool")
+# Cache odpowiedzi modelu (patrz app/completion_cache.py)
+_completions = CompletionCache()
 
 SYSTEM_PROMPT = (
     "Jesteś asystentem firmy OLLBUD. Rozmawiasz po polsku. "
     "Dopytujesz tylko o kluczowe informacje. "
     "Gdy użytkownik podaje konkretne prace (np. 'malowanie ścian 120 m2', 'montaż paneli 60 m2'), "
     "użyj narzędzia get_knr_rate, aby przytoczyć KNR (w tym RG i ewentualną jednostkę). "
+    "Gdy prac jest kilka, wywołaj get_knr_rate raz z listą 'pozycje'. "
+    "Gdy rodzaj prac jednoznacznie wskazuje katalog KNR albo użytkownik podał jednostkę, "
+    "przekaż 'katalog' i/lub 'jednostka' – wtedy szukamy tylko w tej części katalogu. "
     "Zawsze zwracaj łączny nakład robocizny (RG) jeśli podano ilość. "
     "Gdy masz metraż całego zlecenia i typ/standard (blok/kamienica/dom/deweloperski/budowa domu), "
     "wywołaj estimate_offer i przedstaw widełki. "
     "Na końcu przypominaj o kosztach przygotowania wyceny."
 )
 
+# Dopisek o kosztach przygotowania wyceny – doklejany do każdej odpowiedzi
+COST_FOOTER = (
+    "\n\n📍 *Koszt przygotowania wyceny:* "
+    "\n– **499 PLN brutto** w strefie pomarańczowej,"
+    "\n– **619 PLN brutto** w strefie czerwonej,"
+    "\n– **929 PLN brutto** w strefie czarnej."
+    "\n\nW przypadku wycen dotyczących **budowy domu** obowiązuje dodatkowa stawka "
+    "**615 PLN brutto**, doliczana do kwoty podstawowej."
+    "\n\nDziękujemy za uwagę i do zobaczenia!"
+)
+
+# Filtry get_knr_rate – wyszukiwanie tylko w wybranych shardach katalogu (app/knr.py)
+_KATALOG_PARAM = {
+    "type": "string",
+    "description": (
+        "Opcjonalnie: katalog KNR wynikający z rodzaju prac, np. '2-01' (roboty ziemne), "
+        "'2-02' (roboty ogólnobudowlane), '2-15' (instalacje wod-kan i gazowe), "
+        "'4-01' (roboty remontowe i rozbiórki); kilka – po przecinku"
+    ),
+    "nullable": True
+}
+_JEDNOSTKA_PARAM = {
+    "type": "string",
+    "description": "Opcjonalnie: jednostka pozycji z ilości podanej przez użytkownika (m2, m, m3, szt.)",
+    "nullable": True
+}
+
 TOOLS = [
     {
         "type": "function",
@@ -43,7 +99,8 @@ TOOLS = [
             "name": "get_knr_rate",
             "description": (
                 "Wyszukaj pozycje KNR po opisie i zwróć top dopasowania z RG i jednostką. "
-                "Jeśli podano ilość, policz RG łącznie."
+                "Jeśli podano ilość, policz RG łącznie. "
+                "Dla kilku prac naraz podaj listę 'pozycje' zamiast 'query'."
             ),
             "parameters": {
                 "type": "object",
@@ -56,96 +113,429 @@ TOOLS = [
                         "type": "number",
                         "description": "Ilość w jednostkach z KNR (np. m2, m, szt.)",
                         "nullable": True
+                    },
+                    "katalog": _KATALOG_PARAM,
+                    "jednostka": _JEDNOSTKA_PARAM,
+                    "pozycje": {
+                        "type": "array",
+                        "description": "Kilka prac naraz, np. [{'query': 'malowanie ścian', 'ilosc': 120}]",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "query": {"type": "string"},
+                                "ilosc": {"type": "number", "nullable": True},
+                                "katalog": _KATALOG_PARAM,
+                                "jednostka": _JEDNOSTKA_PARAM
+                            },
+                            "required": ["query"]
+                        }
                     }
-                },
-                "required": ["query"]
+                }
             }
         }
     }
 ]
 
 
+# Proste wiadomości ('blok 55 m2', 'malowanie ścian 120 m2') obsługujemy bez modelu
+_fast_path = FastPath(TOOLS[0]["function"]["parameters"]["properties"]["standard"]["enum"])
+
+
 class ChatTurn(BaseModel):
     role: str
     content: str
 
 
-def run_chat_agent(history: List[ChatTurn]) -> Dict[str, Any]:
-    messages = [{"role": "system", "content": SYSTEM_PROMPT}] + [
-        {"role": t.role, "content": t.content} for t in history
+def _run_tool(name: str, args: Dict[str, Any]) -> Any:
+    """Wykonuje narzędzie wywołane przez model (KNR, wycena)."""
+    audit.log("chat_tool", tool=name, args=args)
+
+    if name == "estimate_offer":
+        area = float(args.get("area_m2", 0))
+        standard = (args.get("standard") or "blok").lower()
+        return estimate_offer(area, standard)
+
+    if name == "get_knr_rate":
+        pozycje = args.get("pozycje")
+        try:
+            if pozycje:
+                return find_knr_items_many(
+                    [p.get("query") or "" for p in pozycje],
+                    [p.get("ilosc") for p in pozycje],
+                    top_n=5,
+                    katalogi=[p.get("katalog") or args.get("katalog") for p in pozycje],
+                    jednostki=[p.get("jednostka") or args.get("jednostka") for p in pozycje],
+                )
+            query = args.get("query") or ""
+            ilosc = args.get("ilosc")
+            return find_knr_items(query, top_n=5, ilosc=ilosc,
+                                  katalog=args.get("katalog"), jednostka=args.get("jednostka"))
+        except ValueError as e:
+            # zły filtr (katalog/jednostka spoza arkusza) – model może spróbować bez niego
+            return {"error": str(e)}
+
+    return {"error": f"Nieznane narzędzie: {name}"}
+
+
+def openai_client():
+    global client
+    if client is None:
+        with _client_lock:
+            if client is None:
+                from openai import OpenAI
+                client = OpenAI(max_retries=0, http_client=upstream.http_client())
+    return client
+
+
+def openai_aclient():
+    global aclient
+    if aclient is None:
+        with _client_lock:
+            if aclient is None:
+                from openai import AsyncOpenAI
+                aclient = AsyncOpenAI(max_retries=0, http_client=upstream.async_http_client())
+    return aclient
+
+
+def _tool_message(call_id: str, name: str, result: Any) -> Dict[str, Any]:
+    # zwarty JSON zamiast str(): mniej tokenów i bez szumu reprezentacji Pythona
+    content = json.dumps(result, ensure_ascii=False, separators=(",", ":"), default=str)
+    return {"role": "tool", "tool_call_id": call_id, "name": name, "content": content}
+
+
+def _call_dicts(tool_calls) -> List[Dict[str, Any]]:
+    return [
+        {"id": c.id, "type": "function",
+         "function": {"name": c.function.name, "arguments": c.function.arguments}}
+        for c in tool_calls
     ]
 
-    resp = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=messages,
-        tools=TOOLS,
-        tool_choice="auto",
-        temperature=0.2
-    )
 
+def _exec_call(call: Dict[str, Any], session: Optional[ChatSession] = None) -> Dict[str, Any]:
+    name = call["function"]["name"]
+    args = json.loads(call["function"]["arguments"] or "{}")
+    # w sesji ten sam wynik narzędzia liczymy raz na rozmowę
+    result = session.run_tool(name, args, _run_tool, _data_version(name)) if session else _run_tool(name, args)
+    return _tool_message(call["id"], name, result)
+
+
+def _completion_kwargs(with_tools: bool) -> Dict[str, Any]:
+    kwargs = {"model": MODEL, "temperature": TEMPERATURE}
+    if with_tools:
+        kwargs.update(tools=TOOLS, tool_choice="auto")
+    return kwargs
+
+
+def _base_messages(history: List[ChatTurn], session: Optional[ChatSession] = None) -> List[Dict[str, Any]]:
+    messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+    ctx = session.context_message() if session else None
+    if ctx:
+        messages.append(ctx)
+    return messages + [{"role": t.role, "content": t.content} for t in history]
+
+
+def _ms(start: float) -> float:
+    return round((time.perf_counter() - start) * 1000, 1)
+
+
+def _knr_version():
+    # bez wczytywania katalogu – klucz cache nie może kompilować snapshotu w żądaniu
+    try:
+        return current_version()
+    except Exception:
+        return None  # brak katalogu – narzędzie KNR i tak zwróci błąd
+
+
+def _data_version(tool: str) -> str:
+    """Wersja danych, z których liczy narzędzie – klucz wyniku w pamięci sesji."""
+    if tool == "get_knr_rate":
+        return _knr_version() or ""
+    if tool == "estimate_offer":
+        return rules_version()
+    return ""
+
+
+def _cache_key(messages: List[Dict[str, Any]], with_tools: bool) -> str:
+    """
+    Klucz cache z kanonicznej postaci żądania: białe znaki w treści zwinięte,
+    argumenty narzędzi z posortowanymi kluczami, identyfikatory wywołań
+    zastąpione numerami kolejnymi (każde wywołanie API nadaje własne).
+    """
+    ids: Dict[str, int] = {}
+    canon = []
+    for m in messages:
+        c: Dict[str, Any] = {"role": m["role"]}
+        if m.get("content"):
+            c["content"] = " ".join(str(m["content"]).split())
+        if m.get("tool_calls"):
+            c["tool_calls"] = [
+                [ids.setdefault(tc["id"], len(ids)), tc["function"]["name"],
+                 json.loads(tc["function"]["arguments"] or "{}")]
+                for tc in m["tool_calls"]
+            ]
+        if m.get("tool_call_id"):
+            c["tool_call_id"] = ids.get(m["tool_call_id"], m["tool_call_id"])
+        canon.append(c)
+    return make_key({
+        "model": MODEL,
+        "temperature": TEMPERATURE,
+        "tools": TOOLS if with_tools else None,
+        "knr": _knr_version(),
+        "messages": canon,
+    })
+
+
+def _complete(messages: List[Dict[str, Any]], with_tools: bool, deadline: Deadline) -> Dict[str, Any]:
+    """Jedno wywołanie modelu (z cache). Zwraca {content, tool_calls, cached}."""
+    key = _cache_key(messages, with_tools)
+    hit = _completions.get(key)
+    if hit is not None:
+        return {**hit, "cached": True}
+
+    def call(timeout: float):
+        # span tylko na samo wywołanie – bez czekania na slot i przerw między ponowieniami
+        with metrics.span("completion"):
+            return openai_client().chat.completions.create(
+                messages=messages, timeout=timeout, **_completion_kwargs(with_tools))
+
+    resp = upstream.with_retries(call, deadline)
     msg = resp.choices[0].message
+    out = {"content": msg.content, "tool_calls": _call_dicts(msg.tool_calls) if msg.tool_calls else None}
+    _completions.set(key, out)
+    return {**out, "cached": False}
 
-    # Obsługa wywołań narzędzi (KNR, wycena)
-    if msg.tool_calls:
-        tool_messages = []
-        for call in msg.tool_calls:
-            name = call.function.name
-            import json
-            args = json.loads(call.function.arguments or "{}")
-
-            if name == "estimate_offer":
-                area = float(args.get("area_m2", 0))
-                standard = (args.get("standard") or "blok").lower()
-                result = estimate_offer(area, standard)
-                tool_messages.append({
-                    "role": "tool",
-                    "tool_call_id": call.id,
-                    "name": "estimate_offer",
-                    "content": str(result)
-                })
-
-            elif name == "get_knr_rate":
-                query = args.get("query") or ""
-                ilosc = args.get("ilosc")
-                knrs = find_knr_items(query, top_n=5, ilosc=ilosc)
-                tool_messages.append({
-                    "role": "tool",
-                    "tool_call_id": call.id,
-                    "name": "get_knr_rate",
-                    "content": str(knrs)
-                })
-
-        # Druga runda – formatowanie końcowej odpowiedzi
-        follow = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=messages
-            + [{"role": "assistant", "content": None, "tool_calls": msg.tool_calls}]
-            + tool_messages,
-            temperature=0.2
-        )
-        reply = (follow.choices[0].message.content or "").strip()
-
-        # Dopisek o kosztach przygotowania wyceny
-        reply += (
-            "\n\n📍 *Koszt przygotowania wyceny:* "
-            "\n– **499 PLN brutto** w strefie pomarańczowej,"
-            "\n– **619 PLN brutto** w strefie czerwonej,"
-            "\n– **929 PLN brutto** w strefie czarnej."
-            "\n\nW przypadku wycen dotyczących **budowy domu** obowiązuje dodatkowa stawka "
-            "**615 PLN brutto**, doliczana do kwoty podstawowej."
-            "\n\nDziękujemy za uwagę i do zobaczenia!"
+
+def cache_stats() -> Dict[str, Any]:
+    return _completions.stats()
+
+
+def fast_path_stats() -> Dict[str, Any]:
+    return _fast_path.stats()
+
+
+def upstream_stats() -> Dict[str, Any]:
+    return upstream.limiter.stats()
+
+
+def _fast_answer(history: List[ChatTurn], session: Optional[ChatSession]) -> Optional[Dict[str, Any]]:
+    if not history or history[-1].role != "user":
+        return None
+    run = (lambda n, a: session.run_tool(n, a, _run_tool, _data_version(n))) if session else _run_tool
+    return _fast_path.answer(history[-1].content, run)
+
+
+def run_chat_agent(history: List[ChatTurn], session: Optional[ChatSession] = None) -> Dict[str, Any]:
+    fast = _fast_answer(history, session)
+    if fast is not None:
+        return {"reply": fast["reply"] + COST_FOOTER,
+                "timings": [{"fast_path": fast["kind"], "ms": fast["ms"]}]}
+
+    messages = _base_messages(history, session)
+    deadline = Deadline()
+    timings = []
+
+    # Pętla narzędzi (KNR, wycena): po MAX_TOOL_ROUNDS rundach ostatnie wywołanie
+    # idzie bez narzędzi, żeby model musiał sformułować odpowiedź.
+    for round_no in range(MAX_TOOL_ROUNDS + 1):
+        t0 = time.perf_counter()
+        msg = _complete(messages, round_no < MAX_TOOL_ROUNDS, deadline)
+        timing = {"round": round_no + 1, "llm_ms": _ms(t0), "cached": msg["cached"]}
+        timings.append(timing)
+        calls = msg["tool_calls"]
+        if not calls:
+            break
+
+        t1 = time.perf_counter()
+        tool_messages = list(_TOOL_POOL.map(lambda c: _exec_call(c, session), calls))
+        timing.update(tools_ms=_ms(t1), tools=[c["function"]["name"] for c in calls])
+        messages = messages + [{"role": "assistant", "content": msg["content"], "tool_calls": calls}] + tool_messages
+
+    reply = (msg["content"] or "").strip()
+    return {"reply": reply + COST_FOOTER, "timings": timings}
+
+
+# ====== Wersja asynchroniczna, strumieniowa (SSE) ======
+
+class _Stripper:
+    """Przepuszcza tokeny tak, by złożony tekst był równy .strip() całości."""
+
+    def __init__(self):
+        self.started = False
+        self.pending = ""
+
+    def feed(self, text: str) -> str:
+        if not self.started:
+            text = text.lstrip()
+            if not text:
+                return ""
+            self.started = True
+        body = text.rstrip()
+        if not body:
+            self.pending += text
+            return ""
+        out = self.pending + body
+        self.pending = text[len(body):]
+        return out
+
+
+async def _stream_round(messages: List[Dict[str, Any]], with_tools: bool, stripper: _Stripper,
+                        deadline: Deadline) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Jedna runda strumieniowana. Zwraca zdarzenia 'token' oraz na końcu
+    wewnętrzne zdarzenie '_round' z pełną treścią i zebranymi tool_calls.
+    Trafienie w cache to jeden token z całą treścią.
+    """
+    key = _cache_key(messages, with_tools)
+    hit = _completions.get(key)
+    if hit is not None:
+        text = stripper.feed(hit["content"] or "")
+        if text:
+            yield {"event": "token", "data": {"text": text}}
+        yield {"event": "_round", "data": {"content": hit["content"] or "",
+                                           "tool_calls": hit["tool_calls"] or [], "cached": True}}
+        return
+
+    content = []
+    calls: Dict[int, Dict[str, Any]] = {}
+    # slot zajęty od udanego otwarcia do końca strumienia; ponawiamy tylko otwarcie
+    t0 = time.perf_counter()
+    async with upstream.astream(
+        lambda timeout: openai_aclient().chat.completions.create(
+            messages=messages, stream=True, timeout=timeout, **_completion_kwargs(with_tools)),
+        deadline,
+    ) as stream:
+        with metrics.span("completion_stream"):
+            first = True
+            async for chunk in stream:
+                deadline.check()
+                if not chunk.choices:
+                    continue
+                if first:
+                    metrics.observe_span("completion_first_token", time.perf_counter() - t0)
+                    first = False
+                delta = chunk.choices[0].delta
+                if delta.content:
+                    content.append(delta.content)
+                    text = stripper.feed(delta.content)
+                    if text:
+                        yield {"event": "token", "data": {"text": text}}
+                for tc in delta.tool_calls or []:
+                    acc = calls.setdefault(tc.index, {"id": None, "type": "function",
+                                                      "function": {"name": "", "arguments": ""}})
+                    if tc.id:
+                        acc["id"] = tc.id
+                    if tc.function and tc.function.name:
+                        acc["function"]["name"] += tc.function.name
+                    if tc.function and tc.function.arguments:
+                        acc["function"]["arguments"] += tc.function.arguments
+    result = {"content": "".join(content) or None, "tool_calls": [calls[i] for i in sorted(calls)] or None}
+    _completions.set(key, result)
+    yield {"event": "_round", "data": {"content": result["content"] or "",
+                                       "tool_calls": result["tool_calls"] or [], "cached": False}}
+
+
+async def _exec_call_async(call: Dict[str, Any], events: "asyncio.Queue",
+                           session: Optional[ChatSession] = None) -> Dict[str, Any]:
+    name = call["function"]["name"]
+    await events.put({"event": "tool_start", "data": {"name": name,
+                                                     "args": json.loads(call["function"]["arguments"] or "{}")}})
+    t0 = time.perf_counter()
+    # narzędzia (CPU/pliki) w wątku, żeby nie blokować pętli zdarzeń
+    msg = await asyncio.to_thread(_exec_call, call, session)
+    await events.put({"event": "tool_done", "data": {"name": name, "ms": _ms(t0)}})
+    return msg
+
+
+async def run_chat_agent_stream(history: List[ChatTurn],
+                                session: Optional[ChatSession] = None) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Jak run_chat_agent, ale na AsyncOpenAI i ze strumieniowaniem. Zdarzenia:
+    token {text}, tool_start {name, args}, tool_done {name, ms}, done {reply, timings}.
+    Gdy runda z tekstem kończy się wywołaniem narzędzi, przychodzi interim {text} –
+    dotychczasowe tokeny to komentarz przed narzędziami, a nie część odpowiedzi;
+    done.reply (jak w run_chat_agent) to tylko tekst ostatniej rundy.
+    """
+    fast = await asyncio.to_thread(_fast_answer, history, session)
+    if fast is not None:
+        yield {"event": "token", "data": {"text": fast["reply"]}}
+        yield {"event": "token", "data": {"text": COST_FOOTER}}
+        yield {"event": "done", "data": {"reply": fast["reply"] + COST_FOOTER,
+                                         "timings": [{"fast_path": fast["kind"], "ms": fast["ms"]}]}}
+        return
+
+    messages = _base_messages(history, session)
+    deadline = Deadline()
+    stripper = _Stripper()
+    parts: List[str] = []
+    timings = []
+
+    for round_no in range(MAX_TOOL_ROUNDS + 1):
+        t0 = time.perf_counter()
+        result = None
+        async for ev in _stream_round(messages, round_no < MAX_TOOL_ROUNDS, stripper, deadline):
+            if ev["event"] == "_round":
+                result = ev["data"]
+            else:
+                parts.append(ev["data"]["text"])
+                yield ev
+        timing = {"round": round_no + 1, "llm_ms": _ms(t0), "cached": result["cached"]}
+        timings.append(timing)
+        calls = result["tool_calls"]
+        if not calls:
+            break
+        if parts:
+            yield {"event": "interim", "data": {"text": "".join(parts)}}
+        parts, stripper = [], _Stripper()
+
+        # wszystkie narzędzia rundy naraz; postęp przekazujemy przez kolejkę zdarzeń
+        events: "asyncio.Queue" = asyncio.Queue()
+        t1 = time.perf_counter()
+        gathered = asyncio.ensure_future(asyncio.gather(*(_exec_call_async(c, events, session) for c in calls)))
+        while not (gathered.done() and events.empty()):
+            getter = asyncio.ensure_future(events.get())
+            await asyncio.wait({getter, gathered}, return_when=asyncio.FIRST_COMPLETED)
+            if getter.done():
+                yield getter.result()
+            else:
+                getter.cancel()
+        tool_messages = gathered.result()
+        timing.update(tools_ms=_ms(t1), tools=[c["function"]["name"] for c in calls])
+        messages = (
+            messages
+            + [{"role": "assistant", "content": result["content"] or None, "tool_calls": calls}]
+            + tool_messages
         )
-        return {"reply": reply}
-
-    # Zwykła odpowiedź (bez wywołania narzędzi)
-    reply = (msg.content or "").strip()
-    reply += (
-        "\n\n📍 *Koszt przygotowania wyceny:* "
-        "\n– **499 PLN brutto** w strefie pomarańczowej,"
-        "\n– **619 PLN brutto** w strefie czerwonej,"
-        "\n– **929 PLN brutto** w strefie czarnej."
-        "\n\nW przypadku wycen dotyczących **budowy domu** obowiązuje dodatkowa stawka "
-        "**615 PLN brutto**, doliczana do kwoty podstawowej."
-        "\n\nDziękujemy za uwagę i do zobaczenia!"
-    )
-    return {"reply": reply}
+
+    yield {"event": "token", "data": {"text": COST_FOOTER}}
+    yield {"event": "done", "data": {"reply": "".join(parts) + COST_FOOTER, "timings": timings}}
+
+
+# ====== Sesje po stronie serwera (klient wysyła tylko nową wiadomość) ======
+
+def _session_history(session: ChatSession, message: str) -> List[ChatTurn]:
+    return [ChatTurn(**t) for t in session.turns] + [ChatTurn(role="user", content=message)]
+
+
+def _close_turn(session: ChatSession, message: str, reply: str):
+    session.add_turn("user", message)
+    # stopka jest w każdej odpowiedzi – w historii to tylko zbędne tokeny
+    session.add_turn("assistant", reply.removesuffix(COST_FOOTER))
+    session.compact()
+    sessions.save(session)
+
+
+def run_session_chat(session_id: Optional[str], message: str) -> Dict[str, Any]:
+    session = sessions.load(session_id)
+    out = run_chat_agent(_session_history(session, message), session)
+    _close_turn(session, message, out["reply"])
+    return {**out, "session_id": session.id}
+
+
+async def run_session_chat_stream(session_id: Optional[str], message: str) -> AsyncIterator[Dict[str, Any]]:
+    session = await asyncio.to_thread(sessions.load, session_id)
+    yield {"event": "session", "data": {"session_id": session.id}}
+    async for ev in run_chat_agent_stream(_session_history(session, message), session):
+        if ev["event"] == "done":
+            await asyncio.to_thread(_close_turn, session, message, ev["data"]["reply"])
+            ev = {"event": "done", "data": {**ev["data"], "session_id": session.id}}
+        yield ev
@@ -0,0 +1,269 @@
+# app/chat_sessions.py
+"""
+Sesje czatu po stronie serwera.
+
+Klient wysyła tylko nową wiadomość i session_id – tury rozmowy, ustalenia
+(metraż, standard, pozycje KNR) i wyniki narzędzi policzone w tej rozmowie
+trzymamy w SQLite (CHAT_SESSIONS_DB), wspólnym dla wszystkich workerów.
+
+Historia wysyłana do modelu mieści się w budżecie tokenów
+(CHAT_SESSION_TOKEN_BUDGET): najstarsze tury wypadają, a zostaje po nich
+krótki skrót i ustalenia wyciągnięte z wywołań narzędzi. Dzięki temu koszt
+tury długiej rozmowy jest w przybliżeniu stały.
+
+Identyfikatory sesji (uuid4) nadaje tylko serwer: nieznane, wygasłe albo
+niepoprawne id od klienta daje nową sesję z nowym id, więc klient nie wybierze
+sobie id ani nie przejmie cudzej, wygasłej sesji. Znajomość id jest jedynym
+powiązaniem klienta z sesją – dotyczy to także jej usuwania.
+
+Zapis to compare-and-swap po kolumnie version: gdy w tym czasie inna tura
+tej samej sesji zdążyła się zapisać, wczytujemy jej stan, dokładamy nasze
+tury i wyniki narzędzi, i próbujemy ponownie – żadna tura nie ginie.
+Wyniki narzędzi w sesji są kluczowane także wersją danych (katalog KNR,
+reguły cenowe), więc po przeładowaniu danych liczą się od nowa.
+"""
+from __future__ import annotations
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+SESSIONS_DB = os.getenv("CHAT_SESSIONS_DB", str(Path(__file__).resolve().parents[1] / "_data" / "chat_sessions.db"))
+SESSION_TTL = float(os.getenv("CHAT_SESSION_TTL", str(24 * 3600)))
+TOKEN_BUDGET = int(os.getenv("CHAT_SESSION_TOKEN_BUDGET", "3000"))
+MIN_TURNS = int(os.getenv("CHAT_SESSION_MIN_TURNS", "4"))       # ostatnie tury zostają zawsze
+MAX_TOOL_RESULTS = 50
+MAX_KNR_FACTS = 20
+MAX_DIGEST = 8
+DIGEST_CHARS = 160
+SAVE_ATTEMPTS = 10
+
+_SESSION_ID = re.compile(r"^[0-9a-f]{32}$")   # uuid4().hex
+
+
+def estimate_tokens(text: str) -> int:
+    """Przybliżenie bez tokenizera: ~4 znaki na token + narzut wiadomości."""
+    return len(text) // 4 + 4
+
+
+def _tool_key(name: str, args: Dict[str, Any], version: str = "") -> str:
+    return name + "@" + version + ":" + json.dumps(args, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+
+
+class SessionConflict(Exception):
+    """Nie udało się zapisać sesji mimo kolejnych prób scalenia (ciągłe równoległe tury) – 409."""
+
+
+def valid_session_id(session_id: Optional[str]) -> bool:
+    """Czy id ma postać nadawaną przez serwer (nie mówi, czy sesja istnieje)."""
+    return bool(session_id) and _SESSION_ID.match(session_id) is not None
+
+
+class ChatSession:
+    def __init__(self, session_id: str, data: Optional[Dict[str, Any]] = None, version: Optional[int] = None):
+        data = data or {}
+        self.id = session_id
+        self.version = version     # None = sesji nie ma jeszcze w bazie
+        self.turns: List[Dict[str, str]] = data.get("turns", [])
+        self.facts: Dict[str, Any] = data.get("facts", {})
+        self.digest: List[str] = data.get("digest", [])
+        self.tool_results: Dict[str, Any] = data.get("tool_results", {})
+        self._lock = threading.Lock()   # narzędzia jednej rundy działają równolegle
+        # zmiany od wczytania – do scalenia, gdy inna tura zapisze sesję przed nami
+        self._new_turns: List[Dict[str, str]] = []
+        self._new_tools: List[Tuple[str, str, Dict[str, Any], Any]] = []
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"turns": self.turns, "facts": self.facts, "digest": self.digest,
+                "tool_results": self.tool_results}
+
+    # --- narzędzia ---
+    def run_tool(self, name: str, args: Dict[str, Any], run: Callable[[str, Dict[str, Any]], Any],
+                 version: str = "") -> Any:
+        """
+        Wynik narzędzia z pamięci sesji albo run(name, args); przy okazji zbiera ustalenia.
+        version – wersja danych narzędzia (katalog, reguły); inna wersja = liczymy od nowa.
+        """
+        key = _tool_key(name, args, version)
+        with self._lock:
+            if key in self.tool_results:
+                return self.tool_results[key]
+        result = run(name, args)
+        with self._lock:
+            self._new_tools.append((key, name, args, result))
+            self._store_tool(key, name, args, result)
+        return result
+
+    def _store_tool(self, key: str, name: str, args: Dict[str, Any], result: Any):
+        self.tool_results.pop(key, None)
+        self.tool_results[key] = result
+        while len(self.tool_results) > MAX_TOOL_RESULTS:
+            self.tool_results.pop(next(iter(self.tool_results)))
+        self._extract_facts(name, args, result)
+
+    def merge_into(self, other: "ChatSession") -> "ChatSession":
+        """Dokłada do other (świeżo wczytanej sesji) tury i wyniki narzędzi z tej tury."""
+        for key, name, args, result in self._new_tools:
+            other._store_tool(key, name, args, result)
+        for turn in self._new_turns:
+            other.add_turn(turn["role"], turn["content"])
+        other.compact()
+        other._new_turns, other._new_tools = list(self._new_turns), list(self._new_tools)
+        return other
+
+    def _extract_facts(self, name: str, args: Dict[str, Any], result: Any):
+        if name == "estimate_offer":
+            if args.get("area_m2") is not None:
+                self.facts["area_m2"] = args["area_m2"]
+            if args.get("standard"):
+                self.facts["standard"] = args["standard"]
+        elif name == "get_knr_rate" and isinstance(result, list):
+            pozycje = args.get("pozycje") or [{"query": args.get("query"), "ilosc": args.get("ilosc")}]
+            # pozycje -> lista list wyników, query -> jedna lista
+            groups = result if args.get("pozycje") else [result]
+            knr = self.facts.setdefault("knr", {})
+            for p, items in zip(pozycje, groups):
+                if not items or not p.get("query"):
+                    continue
+                best = items[0]
+                knr.pop(p["query"], None)   # najnowsze na końcu
+                knr[p["query"]] = {k: best.get(k) for k in ("kod", "nazwa", "jednostka", "R", "ilosc", "RG_total")}
+            while len(knr) > MAX_KNR_FACTS:
+                knr.pop(next(iter(knr)))
+
+    # --- historia ---
+    def context_message(self) -> Optional[Dict[str, str]]:
+        """Wiadomość systemowa z ustaleniami i skrótem usuniętych tur (albo None)."""
+        lines = []
+        if "area_m2" in self.facts:
+            lines.append(f"- metraż: {self.facts['area_m2']} m2")
+        if "standard" in self.facts:
+            lines.append(f"- standard: {self.facts['standard']}")
+        for query, it in self.facts.get("knr", {}).items():
+            desc = f"- KNR dla '{query}': {it.get('kod') or '-'} {it.get('nazwa')} [{it.get('jednostka') or '-'}], R={it.get('R')}"
+            if it.get("ilosc") is not None:
+                desc += f", ilość={it['ilosc']}, RG={it.get('RG_total')}"
+            lines.append(desc)
+        if self.digest:
+            lines.append("Wcześniej klient pisał m.in.:")
+            lines.extend(f"- {d}" for d in self.digest)
+        if not lines:
+            return None
+        return {"role": "system", "content": "Ustalenia z wcześniejszej części rozmowy:\n" + "\n".join(lines)}
+
+    def add_turn(self, role: str, content: str):
+        self.turns.append({"role": role, "content": content})
+        self._new_turns.append({"role": role, "content": content})
+
+    def compact(self, budget: int = TOKEN_BUDGET):
+        """Usuwa najstarsze tury, aż historia z ustaleniami zmieści się w budżecie."""
+        def total():
+            ctx = self.context_message()
+            return sum(estimate_tokens(t["content"]) for t in self.turns) + (
+                estimate_tokens(ctx["content"]) if ctx else 0)
+
+        while len(self.turns) > MIN_TURNS and total() > budget:
+            old = self.turns.pop(0)
+            if old["role"] == "user":
+                text = " ".join(old["content"].split())
+                self.digest.append(text if len(text) <= DIGEST_CHARS else text[:DIGEST_CHARS - 1] + "…")
+                del self.digest[:-MAX_DIGEST]
+        # historia musi zaczynać się od wiadomości klienta
+        while len(self.turns) > 1 and self.turns[0]["role"] != "user":
+            self.turns.pop(0)
+
+
+class SessionStore:
+    """Sesje w SQLite (WAL); jedno połączenie na wątek i proces."""
+
+    def __init__(self, path: str = SESSIONS_DB, ttl: float = SESSION_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        self._saves = 0
+
+    def _db(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS chat_session "
+                "(id TEXT PRIMARY KEY, data TEXT NOT NULL, updated REAL NOT NULL, version INTEGER NOT NULL DEFAULT 0)"
+            )
+            if "version" not in {r[1] for r in conn.execute("PRAGMA table_info(chat_session)")}:
+                try:   # baza sprzed wersjonowania
+                    conn.execute("ALTER TABLE chat_session ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+                except sqlite3.OperationalError:
+                    pass   # inny worker dodał kolumnę w tym samym momencie
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def load(self, session_id: Optional[str]) -> ChatSession:
+        """
+        Zwraca sesję o danym id. Nieznane, wygasłe albo niepoprawne id daje nową,
+        pustą sesję z nowym id – id wybrane przez klienta nigdy nie trafia do bazy.
+        """
+        if valid_session_id(session_id):
+            row = self._db().execute(
+                "SELECT data, version FROM chat_session WHERE id = ? AND updated > ?",
+                (session_id, time.time() - self.ttl),
+            ).fetchone()
+            if row is not None:
+                return ChatSession(session_id, json.loads(row[0]), row[1])
+        return ChatSession(uuid.uuid4().hex)
+
+    def _write(self, conn: sqlite3.Connection, session: ChatSession) -> bool:
+        """Compare-and-swap: True, gdy nikt nie zapisał sesji od jej wczytania."""
+        data = json.dumps(session.to_dict(), ensure_ascii=False, default=str)
+        now = time.time()
+        if session.version is None:
+            # nowa sesja – wolno nadpisać tylko wygasły wiersz o tym samym id
+            cur = conn.execute(
+                "INSERT INTO chat_session (id, data, updated, version) VALUES (?, ?, ?, 1) "
+                "ON CONFLICT (id) DO UPDATE SET data = excluded.data, updated = excluded.updated, "
+                "version = chat_session.version + 1 WHERE chat_session.updated <= ?",
+                (session.id, data, now, now - self.ttl),
+            )
+        else:
+            cur = conn.execute(
+                "UPDATE chat_session SET data = ?, updated = ?, version = version + 1 WHERE id = ? AND version = ?",
+                (data, now, session.id, session.version),
+            )
+        return cur.rowcount == 1
+
+    def save(self, session: ChatSession):
+        """Zapisuje sesję, scalając ją z równoległymi turami; SessionConflict po SAVE_ATTEMPTS próbach."""
+        conn = self._db()
+        for _ in range(SAVE_ATTEMPTS):
+            if self._write(conn, session):
+                break
+            # w międzyczasie zapisała się inna tura tej sesji – scalamy z jej stanem
+            # (sesja wygasła w trakcie tury: zapisujemy od nowa pod tym samym id)
+            current = self.load(session.id)
+            if current.version is None:
+                current = ChatSession(session.id)
+            session = session.merge_into(current)
+        else:
+            raise SessionConflict(f"Nie udało się zapisać sesji {session.id}.")
+        self._saves += 1
+        if self._saves % 100 == 0:
+            conn.execute("DELETE FROM chat_session WHERE updated <= ?", (time.time() - self.ttl,))
+
+    def delete(self, session_id: str) -> bool:
+        """Usuwa aktywną sesję; False, gdy takiej nie ma (nieznane, wygasłe albo niepoprawne id)."""
+        if not valid_session_id(session_id):
+            return False
+        cur = self._db().execute("DELETE FROM chat_session WHERE id = ? AND updated > ?",
+                                 (session_id, time.time() - self.ttl))
+        return cur.rowcount == 1
+
+
+sessions = SessionStore()
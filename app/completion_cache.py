@@ -0,0 +1,108 @@
+# app/completion_cache.py
+"""
+Cache odpowiedzi modelu (wiadomość asystenta razem z tool_calls).
+
+Klucz to SHA-256 z kanonicznej postaci żądania – buduje go chat_agent
+(prompt systemowy, schemat narzędzi, wersja katalogu KNR, historia), więc
+zmiana którejkolwiek z tych rzeczy sama unieważnia wpisy.
+
+Warstwa 1: TTLCache w pamięci procesu. Warstwa 2 (opcjonalna, CHAT_CACHE_DB):
+plik SQLite współdzielony przez workery.
+"""
+from __future__ import annotations
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from app.cache import TTLCache
+
+CACHE_ENABLED = os.getenv("CHAT_CACHE_ENABLED", "1") == "1"
+CACHE_SIZE = int(os.getenv("CHAT_CACHE_SIZE", "1000"))
+CACHE_TTL = float(os.getenv("CHAT_CACHE_TTL", str(6 * 3600)))
+CACHE_DB = os.getenv("CHAT_CACHE_DB")          # np. _data/chat_cache.db; brak = tylko pamięć
+DB_MAX_ROWS = int(os.getenv("CHAT_CACHE_DB_MAX_ROWS", "50000"))
+
+
+def make_key(payload: Dict[str, Any]) -> str:
+    raw = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class CompletionCache:
+    def __init__(self, maxsize: int = CACHE_SIZE, ttl: float = CACHE_TTL, db_path: Optional[str] = CACHE_DB):
+        self.mem = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.ttl = ttl
+        self.db_path = db_path
+        self._local = threading.local()
+        self._sets = 0
+        self.db_hits = 0
+
+    def _db(self) -> Optional[sqlite3.Connection]:
+        if not self.db_path:
+            return None
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=2.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS completion_cache "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_completion_cache_expires ON completion_cache (expires)")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        if not CACHE_ENABLED:
+            return None
+        value = self.mem.get(key)
+        if value is not None:
+            return value
+        conn = self._db()
+        if conn is None:
+            return None
+        try:
+            row = conn.execute(
+                "SELECT value FROM completion_cache WHERE key = ? AND expires > ?", (key, time.time())
+            ).fetchone()
+        except sqlite3.Error:
+            return None
+        if row is None:
+            return None
+        value = json.loads(row[0])
+        self.db_hits += 1
+        self.mem.set(key, value)
+        return value
+
+    def set(self, key: str, value: Dict[str, Any]):
+        if not CACHE_ENABLED:
+            return
+        self.mem.set(key, value)
+        conn = self._db()
+        if conn is None:
+            return
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO completion_cache (key, value, expires) VALUES (?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), time.time() + self.ttl),
+            )
+            self._sets += 1
+            if self._sets % 100 == 0:
+                self._trim(conn)
+        except sqlite3.Error:
+            pass  # cache nie może psuć odpowiedzi
+
+    def _trim(self, conn: sqlite3.Connection):
+        conn.execute("DELETE FROM completion_cache WHERE expires <= ?", (time.time(),))
+        conn.execute(
+            "DELETE FROM completion_cache WHERE key IN (SELECT key FROM completion_cache "
+            "ORDER BY expires DESC LIMIT -1 OFFSET ?)", (DB_MAX_ROWS,)
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.mem.stats(), "db_hits": self.db_hits, "db": bool(self.db_path)}
@@ -0,0 +1,232 @@
+# app/fast_path.py
+"""
+Szybka ścieżka czatu bez modelu.
+
+Sporo wiadomości to po prostu 'malowanie ścian 120 m2' albo 'blok 55 m2'.
+Parser rozpoznaje takie wiadomości (prace + ilość i jednostka m2/m²/mb/szt
+albo typ budynku z enum narzędzia estimate_offer + metraż), sam wywołuje
+narzędzia i składa odpowiedź z szablonu. Gdy nie jest pewny – zwraca None
+i odpowiada model.
+
+Pozycje KNR szukamy tylko w shardach z jednostką z wiadomości, a gdy słowa
+prac jednoznacznie wskazują katalog (_JOB_CATALOGUES) – także tylko w nim.
+
+Wyłączanie: FAST_PATH_ENABLED=0. Próg trafności KNR: FAST_PATH_MIN_SCORE.
+"""
+from __future__ import annotations
+import os
+import re
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from app.knr_index import unit_key as _norm_unit
+
+FAST_PATH_ENABLED = os.getenv("FAST_PATH_ENABLED", "1") == "1"
+MIN_SCORE = float(os.getenv("FAST_PATH_MIN_SCORE", "85"))
+MAX_MESSAGE_CHARS = 300
+MAX_POSITIONS = 10
+
+_QTY = re.compile(
+    r"(\d+(?:[.,]\d+)?)\s*(m2|m²|m\^2|mkw|mb|m\.b\.|m|szt\.?|sztuk[ia]?)(?!\w)"
+)
+_SEPARATORS = re.compile(r"^(?:[\s,;:+\-–]|oraz\b|i\b|plus\b)+|(?:[\s,;:+\-–]|\boraz|\bi|\bplus)+$")
+# słowa, które nic nie zmieniają w pytaniu o wycenę / KNR
+_FILLER = {
+    "ile", "kosztuje", "koszt", "cena", "wycena", "wycene", "wyceńcie", "prosze", "proszę",
+    "mieszkanie", "mieszkania", "remont", "remontu", "w", "we", "na", "o", "za", "pow",
+    "powierzchni", "powierzchnia", "metraz", "metraż", "ok", "okolo", "około", "standard",
+    "typ", "knr", "dla",
+}
+_MUTE = re.compile(r"[!.]+$")
+# rodzaj prac -> katalog KNR (filtr wyszukiwania); gdy pasuje kilka różnych – bez filtra
+_JOB_CATALOGUES = (
+    (re.compile(r"\b(?:wykop|zasyp|niwel|humus|ziemn)"), "2-01"),
+    (re.compile(r"\b(?:instalac\w* (?:wod|kan|gaz)|wodociąg|kanalizac|rur\w* (?:pcv|pp|pe|stal|miedz))"), "2-15"),
+    (re.compile(r"\b(?:rozebr|rozbiór|rozbior|skuci|skuwan|demontaż|demontaz)"), "4-01"),
+)
+
+
+# końcówki odmiany (przypadki, liczba mnoga) dopisywane do tematu nazwy typu budynku
+_ENDINGS = ("", "a", "ą", "e", "ę", "i", "u", "y", "em", "ie", "om", "ów", "ach", "ami", "iem",
+            "ego", "emu", "ej", "im", "ym", "ich", "ych", "imi", "ymi", "iego", "iemu", "iej")
+_ENDINGS_RE = "(?:" + "|".join(sorted(_ENDINGS, key=len, reverse=True)) + ")"
+
+
+def _stem_pattern(value: str) -> str:
+    # 'kamienica' -> 'kamienic' + końcówka (kamienicy, kamienicę...), 'budowa domu' -> 'budow… dom…';
+    # tylko końcówki odmiany, więc 'dom' nie łapie 'domofon' ani 'domowy', a 'budowa' – 'budowlany'
+    words = [w[:-1] if len(w) > 3 and w[-1] in "aeiouyąę" else w for w in value.split()]
+    return r"\b" + r"\s+".join(re.escape(w) + _ENDINGS_RE + r"(?!\w)" for w in words)
+
+
+def _to_float(s: str) -> float:
+    return float(s.replace(",", "."))
+
+
+def _fmt_money(x: float) -> str:
+    return f"{x:,.2f}".replace(",", " ").replace(".", ",")
+
+
+def _fmt_num(x: Optional[float]) -> str:
+    if x is None:
+        return "-"
+    return f"{x:g}".replace(".", ",")
+
+
+def _job_catalogue(job: str) -> Optional[str]:
+    found = {kat for pattern, kat in _JOB_CATALOGUES if pattern.search(job)}
+    return found.pop() if len(found) == 1 else None
+
+
+class FastPath:
+    """Parser + szablony odpowiedzi + liczniki trafień."""
+
+    def __init__(self, standards: Sequence[str]):
+        # dłuższe nazwy najpierw, żeby 'budowa domu' nie dało 'budowa' ani 'dom'
+        ordered = sorted(standards, key=lambda s: (-len(s.split()), -len(s)))
+        self._standards: List[Tuple[str, re.Pattern]] = [(s, re.compile(_stem_pattern(s))) for s in ordered]
+        self._lock = threading.Lock()
+        self._latency: deque = deque(maxlen=1000)
+        self.attempts = 0
+        self.hits = {"estimate": 0, "knr": 0}
+        self.fallbacks: Dict[str, int] = {}
+
+    # --- parser ---
+    def parse(self, message: str) -> Tuple[Optional[Dict[str, Any]], str]:
+        """Zwraca (intencja, powód). Intencja None = niepewne, odpowie model."""
+        if "?" in message:
+            return None, "question"   # pytania z doprecyzowaniem zostawiamy modelowi
+        text = _MUTE.sub("", " ".join(message.lower().split()))
+        if not text or len(text) > MAX_MESSAGE_CHARS:
+            return None, "length"
+        quantities = list(_QTY.finditer(text))
+        if not quantities:
+            return None, "no_quantity"
+
+        for standard, pattern in self._standards:
+            m = pattern.search(text)
+            if m is None:
+                continue
+            if len(quantities) != 1 or _norm_unit(quantities[0].group(2)) != "m2":
+                return None, "estimate_shape"
+            rest = text[:m.start()] + " " + text[m.end():]
+            q = quantities[0]
+            rest = rest.replace(q.group(0), " ")
+            if any(w not in _FILLER for w in re.findall(r"\w+", rest)):
+                return None, "estimate_extra_words"
+            return {"kind": "estimate", "area_m2": _to_float(q.group(1)), "standard": standard}, ""
+
+        positions = []
+        start = 0
+        for q in quantities:
+            job = _SEPARATORS.sub("", text[start:q.start()])
+            words = [w for w in job.split() if w not in _FILLER]
+            if not any(len(w) >= 3 and w.isalpha() for w in words):
+                return None, "knr_no_job"
+            positions.append({"query": " ".join(words), "ilosc": _to_float(q.group(1)),
+                              "unit": _norm_unit(q.group(2)), "katalog": _job_catalogue(job)})
+            start = q.end()
+        if _SEPARATORS.sub("", text[start:]):
+            return None, "knr_trailing_text"
+        if len(positions) > MAX_POSITIONS:
+            return None, "knr_too_many"
+        return {"kind": "knr", "positions": positions}, ""
+
+    # --- odpowiedzi ---
+    def answer(self, message: str, run_tool: Callable[[str, Dict[str, Any]], Any]) -> Optional[Dict[str, Any]]:
+        """
+        Odpowiedź z szablonu albo None. run_tool(name, args) to wykonawca narzędzi
+        czatu (ten sam, którego używa model).
+        """
+        if not FAST_PATH_ENABLED:
+            return None
+        t0 = time.perf_counter()
+        intent, reason = self.parse(message)
+        reply = None
+        try:
+            if intent is not None and intent["kind"] == "estimate":
+                result = run_tool("estimate_offer", {"area_m2": intent["area_m2"], "standard": intent["standard"]})
+                reply = self._render_estimate(result)
+            elif intent is not None:
+                reply, reason = self._knr_reply(intent["positions"], run_tool)
+        except Exception:
+            reply, reason = None, "tool_error"   # np. brak katalogu – niech odpowie model
+        ms = (time.perf_counter() - t0) * 1000
+        with self._lock:
+            self.attempts += 1
+            if reply is None:
+                self.fallbacks[reason] = self.fallbacks.get(reason, 0) + 1
+            else:
+                self.hits[intent["kind"]] += 1
+                self._latency.append(ms)
+        if reply is None:
+            return None
+        return {"kind": intent["kind"], "reply": reply, "ms": round(ms, 1)}
+
+    def _knr_reply(self, positions: List[Dict[str, Any]], run_tool) -> Tuple[Optional[str], str]:
+        def search(with_catalogue: bool):
+            return run_tool("get_knr_rate", {"pozycje": [
+                {"query": p["query"], "ilosc": p["ilosc"], "jednostka": p["unit"],
+                 **({"katalog": p["katalog"]} if with_catalogue and p["katalog"] else {})}
+                for p in positions]})
+
+        results = search(True)
+        if not isinstance(results, list) and any(p["katalog"] for p in positions):
+            results = search(False)   # katalogu nie ma w arkuszu – szukamy w całym
+        if not isinstance(results, list):
+            return None, "knr_error"
+        for p, items in zip(positions, results):
+            if not items or items[0].get("score", 0) < MIN_SCORE:
+                return None, "knr_low_score"
+            unit = _norm_unit(items[0].get("jednostka"))
+            if unit is not None and unit != p["unit"]:
+                return None, "knr_unit_mismatch"
+        return self._render_knr(positions, results), ""
+
+    @staticmethod
+    def _render_estimate(r: Dict[str, Any]) -> str:
+        return (
+            f"Orientacyjna wycena – {r['typ_prac']}, {_fmt_num(r['powierzchnia_m2'])} m²:\n"
+            f"– robocizna: {_fmt_money(r['robocizna_od'])} – {_fmt_money(r['robocizna_do'])} PLN netto\n"
+            f"– materiały: {_fmt_money(r['materiały_od'])} – {_fmt_money(r['materiały_do'])} PLN netto\n"
+            f"– razem: **{_fmt_money(r['suma_od'])} – {_fmt_money(r['suma_do'])} PLN netto**, "
+            f"VAT {r['stawka_VAT']}\n\n"
+            "To widełki orientacyjne – dokładną kwotę podamy po oględzinach."
+        )
+
+    @staticmethod
+    def _render_knr(positions: List[Dict[str, Any]], results: List[List[dict]]) -> str:
+        lines = []
+        total_rg = 0.0
+        for p, items in zip(positions, results):
+            best = items[0]
+            unit = best.get("jednostka") or p["unit"]
+            line = (f"**{p['query']}** – {_fmt_num(p['ilosc'])} {unit}: "
+                    f"{best.get('kod') or 'KNR'} „{best['nazwa']}”, R = {_fmt_num(best.get('R'))} r-g/{unit}")
+            if best.get("RG_total") is not None:
+                line += f", łącznie **{_fmt_num(best['RG_total'])} r-g**"
+                total_rg += best["RG_total"]
+            others = [it.get("kod") or it["nazwa"] for it in items[1:3]]
+            if others:
+                line += f" (inne dopasowania: {', '.join(others)})"
+            lines.append("– " + line)
+        if len(positions) > 1:
+            lines.append(f"\nŁączny nakład robocizny: **{_fmt_num(round(total_rg, 4))} r-g**.")
+        return "Pozycje KNR dla podanych prac:\n" + "\n".join(lines)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lat = sorted(self._latency)
+            hits = sum(self.hits.values())
+            pct = lambda x: round(lat[min(int(len(lat) * x), len(lat) - 1)], 2) if lat else None
+            return {
+                "enabled": FAST_PATH_ENABLED,
+                "attempts": self.attempts,
+                "hits": dict(self.hits),
+                "hit_rate": round(hits / self.attempts, 4) if self.attempts else None,
+                "fallbacks": dict(self.fallbacks),
+                "p50_ms": pct(0.5),
+                "p99_ms": pct(0.99),
+            }
@@ -1,12 +1,20 @@
 # app/knr.py
 from __future__ import annotations
 import os
+import threading
+import time
 from dataclasses import dataclass, asdict
-from typing import List, Optional
-import pandas as pd
-from rapidfuzz import process, fuzz
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from app.knr_snapshot import StringTable, open_snapshot, snapshot_version
+from app.knr_index import normalize, catalogue_key, unit_key
+from app.cache import TTLCache
+from app import metrics
 
-_KNR_DF: Optional[pd.DataFrame] = None
+if TYPE_CHECKING:   # pandas tylko do kompilacji snapshotu – importowany leniwie
+    import pandas as pd
+
+_KNR: Optional["KNRCatalog"] = None
 
 # DOPASUJ TU NAZWY KOLUMN DO SWOJEGO XLSX:
 # Minimalnie potrzebujemy: 'nazwa', 'jednostka', 'R' (roboczogodziny / jednostkę).
@@ -21,7 +29,27 @@ COLUMN_MAP = {
     "Cena_jedn": "Cena_jedn",    # cena jednostkowa RMS (opcjonalnie)
 }
 
-KNR_PATH = os.getenv("KNR_PATH", "data/knr.xlsx")  # możesz nadpisać w ENV
+# możesz nadpisać w ENV; kilka arkuszy (np. osobne katalogi 2-02, 2-15, 4-01) rozdziel
+# separatorem ścieżek systemu (':' na Linuksie, ';' na Windows) – trafiają do jednego katalogu
+KNR_PATH = os.getenv("KNR_PATH", "data/knr.xlsx")
+# Skompilowany snapshot katalogu (patrz app/knr_snapshot.py)
+KNR_SNAPSHOT_DIR = os.getenv(
+    "KNR_SNAPSHOT_DIR", os.path.join(os.path.dirname(KNR_PATH.split(os.pathsep)[0]) or ".", ".knr_snapshot")
+)
+# Ilu kandydatów z indeksu n-gramów sortujemy dokładnie (WRatio)
+KNR_SHORTLIST = int(os.getenv("KNR_SHORTLIST", "300"))
+# Małe katalogi taniej przeszukać w całości
+KNR_EXHAUSTIVE_MAX = int(os.getenv("KNR_EXHAUSTIVE_MAX", "1000"))
+
+# Co ile sekund sprawdzać, czy plik KNR się zmienił (0 = bez przeładowania w locie)
+KNR_WATCH_INTERVAL = float(os.getenv("KNR_WATCH_INTERVAL", "30"))
+
+# Cache rankingów: (wersja katalogu, znormalizowane zapytanie, top_n[, filtr]) -> ((idx, score), ...).
+# Ilość nie jest częścią klucza – RG_total liczymy po odczycie.
+_RESULT_CACHE = TTLCache(
+    maxsize=int(os.getenv("KNR_CACHE_SIZE", "2048")),
+    ttl=float(os.getenv("KNR_CACHE_TTL", "3600")),
+)
 
 @dataclass
 class KNRItem:
@@ -35,6 +63,8 @@ class KNRItem:
     score: float                # trafność dopasowania 0-100
     RG_total: Optional[float]   # RG po uwzględnieniu ilości (jeśli podano)
     ilosc: Optional[float]
+    wersja_katalogu: Optional[str] = None   # wersja katalogu, z którego pochodzi wynik
+    katalog: Optional[str] = None           # np. "KNR 2-15" (z kodu pozycji albo nazwy pliku)
 
     def to_dict(self):
         d = asdict(self)
@@ -44,13 +74,225 @@ class KNRItem:
                 d[k] = round(float(d[k]), 4)
         return d
 
-def _load_knr() -> pd.DataFrame:
-    global _KNR_DF
-    if _KNR_DF is not None:
-        return _KNR_DF
-    if not os.path.exists(KNR_PATH):
-        raise FileNotFoundError(f"Nie znaleziono pliku KNR pod ścieżką: {KNR_PATH}")
-    df = pd.read_excel(KNR_PATH)
+def code_key(kod: str) -> str:
+    """Klucz kodu pozycji: bez spacji, wielkimi literami, bez przedrostka 'KNR' ('knr 2-15 0101-01' == '2-15 0101-01')."""
+    key = "".join(kod.split()).upper()
+    return key[3:] if key.startswith("KNR") else key
+
+def _as_list(value) -> List[str]:
+    """'2-02, 4-01' albo ['2-02', '4-01'] -> ['2-02', '4-01']."""
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.replace(";", ",").split(",")
+    return [str(v).strip() for v in value if str(v).strip()]
+
+class _Scope:
+    """Wiersze wybranych shardów (rosnąco); maska i nazwy liczone przy pierwszym użyciu."""
+
+    def __init__(self, key: Tuple, rows: np.ndarray):
+        self.key = key
+        self.rows = rows
+        self._mask: Optional[np.ndarray] = None
+        self._choices: Optional[Dict[int, str]] = None
+
+    def __len__(self):
+        return len(self.rows)
+
+    def mask(self, n_rows: int) -> np.ndarray:
+        if self._mask is None:
+            mask = np.zeros(n_rows, dtype=bool)
+            mask[self.rows] = True
+            self._mask = mask
+        return self._mask
+
+    def choices(self, cat: "KNRCatalog") -> Dict[int, str]:
+        """
+        {idx: nazwa_norm} w kolejności rosnących indeksów – dla process.extract / cdist.
+        Pamiętamy tylko małe scope'y (te zawsze przeszukujemy w całości); większe
+        dekodujemy ze snapshotu przy każdym pełnym przeszukaniu.
+        """
+        if self._choices is not None:
+            return self._choices
+        choices = dict(zip(self.rows.tolist(), cat.nazwa_norm.take(self.rows)))
+        if len(self.rows) <= KNR_EXHAUSTIVE_MAX:
+            self._choices = choices
+        return choices
+
+# Ile różnych filtrów (katalog, jednostka) pamiętamy na wersję katalogu
+_MAX_SCOPES = 256
+
+class KNRCatalog:
+    """
+    Znormalizowany katalog w układzie kolumnowym. Kolumny liczbowe to tablice
+    numpy, a nazwy – tablice napisów (StringTable) zmapowane ze snapshotu, więc
+    workery współdzielą ich strony; nazwy dekodujemy tylko dla wierszy, które
+    porównujemy albo zwracamy.
+    Wiersze są podzielone na shardy (katalog, jednostka) – filtr w wyszukiwaniu
+    wybiera shardy, a porównujemy tylko ich wiersze (scope()).
+    """
+
+    def __init__(self, snap):
+        self.version: str = snap.version
+        self.nazwa: StringTable = snap.nazwa
+        self.nazwa_norm: StringTable = snap.nazwa_norm
+        self.index = snap.index
+        self._kod = snap.kod
+        self._jednostki = snap.jednostki
+        self._jednostka_codes = snap.jednostka_codes
+        self._katalogi = snap.katalogi
+        self._katalog_codes = snap.katalog_codes
+        self._shards = [
+            (self._katalogi[kat] if kat >= 0 else None, unit_key(self._jednostki[jed]) if jed >= 0 else None, rows)
+            for kat, jed, rows in snap.shards
+        ]
+        self._scopes: Dict[Tuple, _Scope] = {}
+        self.R = snap.numeric["R"]
+        self.M = snap.numeric.get("M")
+        self.S = snap.numeric.get("S")
+        self.Cena_jedn = snap.numeric.get("Cena_jedn")
+        self._codes: Optional[Dict[str, int]] = None
+        self._names: Optional[Dict[str, int]] = None
+        self._norm_list: Optional[List[str]] = None
+
+    def __len__(self):
+        return len(self.nazwa)
+
+    def names_norm(self) -> List[str]:
+        """
+        Wszystkie nazwy po normalize() jako lista (rapidfuzz, pełne przeszukanie).
+        Pamiętamy ją tylko dla małych katalogów – przeszukiwanych w całości przy
+        każdym zapytaniu; w dużych to rzadki wyjątek (literówki), więc dekodujemy.
+        """
+        if self._norm_list is not None:
+            return self._norm_list
+        names = self.nazwa_norm.tolist()
+        if len(names) <= KNR_EXHAUSTIVE_MAX:
+            self._norm_list = names
+        return names
+
+    def kod(self, idx: int) -> Optional[str]:
+        if self._kod is None:
+            return None
+        return self._kod[idx] or None
+
+    def by_code(self, kod: str) -> Optional[int]:
+        """Indeks pozycji o dokładnie tym kodzie (po code_key) albo None. Słownik powstaje raz na wersję."""
+        codes = self._codes
+        if codes is None:
+            codes = {}
+            if self._kod is not None:
+                for i, k in enumerate(self._kod.tolist()):
+                    if k:
+                        codes.setdefault(code_key(k), i)   # powtórzony kod – pierwsza pozycja
+            self._codes = codes
+        return codes.get(code_key(kod))
+
+    def by_name(self, name: str) -> Optional[int]:
+        """Indeks pozycji o dokładnie tej nazwie (po normalize) albo None."""
+        names = self._names
+        if names is None:
+            names = {}
+            for i, n in enumerate(self.nazwa_norm.tolist()):
+                names.setdefault(n, i)
+            self._names = names
+        return names.get(normalize(name))
+
+    def jednostka(self, idx: int) -> Optional[str]:
+        code = int(self._jednostka_codes[idx])
+        return self._jednostki[code] if code >= 0 else None
+
+    def katalog(self, idx: int) -> Optional[str]:
+        code = int(self._katalog_codes[idx])
+        return self._katalogi[code] if code >= 0 else None
+
+    def catalogues(self) -> List[dict]:
+        """Katalogi i liczba pozycji w każdej jednostce: [{"katalog", "pozycji", "jednostki": {...}}]."""
+        out: Dict[Optional[str], dict] = {}
+        for kat, unit, rows in self._shards:
+            entry = out.setdefault(kat, {"katalog": kat, "pozycji": 0, "jednostki": {}})
+            entry["pozycji"] += len(rows)
+            entry["jednostki"][unit] = entry["jednostki"].get(unit, 0) + len(rows)
+        return sorted(out.values(), key=lambda e: (e["katalog"] is None, e["katalog"] or ""))
+
+    def scope(self, katalog=None, jednostka: Optional[str] = None) -> Optional[_Scope]:
+        """
+        Wiersze shardów pasujących do filtra albo None (bez filtra = cały katalog).
+        katalog – np. '2-15', 'KNR-W 2-02', kilka po przecinku albo lista; samo
+        'KNR 2' obejmuje wszystkie katalogi 'KNR 2-xx'. jednostka – np. 'm2', 'mb', 'szt.'.
+        ValueError, gdy żaden shard nie pasuje.
+        """
+        wanted = []
+        for k in _as_list(katalog):
+            key = catalogue_key(k)
+            if key is None:
+                raise ValueError(f"Niepoprawny katalog KNR: '{k}' (np. '2-15' albo 'KNR 4-01').")
+            wanted.append(key)
+        unit = unit_key(jednostka)
+        if not wanted and unit is None:
+            return None
+        key = (tuple(sorted(set(wanted))), unit)
+        sc = self._scopes.get(key)
+        if sc is not None:
+            return sc
+        parts = [
+            rows for kat, u, rows in self._shards
+            if (not wanted or (kat is not None and any(kat == w or kat.startswith(w + "-") for w in wanted)))
+            and (unit is None or u == unit)
+        ]
+        if not parts:
+            known = [e["katalog"] for e in self.catalogues() if e["katalog"]]
+            known = ", ".join(known[:30]) + (", …" if len(known) > 30 else "") if known else "brak"
+            raise ValueError(f"Brak pozycji KNR dla katalogu {', '.join(wanted) or '(dowolny)'} "
+                             f"i jednostki {unit or '(dowolna)'}. Katalogi: {known}.")
+        sc = _Scope(key, np.sort(np.concatenate(parts)))
+        if len(self._scopes) >= _MAX_SCOPES:
+            self._scopes.clear()
+        self._scopes[key] = sc
+        return sc
+
+    def item(self, idx: int, score: float, ilosc: Optional[float] = None,
+             RG_total: Optional[float] = None) -> KNRItem:
+        return KNRItem(
+            kod=self.kod(idx),
+            nazwa=self.nazwa[idx],
+            jednostka=self.jednostka(idx),
+            R=float(self.R[idx]),
+            M=float(self.M[idx]) if self.M is not None else None,
+            S=float(self.S[idx]) if self.S is not None else None,
+            Cena_jedn=float(self.Cena_jedn[idx]) if self.Cena_jedn is not None else None,
+            score=float(score),
+            RG_total=float(RG_total) if RG_total is not None else None,
+            ilosc=float(ilosc) if ilosc is not None else None,
+            wersja_katalogu=self.version,
+            katalog=self.katalog(idx),
+        )
+
+    def items(self, ranked: List[Tuple[int, float]], ilosc: Optional[float] = None) -> List[dict]:
+        """Buduje wyniki dla [(idx, score)]; RG_total liczone wektorowo."""
+        idx = np.fromiter((i for i, _ in ranked), dtype=np.int64, count=len(ranked))
+        rg = self.R[idx] * float(ilosc) if ilosc is not None else None
+        return [
+            self.item(i, score, ilosc, rg[k] if rg is not None else None).to_dict()
+            for k, (i, score) in enumerate(ranked)
+        ]
+
+
+def knr_paths() -> List[str]:
+    """Pliki katalogu z KNR_PATH (jeden albo kilka rozdzielonych os.pathsep)."""
+    return [p.strip() for p in KNR_PATH.split(os.pathsep) if p.strip()]
+
+def _read_knr_xlsx() -> pd.DataFrame:
+    """Wczytuje arkusze z KNR_PATH i normalizuje kolumny (wolne – używane tylko do kompilacji snapshotu)."""
+    import pandas as pd   # tylko do kompilacji snapshotu – workery z gotowym snapshotem go nie ładują
+
+    frames = [_read_knr_file(path) for path in knr_paths()]
+    return frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+
+def _read_knr_file(path: str) -> pd.DataFrame:
+    import pandas as pd
+
+    df = pd.read_excel(path)
 
     # Normalizacja nazw kolumn -> zgodnie z COLUMN_MAP
     rename_map = {}
@@ -62,7 +304,7 @@ def _load_knr() -> pd.DataFrame:
     # Minimalna walidacja
     for req in ["nazwa", "jednostka", "R"]:
         if req not in df.columns:
-            raise ValueError(f"Brakuje wymaganej kolumny '{req}' w pliku KNR ({KNR_PATH}).")
+            raise ValueError(f"Brakuje wymaganej kolumny '{req}' w pliku KNR ({path}).")
 
     # Ujednolicenia
     df["nazwa"] = df["nazwa"].astype(str)
@@ -71,36 +313,275 @@ def _load_knr() -> pd.DataFrame:
         if col in df.columns:
             df[col] = pd.to_numeric(df[col], errors="coerce")
 
-    _KNR_DF = df
-    return _KNR_DF
+    # Katalog pozycji (shard) z kodu: 'KNR 2-15 0101-01' -> 'KNR 2-15'; bez kodu – z nazwy
+    # pliku ('KNR 4-01.xlsx'), a gdy i ta nic nie mówi – pozycja bez katalogu
+    fallback = catalogue_key(os.path.splitext(os.path.basename(path))[0])
+    if "kod" in df.columns:
+        df["katalog"] = [catalogue_key(str(v)) or fallback if isinstance(v, str) else fallback
+                         for v in df["kod"].tolist()]
+    else:
+        df["katalog"] = fallback
+    return df
+
+
+_LOAD_LOCK = threading.Lock()
+_WATCHER: Optional[threading.Thread] = None
+_WATCHER_PID: Optional[int] = None
 
-def find_knr_items(query: str, top_n: int = 5, ilosc: Optional[float] = None) -> List[dict]:
+def _source_stamp() -> Tuple[Tuple[int, int], ...]:
+    stamps = []
+    for path in knr_paths():
+        st = os.stat(path)
+        stamps.append((st.st_mtime_ns, st.st_size))
+    return tuple(stamps)
+
+@metrics.timed("load_knr")
+def _build_catalog() -> KNRCatalog:
+    return KNRCatalog(open_snapshot(knr_paths(), KNR_SNAPSHOT_DIR, _read_knr_xlsx))
+
+def _load_knr() -> KNRCatalog:
+    """
+    Zwraca aktywny katalog. Odczyt to jedno pobranie referencji (bez blokad) –
+    wywołania w toku kończą na wersji, którą pobrały, nawet gdy watcher
+    w międzyczasie podmieni katalog.
+    """
+    cat = _KNR
+    if cat is not None:
+        if _WATCHER_PID != os.getpid():
+            # katalog wczytany w procesie nadrzędnym przed fork() (rozgrzewka) – watcher startujemy tu
+            with _LOAD_LOCK:
+                _start_watcher()
+        return cat
+    with _LOAD_LOCK:
+        if _KNR is None:
+            missing = [p for p in knr_paths() if not os.path.exists(p)] or ([] if knr_paths() else [KNR_PATH])
+            if missing:
+                raise FileNotFoundError(f"Nie znaleziono pliku KNR pod ścieżką: {', '.join(missing)}")
+            _swap(_build_catalog())
+        _start_watcher()
+        return _KNR
+
+def _swap(cat: KNRCatalog):
+    global _KNR
+    _KNR = cat
+    _RESULT_CACHE.clear()  # wpisy starej wersji i tak nie pasują do klucza
+
+def _start_watcher():
+    # wątki nie przeżywają fork() – każdy worker startuje własny
+    global _WATCHER, _WATCHER_PID
+    if _WATCHER_PID == os.getpid():
+        return
+    _WATCHER_PID = os.getpid()
+    if KNR_WATCH_INTERVAL <= 0:
+        return
+    _WATCHER = threading.Thread(target=_watch, name="knr-watcher", daemon=True)
+    _WATCHER.start()
+
+def _watch():
+    """Wykrywa zmianę plików KNR i buduje nowy katalog poza ścieżką żądań."""
+    try:
+        last = _source_stamp()
+    except OSError:
+        last = None
+    pending = None
+    while True:
+        time.sleep(KNR_WATCH_INTERVAL)
+        try:
+            stamp = _source_stamp()
+        except OSError:
+            continue  # plik w trakcie podmiany – spróbuj przy następnym obrocie
+        if stamp == last:
+            continue
+        if stamp != pending:
+            # plik mógł być jeszcze kopiowany – czekamy, aż przez jeden obrót się nie zmieni
+            pending = stamp
+            continue
+        try:
+            cat = _build_catalog()
+        except Exception:
+            import traceback
+            print("=== BŁĄD PRZEŁADOWANIA KNR (zostaje poprzednia wersja) ===")
+            traceback.print_exc()
+            continue
+        last = stamp
+        if _KNR is None or cat.version != _KNR.version:
+            _swap(cat)
+
+def reload_knr() -> str:
+    """Wymusza ponowne wczytanie katalogu (np. z zadania wdrożeniowego). Zwraca wersję."""
+    cat = _build_catalog()
+    with _LOAD_LOCK:
+        _swap(cat)
+    return cat.version
+
+def catalog_version() -> str:
+    """Wersja aktywnego katalogu (skrót zawartości xlsx)."""
+    return _load_knr().version
+
+def current_version() -> Optional[str]:
+    """
+    Wersja katalogu bez jego wczytywania (klucze cache, np. app/chat_agent.py):
+    aktywnego w tym procesie, a przed pierwszym użyciem – gotowego snapshotu.
+    None, gdy snapshotu dla obecnych plików jeszcze nie ma.
+    """
+    cat = _KNR
+    if cat is not None:
+        return cat.version
+    return snapshot_version(knr_paths(), KNR_SNAPSHOT_DIR)
+
+def catalogues() -> List[dict]:
+    """Katalogi (shardy) aktywnej wersji – do filtra 'katalog' w wyszukiwaniu."""
+    return _load_knr().catalogues()
+
+def cache_stats() -> dict:
+    """Liczniki cache wyszukiwań KNR (trafienia, chybienia, usunięcia)."""
+    return _RESULT_CACHE.stats()
+
+def _candidates(cat: KNRCatalog, q: str, top_n: int, shortlist: Optional[int] = None,
+                scope: Optional[_Scope] = None) -> Optional[np.ndarray]:
+    """
+    Kandydaci z indeksu n-gramów (rosnąco) albo None = cały katalog (albo cały scope).
+    shortlist – własna długość listy (np. kosztorys: tylko najlepsze trafienie
+    dla setek pozycji); wtedy indeks także dla małych katalogów.
+    """
+    limit = shortlist or KNR_SHORTLIST
+    size = len(cat) if scope is None else len(scope)
+    if size <= (limit if shortlist else KNR_EXHAUSTIVE_MAX):
+        return None
+    cand = cat.index.shortlist(q, limit, None if scope is None else scope.mask(len(cat)))
+    # za mało wspólnych n-gramów (literówki, krótkie zapytanie) – pełne przeszukanie
+    return cand if len(cand) >= top_n else None
+
+def _rank(cat: KNRCatalog, query: str, top_n: int, scope: Optional[_Scope] = None) -> List[Tuple[int, float]]:
+    """
+    Dwuetapowe wyszukiwanie: indeks n-gramów wybiera do KNR_SHORTLIST kandydatów,
+    WRatio (na znormalizowanych nazwach) ustala kolejność. Zwraca [(idx, score)].
+    scope – tylko wiersze wybranych shardów (KNRCatalog.scope).
+    """
+    from rapidfuzz import process, fuzz
+
+    q = normalize(query)
+    cand = _candidates(cat, q, top_n, scope=scope)
+    if cand is None:
+        choices = cat.names_norm() if scope is None else scope.choices(cat)
+        matches = process.extract(q, choices, scorer=fuzz.WRatio, limit=top_n)
+    else:
+        # słownik w kolejności rosnących indeksów = ta sama kolejność remisów co na liście
+        choices = dict(zip(cand.tolist(), cat.nazwa_norm.take(cand)))
+        matches = process.extract(q, choices, scorer=fuzz.WRatio, limit=top_n)
+    return [(int(idx), float(score)) for _name, score, idx in matches]
+
+def _top(cols: np.ndarray, scores: np.ndarray, top_n: int) -> List[Tuple[int, float]]:
+    """top_n wg wyniku malejąco, remisy – niższy indeks (jak process.extract)."""
+    if len(scores) > top_n:
+        thr = np.partition(scores, -top_n)[-top_n]
+        keep = scores >= thr
+        cols, scores = cols[keep], scores[keep]
+    order = np.lexsort((cols, -scores))[:top_n]
+    return [(int(cols[k]), float(scores[k])) for k in order]
+
+def _rank_many(cat: KNRCatalog, queries: Sequence[str], top_n: int,
+               shortlist: Optional[int] = None, scope: Optional[_Scope] = None) -> List[List[Tuple[int, float]]]:
+    """
+    To samo co _rank dla wielu zapytań, ale WRatio liczone hurtowo na wszystkich
+    rdzeniach: zapytania bez listy kandydatów – jedną macierzą process.cdist
+    na całym katalogu (albo scope), pozostałe – jednym process.cpdist po parach
+    (zapytanie, kandydat).
+    """
+    from rapidfuzz import process, fuzz
+
+    qs = [normalize(q) for q in queries]
+    cands = [_candidates(cat, q, top_n, shortlist, scope) for q in qs]
+    out: List[List[Tuple[int, float]]] = [[] for _ in qs]
+
+    full = [k for k, c in enumerate(cands) if c is None]
+    if full:
+        if scope is None:
+            cols, names = np.arange(len(cat)), cat.names_norm()
+        else:
+            cols, names = scope.rows, list(scope.choices(cat).values())
+        matrix = process.cdist([qs[k] for k in full], names, scorer=fuzz.WRatio,
+                               dtype=np.float64, workers=-1)
+        for row, k in enumerate(full):
+            out[k] = _top(cols, matrix[row], top_n)
+
+    short = [k for k, c in enumerate(cands) if c is not None]
+    if short:
+        # listy kandydatów mają różne długości – jedna płaska lista par (zapytanie, nazwa)
+        sizes = [len(cands[k]) for k in short]
+        left = [qs[k] for k, n in zip(short, sizes) for _ in range(n)]
+        # listy kandydatów różnych zapytań się pokrywają – każdą nazwę dekodujemy raz
+        rows, inverse = np.unique(np.concatenate([cands[k] for k in short]), return_inverse=True)
+        names = cat.nazwa_norm.take(rows)
+        right = [names[j] for j in inverse.tolist()]
+        flat = process.cpdist(left, right, scorer=fuzz.WRatio, dtype=np.float64, workers=-1)
+        start = 0
+        for k, n in zip(short, sizes):
+            out[k] = _top(cands[k], flat[start:start + n], top_n)
+            start += n
+    return out
+
+def _cache_key(cat: KNRCatalog, query: str, top_n: int, shortlist: Optional[int] = None,
+               scope: Optional[_Scope] = None) -> Tuple:
+    key = (cat.version, normalize(query), top_n)
+    if shortlist:
+        key += (shortlist,)
+    if scope is not None:
+        key += (scope.key,)
+    return key
+
+@metrics.timed("find_knr_items")
+def find_knr_items(query: str, top_n: int = 5, ilosc: Optional[float] = None,
+                   katalog=None, jednostka: Optional[str] = None) -> List[dict]:
     """
     Fuzzy-match po 'nazwa' i zwróć najlepsze trafienia wraz z RG_total (jeśli jest 'ilosc').
+    Wielkość liter i polskie znaki nie mają znaczenia ('malowanie scian' == 'Malowanie ścian').
+    katalog / jednostka – szukaj tylko w tych shardach (np. '2-15', 'm2'); patrz KNRCatalog.scope.
     """
-    df = _load_knr()
-    choices = df["nazwa"].tolist()
-    matches = process.extract(
-        query, choices, scorer=fuzz.WRatio, limit=top_n
-    )
-    results: List[KNRItem] = []
-    for name, score, idx in matches:
-        row = df.iloc[idx]
-        R = row.get("R")
-        RG_total = float(R) * float(ilosc) if (R is not None and ilosc is not None) else None
-
-        item = KNRItem(
-            kod=row.get("kod") if "kod" in df.columns else None,
-            nazwa=row["nazwa"],
-            jednostka=row.get("jednostka"),
-            R=float(R) if R is not None else None,
-            M=float(row.get("M")) if "M" in df.columns else None,
-            S=float(row.get("S")) if "S" in df.columns else None,
-            Cena_jedn=float(row.get("Cena_jedn")) if "Cena_jedn" in df.columns else None,
-            score=float(score),
-            RG_total=RG_total,
-            ilosc=float(ilosc) if ilosc is not None else None,
-        )
-        results.append(item)
+    cat = _load_knr()
+    scope = cat.scope(katalog, jednostka)
+    key = _cache_key(cat, query, top_n, scope=scope)
+    ranked = _RESULT_CACHE.get(key)
+    if ranked is None:
+        ranked = tuple(_rank(cat, query, top_n, scope))
+        _RESULT_CACHE.set(key, ranked)
+    return cat.items(ranked, ilosc)
+
+@metrics.timed("find_knr_items_many")
+def find_knr_items_many(queries: Sequence[str], ilosci: Optional[Sequence[Optional[float]]] = None,
+                        top_n: int = 5, katalogi: Optional[Sequence] = None,
+                        jednostki: Optional[Sequence[Optional[str]]] = None) -> List[List[dict]]:
+    """
+    Wyszukiwanie wielu prac naraz (np. 'malowanie ścian 120 m2, montaż paneli 60 m2').
+    katalogi / jednostki – filtr dla każdego zapytania (jak ilosci).
+    Wynik dla każdego zapytania jest identyczny z find_knr_items(query, top_n, ilosc, katalog, jednostka).
+    """
+    n = len(queries)
+    ilosci, katalogi, jednostki = ([None] * n if v is None else v for v in (ilosci, katalogi, jednostki))
+    if len(ilosci) != n:
+        raise ValueError("Liczba ilości musi odpowiadać liczbie zapytań.")
+    if len(katalogi) != n or len(jednostki) != n:
+        raise ValueError("Liczba filtrów (katalog, jednostka) musi odpowiadać liczbie zapytań.")
+    cat = _load_knr()
+    # zapytania z tym samym filtrem szukamy razem
+    groups: Dict[Optional[Tuple], Tuple[Optional[_Scope], List[int]]] = {}
+    for i, (k, j) in enumerate(zip(katalogi, jednostki)):
+        scope = cat.scope(k, j)
+        groups.setdefault(scope.key if scope else None, (scope, []))[1].append(i)
+    ranked: List = [None] * n
+    for scope, idx in groups.values():
+        for i, r in zip(idx, _ranked_many(cat, [queries[i] for i in idx], top_n, scope=scope)):
+            ranked[i] = r
+    return [cat.items(r, il) for r, il in zip(ranked, ilosci)]
 
-    return [r.to_dict() for r in results]
+def _ranked_many(cat: KNRCatalog, queries: Sequence[str], top_n: int, shortlist: Optional[int] = None,
+                 scope: Optional[_Scope] = None) -> List[Tuple[Tuple[int, float], ...]]:
+    """Rankingi [(idx, score)] dla wielu zapytań: z cache, brakujące – jednym _rank_many."""
+    keys = [_cache_key(cat, q, top_n, shortlist, scope) for q in queries]
+    ranked = [_RESULT_CACHE.get(k) for k in keys]
+    missing = [i for i, r in enumerate(ranked) if r is None]
+    if missing:
+        for i, r in zip(missing, _rank_many(cat, [queries[i] for i in missing], top_n, shortlist, scope)):
+            ranked[i] = tuple(r)
+            _RESULT_CACHE.set(keys[i], ranked[i])
+    return ranked
@@ -0,0 +1,202 @@
+# app/knr_index.py
+"""
+Indeks odwrócony n-gramów dla wyszukiwania KNR (etap 1: lista kandydatów).
+
+Nazwy normalizujemy (casefold + usunięcie polskich znaków + tylko litery/cyfry),
+rozbijamy na tokeny i trigramy znakowe, a dla każdego n-gramu trzymamy listę
+wierszy (CSR: offsets + rows). Zapytanie sumuje wagi IDF wspólnych n-gramów
+i zwraca kilkaset najlepszych kandydatów, które potem sortuje WRatio
+(etap 2, app/knr.py). Koszt zapytania zależy od długości list dla n-gramów
+zapytania, a nie od liczby pozycji w katalogu: przy krótkich listach
+punktujemy tylko wiersze z list, a tablicę długości katalogu bierzemy
+dopiero, gdy list jest co najmniej tyle co wierszy / SPARSE_RATIO.
+
+Indeks budowany jest razem ze snapshotem (app/knr_snapshot.py).
+
+Test trafności względem pełnego przeszukiwania:
+    KNR_PATH=data/knr.xlsx python -m app.knr_index [plik_z_zapytaniami.txt]
+"""
+from __future__ import annotations
+import re
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+_FOLD = str.maketrans("ąćęłńóśźż", "acelnoszz")
+_NON_ALNUM = re.compile(r"[^0-9a-z]+")
+# 'KNR 2-15 0101-01' -> ('KNR', '2-15'), 'KNR-W 2-02 ...' -> ('KNR-W', '2-02'), '4-01' -> (None, '4-01')
+_CATALOGUE = re.compile(r"^(KN[A-Z]*(?:-[A-Z]+)?)?\s*((?:[A-Z]+-)?\d+(?:-\d+)?)")
+_UNITS = {"m2": "m2", "m²": "m2", "m^2": "m2", "mkw": "m2", "m3": "m3", "m³": "m3", "m^3": "m3",
+          "mb": "m", "m.b.": "m", "m": "m",
+          "szt": "szt", "szt.": "szt", "sztuk": "szt", "sztuki": "szt", "sztuka": "szt"}
+
+# n-gramy obecne w więcej niż tej części wierszy nic nie wnoszą, a kosztują najwięcej
+MAX_DF_RATIO = 0.25
+# Gdy list n-gramów zapytania jest mniej niż wierszy / SPARSE_RATIO, punktujemy tylko kandydatów;
+# w przeciwnym razie tablica długości katalogu jest tańsza (i nie dłuższa niż SPARSE_RATIO × listy)
+SPARSE_RATIO = 4
+
+
+def normalize(text: str) -> str:
+    """'Malowanie  ŚCIAN, 2x' -> 'malowanie scian 2x'."""
+    return _NON_ALNUM.sub(" ", text.casefold().translate(_FOLD)).strip()
+
+
+def catalogue_key(text: str) -> Optional[str]:
+    """
+    Katalog z kodu pozycji albo z nazwy katalogu: 'KNR 2-15 0101-01' -> 'KNR 2-15',
+    '2-15' -> 'KNR 2-15', 'knr-w 2-02' -> 'KNR-W 2-02'. None, gdy tekst nie wygląda na kod.
+    """
+    m = _CATALOGUE.match(" ".join(text.upper().split()))
+    if m is None:
+        return None
+    return f"{m.group(1) or 'KNR'} {m.group(2)}"
+
+
+def unit_key(unit: Optional[str]) -> Optional[str]:
+    """'m²' / 'mkw' -> 'm2', 'mb' -> 'm', 'szt.' -> 'szt'; inne jednostki bez zmian (małymi literami)."""
+    if not unit:
+        return None
+    u = unit.strip().lower().replace(" ", "")
+    return _UNITS.get(u, _UNITS.get(u.rstrip("."), u))
+
+
+def grams(norm: str) -> List[str]:
+    """Tokeny (z prefiksem '#') i trigramy znakowe każdego tokenu z dopełnieniem spacją."""
+    out = set()
+    for tok in norm.split():
+        out.add("#" + tok)
+        padded = f" {tok} "
+        for i in range(len(padded) - 2):
+            out.add(padded[i:i + 3])
+    return list(out)
+
+
+class NgramIndex:
+    def __init__(self, keys: List[str], offsets: np.ndarray, rows: np.ndarray, idf: np.ndarray,
+                 row_norm: np.ndarray):
+        self.vocab: Dict[str, int] = {k: i for i, k in enumerate(keys)}
+        self.offsets = offsets
+        self.rows = rows
+        self.idf = idf
+        self.row_norm = row_norm
+        self.n_rows = len(row_norm)
+
+    @staticmethod
+    def build(names_norm: List[str]) -> Dict[str, object]:
+        """Buduje tablice indeksu (do zapisania w snapshocie)."""
+        vocab: Dict[str, int] = {}
+        gram_ids: List[int] = []
+        row_ids: List[int] = []
+        row_norm = np.ones(len(names_norm), dtype=np.float32)
+        for row, name in enumerate(names_norm):
+            gs = grams(name)
+            # WRatio karze długie nazwy przy krótkim zapytaniu – podobnie robi normalizacja cosinusowa
+            row_norm[row] = max(len(gs), 1) ** 0.5
+            for g in gs:
+                gid = vocab.setdefault(g, len(vocab))
+                gram_ids.append(gid)
+                row_ids.append(row)
+        g_arr = np.asarray(gram_ids, dtype=np.int32)
+        r_arr = np.asarray(row_ids, dtype=np.int32)
+        order = np.argsort(g_arr, kind="stable")       # wiersze w listach pozostają rosnąco
+        counts = np.bincount(g_arr, minlength=len(vocab))
+        offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        n = max(len(names_norm), 1)
+        idf = np.log1p(n / np.maximum(counts, 1)).astype(np.float32)
+        return {"keys": list(vocab), "offsets": offsets, "rows": r_arr[order], "idf": idf,
+                "row_norm": row_norm}
+
+    def shortlist(self, query_norm: str, k: int, allowed: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Zwraca do k wierszy z najwyższą sumą IDF wspólnych n-gramów, znormalizowaną
+        długością nazwy (rosnąco po indeksie). allowed – maska wierszy (bool),
+        spoza której kandydatów nie bierzemy (wyszukiwanie w wybranych katalogach).
+        """
+        gids = [self.vocab[g] for g in grams(query_norm) if g in self.vocab]
+        if not gids:
+            return np.empty(0, dtype=np.int64)
+        max_df = max(int(self.n_rows * MAX_DF_RATIO), 1)
+        gids = np.asarray(gids)
+        lengths = self.offsets[gids + 1] - self.offsets[gids]
+        selective = lengths <= max_df
+        if selective.any():
+            gids, lengths = gids[selective], lengths[selective]
+        rows = np.concatenate([self.rows[self.offsets[g]:self.offsets[g + 1]] for g in gids.tolist()])
+        weights = np.repeat(self.idf[gids].astype(np.float64), lengths)
+        if len(rows) * SPARSE_RATIO >= self.n_rows:
+            # list jest co najmniej tyle co wierszy / SPARSE_RATIO – jedna suma po wszystkich
+            # (bincount) do tablicy długości katalogu jest tańsza od sortowania list
+            scores = np.bincount(rows, weights=weights, minlength=self.n_rows).astype(np.float32)
+            scores /= self.row_norm
+            if allowed is not None:
+                scores *= allowed
+            return self._best(None, scores, k)
+        # mało trafień względem katalogu – punktujemy tylko wiersze z list. Listy są rosnące,
+        # więc ich sklejenie to kilka posortowanych serii: sortowanie stabilne (timsort) tylko
+        # je scala, a sumy (reduceat) idą w tej samej kolejności co w bincount
+        order = np.argsort(rows, kind="stable")
+        rows, weights = rows[order], weights[order]
+        starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+        cand = rows[starts].astype(np.int64)
+        scores = np.add.reduceat(weights, starts).astype(np.float32)
+        scores /= self.row_norm[cand]
+        if allowed is not None:
+            keep = allowed[cand]
+            cand, scores = cand[keep], scores[keep]
+        return self._best(cand, scores, k)
+
+    @staticmethod
+    def _best(cand: Optional[np.ndarray], scores: np.ndarray, k: int) -> np.ndarray:
+        """k najlepszych (rosnąco po indeksie); cand None = scores dla wszystkich wierszy."""
+        rows = (lambda sel: np.flatnonzero(sel)) if cand is None else (lambda sel: cand[sel])
+        thr = np.partition(scores, -k)[-k] if len(scores) > k else 0
+        if thr <= 0:
+            return rows(scores > 0)   # trafień nie więcej niż k
+        # remisy na granicy rozstrzygamy niższym indeksem – tak jak pełne przeszukanie
+        strong = rows(scores > thr)
+        ties = rows(scores == thr)[:k - len(strong)]
+        return np.sort(np.concatenate([strong, ties]))
+
+
+def _recall_benchmark(queries: Iterable[str], top_n: int = 5):
+    import random
+    import time
+    from rapidfuzz import process, fuzz
+    from app import knr
+
+    cat = knr._load_knr()
+    names_norm = cat.nazwa_norm.tolist()
+    queries = list(queries)
+    if not queries:
+        rnd = random.Random(0)
+        for name in rnd.sample(cat.nazwa, min(300, len(cat))):
+            words = name.split()
+            if len(words) > 2:
+                words.pop(rnd.randrange(len(words)))
+            queries.append(" ".join(words[:4]).lower())
+    # recall po wynikach: trafienie, gdy na danej pozycji jest ten sam wynik WRatio
+    # (przy remisach pełne przeszukanie wybiera po prostu niższe indeksy)
+    hits = id_hits = total = 0
+    lat = []
+    for q in queries:
+        t = time.perf_counter()
+        fast = knr._rank(cat, q, top_n)
+        lat.append(time.perf_counter() - t)
+        full = [(i, s) for _, s, i in process.extract(knr.normalize(q), names_norm, scorer=fuzz.WRatio, limit=top_n)]
+        hits += sum(a[1] == b[1] for a, b in zip(fast, full))
+        id_hits += len({i for i, _ in fast} & {i for i, _ in full})
+        total += len(full)
+    lat.sort()
+    p = lambda x: lat[min(int(len(lat) * x), len(lat) - 1)] * 1000
+    print(f"pozycji: {len(cat)}  zapytań: {len(queries)}  "
+          f"recall@{top_n}: {hits / max(total, 1):.4f}  (te same pozycje: {id_hits / max(total, 1):.4f})")
+    print(f"p50: {p(0.5):.2f} ms  p99: {p(0.99):.2f} ms")
+
+
+if __name__ == "__main__":
+    import sys
+    src = Path(sys.argv[1]).read_text("utf-8").splitlines() if len(sys.argv) > 1 else []
+    _recall_benchmark([q for q in src if q.strip()])
@@ -0,0 +1,317 @@
+# app/knr_snapshot.py
+"""
+Binarny, kolumnowy zrzut (snapshot) katalogu KNR.
+
+pd.read_excel na dużym arkuszu trwa sekundy, a płaci za to każdy nowy worker.
+Znormalizowany katalog kompilujemy więc raz do katalogu z plikami:
+
+    <KNR_SNAPSHOT_DIR>/<wersja>/
+        meta.json                 – liczba wierszy, kolumny, jednostki
+        R.npy, M.npy, ...         – kolumny liczbowe (float64, mapowane mmap)
+        jednostka.npy             – kody jednostek (int16) -> meta["jednostki"]
+        katalog.npy               – kody katalogów (int16, np. 'KNR 2-15') -> meta["katalogi"]
+        shard_rows.npy + shard_offsets.npy
+                                  – wiersze każdego shardu (katalog, jednostka), rosnąco;
+                                    klucze shardów w meta["shards"]
+        nazwa.bin + nazwa.off.npy – tablica napisów UTF-8 + przesunięcia
+        nazwa_norm.*              – nazwy po normalize() (app/knr_index.py)
+        kod.bin + kod.off.npy
+        ngram_keys.*, ngram_*.npy – indeks odwrócony n-gramów (CSR)
+    <KNR_SNAPSHOT_DIR>/current.json – wersja aktualna dla (mtime, rozmiar) plików xlsx
+
+Katalog może pochodzić z kilku arkuszy – snapshot obejmuje je wszystkie.
+Wersja to skrót SHA-256 zawartości xlsx (przy kilku plikach – skrót ich skrótów).
+Gdy zmieni się tylko mtime, a treść nie, liczymy skrót i wskazujemy istniejący
+snapshot bez kompilacji.
+Strony plików .npy są współdzielone przez wszystkie procesy (page cache).
+"""
+from __future__ import annotations
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from collections.abc import Sequence
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+from app.knr_index import NgramIndex, normalize
+
+try:
+    import fcntl
+except ImportError:  # Windows (dev)
+    fcntl = None
+
+FORMAT_VERSION = 3
+NUMERIC_COLUMNS = ["R", "M", "S", "Cena_jedn"]
+
+
+class StringTable(Sequence):
+    """
+    Napisy UTF-8 sklejone w jeden bufor + tablica przesunięć (n+1). Bufor jest
+    zmapowany (mmap), więc workery dzielą jego strony; napisy dekodujemy
+    dopiero przy odczycie – pojedynczo albo wybranymi wierszami (take()).
+    """
+
+    def __init__(self, blob, offsets: np.ndarray):
+        self._blob = blob
+        self._off = offsets
+
+    def __len__(self):
+        return len(self._off) - 1
+
+    def __getitem__(self, i: int) -> str:
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return self._blob[int(self._off[i]):int(self._off[i + 1])].decode("utf-8")
+
+    def __iter__(self):
+        return iter(self.tolist())
+
+    def take(self, rows) -> List[str]:
+        """Napisy dla podanych wierszy (np. listy kandydatów), w tej samej kolejności."""
+        rows = np.asarray(rows, dtype=np.int64)
+        blob = self._blob
+        return [blob[a:b].decode("utf-8")
+                for a, b in zip(self._off[rows].tolist(), self._off[rows + 1].tolist())]
+
+    def tolist(self) -> List[str]:
+        blob, off = self._blob[:], self._off.tolist()
+        return [blob[off[i]:off[i + 1]].decode("utf-8") for i in range(len(off) - 1)]
+
+    @staticmethod
+    def write(path_base: Path, values: List[str]):
+        encoded = [v.encode("utf-8") for v in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(e) for e in encoded], out=offsets[1:])
+        path_base.with_suffix(".bin").write_bytes(b"".join(encoded))
+        np.save(path_base.with_suffix(".off.npy"), offsets)
+
+    @staticmethod
+    def open(path_base: Path) -> "StringTable":
+        offsets = np.load(path_base.with_suffix(".off.npy"), mmap_mode="r")
+        bin_path = path_base.with_suffix(".bin")
+        if bin_path.stat().st_size == 0:
+            return StringTable(b"", offsets)
+        with open(bin_path, "rb") as f:
+            return StringTable(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ), offsets)
+
+
+class Snapshot:
+    """Kolumny katalogu zmapowane z dysku (tylko do odczytu)."""
+
+    def __init__(self, directory: Path):
+        self.dir = directory
+        self.meta = json.loads((directory / "meta.json").read_text("utf-8"))
+        self.version: str = self.meta["version"]
+        self.rows: int = self.meta["rows"]
+        self.numeric: Dict[str, np.ndarray] = {
+            col: np.load(directory / f"{col}.npy", mmap_mode="r")
+            for col in self.meta["numeric"]
+        }
+        self.jednostki: List[str] = self.meta["jednostki"]
+        self.jednostka_codes: np.ndarray = np.load(directory / "jednostka.npy", mmap_mode="r")
+        self.nazwa = StringTable.open(directory / "nazwa")
+        self.kod: Optional[StringTable] = (
+            StringTable.open(directory / "kod") if self.meta["has_kod"] else None
+        )
+        self.nazwa_norm = StringTable.open(directory / "nazwa_norm")
+        self.katalogi: List[str] = self.meta["katalogi"]
+        self.katalog_codes: np.ndarray = np.load(directory / "katalog.npy", mmap_mode="r")
+        rows = np.load(directory / "shard_rows.npy", mmap_mode="r")
+        offsets = np.load(directory / "shard_offsets.npy").tolist()
+        # [(kod katalogu, kod jednostki, wiersze)]; -1 = brak katalogu / jednostki
+        self.shards: List[Tuple[int, int, np.ndarray]] = [
+            (kat, jed, rows[offsets[i]:offsets[i + 1]]) for i, (kat, jed) in enumerate(self.meta["shards"])
+        ]
+        self.index = NgramIndex(
+            StringTable.open(directory / "ngram_keys").tolist(),
+            np.load(directory / "ngram_offsets.npy"),
+            np.load(directory / "ngram_rows.npy", mmap_mode="r"),
+            np.load(directory / "ngram_idf.npy"),
+            np.load(directory / "ngram_norm.npy", mmap_mode="r"),
+        )
+
+
+def _file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _shards(katalog: np.ndarray, jednostka: np.ndarray, n_units: int):
+    """Grupuje wiersze po (katalog, jednostka): (klucze, wiersze rosnąco w grupach, przesunięcia)."""
+    group = (katalog.astype(np.int64) + 1) * (n_units + 1) + (jednostka.astype(np.int64) + 1)
+    order = np.argsort(group, kind="stable")
+    keys, starts = np.unique(group[order], return_index=True)
+    offsets = np.append(starts, len(group)).astype(np.int64)
+    shard_keys = [[int(g // (n_units + 1)) - 1, int(g % (n_units + 1)) - 1] for g in keys.tolist()]
+    return shard_keys, order.astype(np.int32), offsets
+
+
+def _compile(df, out_dir: Path, version: str, sources: List[str]):
+    """Zapisuje znormalizowany DataFrame jako snapshot w out_dir."""
+    numeric = [c for c in NUMERIC_COLUMNS if c in df.columns]
+    for col in numeric:
+        np.save(out_dir / f"{col}.npy", df[col].to_numpy(dtype=np.float64, na_value=np.nan))
+    codes, uniques = df["jednostka"].factorize()
+    np.save(out_dir / "jednostka.npy", codes.astype(np.int16))
+    # kolumnę 'katalog' (np. 'KNR 2-15') ustala app/knr.py z kodu pozycji albo nazwy pliku
+    if "katalog" in df.columns:
+        kat_codes, kat_uniques = df["katalog"].factorize()
+    else:
+        kat_codes, kat_uniques = np.full(len(df), -1), []
+    np.save(out_dir / "katalog.npy", kat_codes.astype(np.int16))
+    shard_keys, shard_rows, shard_offsets = _shards(kat_codes, codes, len(uniques))
+    np.save(out_dir / "shard_rows.npy", shard_rows)
+    np.save(out_dir / "shard_offsets.npy", shard_offsets)
+    names = df["nazwa"].tolist()
+    StringTable.write(out_dir / "nazwa", names)
+    names_norm = [normalize(n) for n in names]
+    StringTable.write(out_dir / "nazwa_norm", names_norm)
+    index = NgramIndex.build(names_norm)
+    StringTable.write(out_dir / "ngram_keys", index["keys"])
+    np.save(out_dir / "ngram_offsets.npy", index["offsets"])
+    np.save(out_dir / "ngram_rows.npy", index["rows"])
+    np.save(out_dir / "ngram_idf.npy", index["idf"])
+    np.save(out_dir / "ngram_norm.npy", index["row_norm"])
+    has_kod = "kod" in df.columns
+    if has_kod:
+        # pusty napis = brak kodu
+        StringTable.write(out_dir / "kod", ["" if v != v or v is None else str(v) for v in df["kod"].tolist()])
+    meta = {
+        "format": FORMAT_VERSION,
+        "version": version,
+        "sources": sources,
+        "rows": int(len(df)),
+        "numeric": numeric,
+        "jednostki": [str(u) for u in uniques],
+        "katalogi": [str(k) for k in kat_uniques],
+        "shards": shard_keys,
+        "has_kod": has_kod,
+    }
+    (out_dir / "meta.json").write_text(json.dumps(meta, ensure_ascii=False), "utf-8")
+
+
+def _write_atomic(path: Path, text: str):
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(text, "utf-8")
+    os.replace(tmp, path)
+
+
+@contextmanager
+def _flock(path: Path, shared: bool):
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)
+
+
+def _version(sources: List[str]) -> str:
+    if len(sources) == 1:
+        return _file_sha256(sources[0])[:16]
+    return hashlib.sha256("".join(_file_sha256(s) for s in sources).encode()).hexdigest()[:16]
+
+
+def _stamp(sources: List[str]) -> dict:
+    stamp = {"sources": []}
+    for source in sources:
+        st = os.stat(source)
+        stamp["sources"].append([os.path.abspath(source), st.st_mtime_ns, st.st_size])
+    return stamp
+
+
+def _current_version(root: Path, stamp: dict) -> Optional[str]:
+    """Wersja z current.json, jeśli wskazuje snapshot tych samych plików (mtime, rozmiar)."""
+    try:
+        cur = json.loads((root / "current.json").read_text("utf-8"))
+    except (OSError, ValueError):
+        return None
+    if cur.get("format") != FORMAT_VERSION or any(cur.get(k) != v for k, v in stamp.items()):
+        return None
+    return cur["version"]
+
+
+def snapshot_version(sources: Union[str, Sequence[str]], snapshot_dir: str) -> Optional[str]:
+    """
+    Wersja gotowego snapshotu dla sources bez otwierania go (stat plików + current.json);
+    None, gdy snapshot trzeba by dopiero skompilować albo pliku źródłowego brak.
+    """
+    sources = [sources] if isinstance(sources, str) else list(sources)
+    try:
+        return _current_version(Path(snapshot_dir), _stamp(sources))
+    except OSError:
+        return None
+
+
+def open_snapshot(sources: Union[str, Sequence[str]], snapshot_dir: str,
+                  build_df: Callable[[], "object"]) -> Snapshot:
+    """
+    Zwraca snapshot dla pliku (albo kilku plików) sources; w razie potrzeby
+    kompiluje go z build_df(). Kompilację wykonuje tylko jeden proces naraz
+    (flock), pozostałe czekają i mapują gotowy wynik.
+    """
+    sources = [sources] if isinstance(sources, str) else list(sources)
+    root = Path(snapshot_dir)
+    root.mkdir(parents=True, exist_ok=True)
+    stamp = _stamp(sources)
+
+    def usable(d: Path) -> bool:
+        try:
+            return json.loads((d / "meta.json").read_text("utf-8")).get("format") == FORMAT_VERSION
+        except (OSError, ValueError):
+            return False
+
+    def current() -> Optional[Path]:
+        version = _current_version(root, stamp)
+        if version is None:
+            return None
+        d = root / version
+        return d if usable(d) else None
+
+    # otwarcie snapshotu bez blokady kompilacji, ale pod współdzieloną blokadą
+    # sprzątania – budujący nie usunie katalogu w trakcie mapowania plików
+    with _flock(root / ".prune.lock", shared=True):
+        d = current()
+        if d is not None:
+            return Snapshot(d)
+
+    lock_fd = os.open(root / ".lock", os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        if fcntl is not None:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX)
+        d = current()
+        if d is not None:
+            return Snapshot(d)
+        version = _version(sources)
+        d = root / version
+        if not usable(d):
+            tmp = Path(tempfile.mkdtemp(prefix=".build-", dir=root))
+            try:
+                _compile(build_df(), tmp, version, [s for s, _, _ in stamp["sources"]])
+                if d.exists():
+                    shutil.rmtree(d)
+                os.replace(tmp, d)
+            finally:
+                shutil.rmtree(tmp, ignore_errors=True)
+        _write_atomic(root / "current.json", json.dumps({**stamp, "format": FORMAT_VERSION, "version": version}))
+        # Stare wersje można usunąć – procesy, które je już zmapowały, zachowują dostęp do danych,
+        # a te w trakcie otwierania trzymają .prune.lock
+        with _flock(root / ".prune.lock", shared=False):
+            for old in root.iterdir():
+                if old.is_dir() and old.name != version and not old.name.startswith("."):
+                    shutil.rmtree(old, ignore_errors=True)
+        return Snapshot(d)
+    finally:
+        os.close(lock_fd)
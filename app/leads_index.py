@@ -0,0 +1,242 @@
+# app/leads_index.py
+"""
+Indeks analityczny leadów (SQLite, WAL), aktualizowany przyrostowo.
+
+- lead_daily: liczniki per dzień i wymiar – liczba leadów i suma
+  estimate_total dla: wszystkich ('*'), standardu, lokalizacji, klienta,
+- lead_client: indeks po client_id uporządkowany czasem (klucz główny
+  client_id, created_at – tabela WITHOUT ROWID, więc leady klienta leżą obok siebie),
+- lead_source: do którego bajtu każdy segment dziennika jest już w indeksie.
+
+catch_up() dopisuje tylko to, co przybyło w dzienniku od ostatniego razu
+(offset per segment) – wywołuje go wątek zapisu dziennika po każdej paczce
+(LeadsJournal.on_commit). Zmiana liczników i offsetów to jedna transakcja
+BEGIN IMMEDIATE, więc kilka workerów nie policzy tego samego leada dwa razy.
+Raporty czytają tylko wiersze z żądanego zakresu – czas zależy od wielkości
+wyniku, nie od historii.
+
+Odbudowa od zera z surowego dziennika: python -m app.leads_index rebuild
+"""
+from __future__ import annotations
+import json
+import os
+import sqlite3
+import threading
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from app import metrics
+
+DIMENSIONS = ("day", "standard", "location", "client")
+_DIM_KEY = {"day": "*", "standard": "standard", "location": "location", "client": "client"}
+MAX_LIMIT = 10_000
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS lead_source (name TEXT PRIMARY KEY, pos INTEGER NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS lead_daily (dim TEXT NOT NULL, day TEXT NOT NULL, key TEXT NOT NULL, "
+    "cnt INTEGER NOT NULL, total INTEGER NOT NULL, PRIMARY KEY (dim, day, key)) WITHOUT ROWID",
+    "CREATE TABLE IF NOT EXISTS lead_client (client_id TEXT NOT NULL, created_at TEXT NOT NULL, "
+    "src TEXT NOT NULL, pos INTEGER NOT NULL, lead TEXT NOT NULL, "
+    "PRIMARY KEY (client_id, created_at, src, pos)) WITHOUT ROWID",
+)
+_UPSERT_DAILY = (
+    "INSERT INTO lead_daily (dim, day, key, cnt, total) VALUES (?, ?, ?, ?, ?) "
+    "ON CONFLICT (dim, day, key) DO UPDATE SET cnt = cnt + excluded.cnt, total = total + excluded.total"
+)
+
+
+class _Batch:
+    """Leady z jednego przebiegu catch_up, zsumowane przed zapisem do bazy."""
+
+    def __init__(self):
+        self.daily: Dict[Tuple[str, str, str], List[float]] = {}
+        self.clients: List[Tuple[str, str, str, int, str]] = []
+        self.count = 0
+
+    def add(self, lead: Dict[str, Any], src: str, pos: int, raw: Optional[str] = None):
+        created = str(lead.get("created_at") or "")
+        day = created[:10]
+        total = lead.get("estimate_total") or 0
+        client = lead.get("client_id")
+        keys = [("*", ""), ("standard", str(lead.get("standard") or "").strip().lower()),
+                ("location", str(lead.get("location") or "").strip())]
+        if client:
+            keys.append(("client", str(client)))
+        for dim, key in keys:
+            acc = self.daily.get((dim, day, key))
+            if acc is None:
+                self.daily[(dim, day, key)] = [1, total]
+            else:
+                acc[0] += 1
+                acc[1] += total
+        if client:
+            self.clients.append((str(client), created, src, pos,
+                                 raw if raw is not None else json.dumps(lead, ensure_ascii=False)))
+        self.count += 1
+
+    def write(self, conn: sqlite3.Connection):
+        conn.executemany(_UPSERT_DAILY, [(dim, day, key, c, t) for (dim, day, key), (c, t) in self.daily.items()])
+        conn.executemany("INSERT OR IGNORE INTO lead_client VALUES (?, ?, ?, ?, ?)", self.clients)
+
+
+class LeadsIndex:
+    def __init__(self, path: Path, journal):
+        self.path = str(path)
+        self.journal = journal
+        self._local = threading.local()
+
+    def _db(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            for stmt in _SCHEMA:
+                conn.execute(stmt)
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    # --- aktualizacja ---
+    def _sources(self, state: Dict[str, int], everything: bool = False) -> List[Tuple[str, Path]]:
+        """Źródła, w których mogło coś przybyć: nowe segmenty i segmenty z ostatnich dni."""
+        out = []
+        legacy = self.journal.legacy_json
+        if legacy is not None and legacy.exists() and (everything or legacy.name not in state):
+            out.append((legacy.name, legacy))
+        recent = (date.today() - timedelta(days=1)).strftime("%Y%m%d")
+        for path in self.journal.segments() if self.journal.dir.exists() else []:
+            pos = state.get(path.name)
+            # segmenty starszych dni są już zamknięte – wystarczy, że są w indeksie
+            if pos is not None and path.name[6:14] < recent and not everything:
+                continue
+            if pos is None or path.stat().st_size > pos:
+                out.append((path.name, path))
+        return out
+
+    def _read(self, name: str, path: Path, start: int, batch: _Batch) -> int:
+        """Dodaje do paczki leady od bajtu start; zwraca nowy offset."""
+        if path == self.journal.legacy_json:
+            try:
+                records = json.loads(path.read_text("utf-8"))
+            except ValueError:
+                records = []
+            for i, lead in enumerate(records):
+                batch.add(lead, name, i)
+            return 1
+        with open(path, "rb") as f:
+            f.seek(start)
+            data = f.read()
+        end = data.rfind(b"\n") + 1   # ostatnia linia może być w trakcie zapisu
+        pos = start
+        for line in data[:end].splitlines(keepends=True):
+            raw = line.decode("utf-8").rstrip("\n")
+            if raw:
+                batch.add(json.loads(raw), name, pos, raw)
+            pos += len(line)
+        return start + end
+
+    @metrics.timed("leads_catch_up")
+    def catch_up(self) -> int:
+        """Dopisuje do indeksu nowe leady z dziennika. Zwraca ich liczbę."""
+        conn = self._db()
+        state = dict(conn.execute("SELECT name, pos FROM lead_source").fetchall())
+        if not self._sources(state):
+            return 0
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # stan czytany ponownie w transakcji – inny worker mógł właśnie skończyć
+            state = dict(conn.execute("SELECT name, pos FROM lead_source").fetchall())
+            batch = _Batch()
+            for name, path in self._sources(state):
+                pos = self._read(name, path, state.get(name, 0), batch)
+                conn.execute("INSERT OR REPLACE INTO lead_source (name, pos) VALUES (?, ?)", (name, pos))
+            batch.write(conn)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return batch.count
+
+    def rebuild(self) -> int:
+        """Odtwarza indeks od zera z surowego dziennika (jedna transakcja – czytelnicy widzą stary do końca)."""
+        conn = self._db()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for table in ("lead_source", "lead_daily", "lead_client"):
+                conn.execute(f"DELETE FROM {table}")
+            batch = _Batch()
+            for name, path in self._sources({}, everything=True):
+                pos = self._read(name, path, 0, batch)
+                conn.execute("INSERT INTO lead_source (name, pos) VALUES (?, ?)", (name, pos))
+            batch.write(conn)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return batch.count
+
+    # --- zapytania ---
+    @staticmethod
+    def _days(date_from: Optional[date], date_to: Optional[date]) -> Tuple[str, str]:
+        return (date_from.isoformat() if date_from else "", date_to.isoformat() if date_to else "9999-12-31")
+
+    def report(self, by: str = "day", date_from: Optional[date] = None, date_to: Optional[date] = None,
+               limit: int = 100) -> List[Dict[str, Any]]:
+        """Liczba leadów i suma estimate_total: per dzień (by=day) albo per standard/lokalizację/klienta."""
+        if by not in _DIM_KEY:
+            raise ValueError(f"Nieznany wymiar '{by}' (dostępne: {', '.join(DIMENSIONS)}).")
+        lo, hi = self._days(date_from, date_to)
+        limit = max(1, min(int(limit), MAX_LIMIT))
+        if by == "day":
+            rows = self._db().execute(
+                "SELECT day, cnt, total FROM lead_daily WHERE dim = '*' AND day BETWEEN ? AND ? "
+                "ORDER BY day LIMIT ?", (lo, hi, limit)).fetchall()
+        else:
+            rows = self._db().execute(
+                "SELECT key, SUM(cnt) AS c, SUM(total) FROM lead_daily WHERE dim = ? AND day BETWEEN ? AND ? "
+                "GROUP BY key ORDER BY c DESC, key LIMIT ?", (_DIM_KEY[by], lo, hi, limit)).fetchall()
+        return [{"key": k, "count": c, "total": t} for k, c, t in rows]
+
+    def client_leads(self, client_id: str, date_from: Optional[date] = None, date_to: Optional[date] = None,
+                     limit: int = 100) -> List[Dict[str, Any]]:
+        """Leady klienta, od najnowszego; czyta tylko wiersze tego klienta z zakresu."""
+        lo = date_from.isoformat() if date_from else ""
+        hi = (date_to + timedelta(days=1)).isoformat() if date_to else "￿"
+        limit = max(1, min(int(limit), MAX_LIMIT))
+        rows = self._db().execute(
+            "SELECT lead FROM lead_client WHERE client_id = ? AND created_at >= ? AND created_at < ? "
+            "ORDER BY created_at DESC LIMIT ?", (client_id, lo, hi, limit)).fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    def stats(self) -> Dict[str, Any]:
+        conn = self._db()
+        count = lambda sql: conn.execute(sql).fetchone()[0]
+        return {
+            "leads": count("SELECT COALESCE(SUM(cnt), 0) FROM lead_daily WHERE dim = '*'"),
+            "daily_rows": count("SELECT COUNT(*) FROM lead_daily"),
+            "client_rows": count("SELECT COUNT(*) FROM lead_client"),
+            "sources": count("SELECT COUNT(*) FROM lead_source"),
+        }
+
+
+def main(argv: Optional[Iterable[str]] = None):
+    import argparse
+    import time
+
+    ap = argparse.ArgumentParser(description="Indeks analityczny leadów.")
+    ap.add_argument("command", choices=["rebuild", "catch-up", "stats"])
+    args = ap.parse_args(argv)
+
+    from app.storage import leads_index   # te same ścieżki co aplikacja
+    t0 = time.perf_counter()
+    if args.command == "rebuild":
+        print(f"odbudowano: {leads_index.rebuild()} leadów")
+    elif args.command == "catch-up":
+        print(f"dopisano: {leads_index.catch_up()} leadów")
+    print(json.dumps(leads_index.stats(), ensure_ascii=False), f"({time.perf_counter() - t0:.2f} s)")
+
+
+if __name__ == "__main__":
+    main()
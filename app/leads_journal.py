@@ -0,0 +1,222 @@
+# app/leads_journal.py
+"""
+Dziennik leadów: segmentowane pliki JSONL dopisywane na końcu (append-only).
+
+Ścieżka żądania tylko wrzuca rekord do kolejki. Osobny wątek zbiera rekordy
+w paczki (group commit) i zapisuje całą paczkę jednym write() – najpóźniej
+po FLUSH_INTERVAL od pojawienia się pierwszego rekordu. Segmenty rotujemy
+po dniu i po rozmiarze: leads-RRRRMMDD-NNNN.jsonl.
+
+Kilka workerów może dopisywać równocześnie – zapis paczki i wybór segmentu
+odbywają się pod flock na pliku blokady.
+
+Po zapisie paczki wątek zapisu wywołuje funkcje z on_commit() (np. indeks
+analityczny w app/leads_index.py) – poza ścieżką żądania. Nieudany zapis
+(ENOSPC, EIO, ...) nie gubi paczki: wątek ponawia ją z rosnącą przerwą,
+a nowe rekordy czekają za nią w kolejce; hooki idą dopiero po zapisie.
+"""
+from __future__ import annotations
+import atexit
+import json
+import os
+import queue
+import re
+import threading
+import time
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Callable, Iterator, List, Optional
+
+from app import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows (dev)
+    fcntl = None
+
+SEGMENT_MAX_BYTES = int(os.getenv("LEADS_SEGMENT_MAX_BYTES", str(16 * 1024 * 1024)))
+FLUSH_INTERVAL = float(os.getenv("LEADS_FLUSH_INTERVAL", "0.05"))   # sekundy
+MAX_BATCH = int(os.getenv("LEADS_MAX_BATCH", "500"))
+FSYNC = os.getenv("LEADS_FSYNC", "1") == "1"
+RETRY_MIN = float(os.getenv("LEADS_RETRY_MIN", "0.1"))   # sekundy, przerwa po pierwszym nieudanym zapisie
+RETRY_MAX = float(os.getenv("LEADS_RETRY_MAX", "5"))
+
+_SEGMENT_RE = re.compile(r"^leads-(\d{8})-(\d{4})\.jsonl$")
+
+
+class LeadsJournal:
+    def __init__(self, directory: Path, legacy_json: Optional[Path] = None):
+        self.dir = Path(directory)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.legacy_json = legacy_json
+        self._q: "queue.Queue[dict]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._start_lock = threading.Lock()
+        self._idle = threading.Condition()
+        self._pending = 0
+        self._hooks: List[Callable[[], None]] = []
+
+    # --- zapis ---
+    def append(self, record: dict):
+        """Dodaje lead do kolejki zapisu (nie blokuje na I/O)."""
+        self._ensure_writer()
+        with self._idle:
+            self._pending += 1
+        self._q.put(record)
+
+    def on_commit(self, fn: Callable[[], None]):
+        """fn() wywoływane w wątku zapisu po każdej paczce zapisanej na dysk."""
+        self._hooks.append(fn)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Czeka, aż wszystkie zakolejkowane leady trafią na dysk."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._idle:
+            while self._pending:
+                left = None if deadline is None else deadline - time.monotonic()
+                if left is not None and left <= 0:
+                    return False
+                self._idle.wait(left)
+        return True
+
+    def _ensure_writer(self):
+        # Wątek nie przeżywa fork() – każdy proces startuje własny
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                # po fork(): kolejka rodzica zostaje w rodzicu, nie zapisujemy jej drugi raz
+                self._q = queue.Queue()
+                self._idle = threading.Condition()
+                self._pending = 0
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="leads-journal", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._q.get()]
+            deadline = time.monotonic() + FLUSH_INTERVAL
+            while len(batch) < MAX_BATCH:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    break
+                try:
+                    batch.append(self._q.get(timeout=left))
+                except queue.Empty:
+                    break
+            self._write_until_done(batch)
+            for hook in self._hooks:
+                try:
+                    hook()
+                except Exception:
+                    import traceback
+                    print("=== BŁĄD AKTUALIZACJI PO ZAPISIE LEADÓW ===")
+                    traceback.print_exc()
+            with self._idle:
+                self._pending -= len(batch)
+                self._idle.notify_all()
+
+    def _write_until_done(self, batch: List[dict]):
+        """Zapisuje paczkę, ponawiając do skutku – leadów nie wolno zgubić."""
+        delay = RETRY_MIN
+        attempt = 1
+        while True:
+            try:
+                self._write_batch(batch)
+                return
+            except Exception:
+                import traceback
+                print(f"=== BŁĄD ZAPISU LEADÓW (próba {attempt}, {len(batch)} rekordów, ponowienie za {delay:g} s) ===")
+                traceback.print_exc()
+            time.sleep(delay)
+            delay = min(delay * 2, RETRY_MAX)
+            attempt += 1
+
+    @metrics.timed("leads_write")
+    def _write_batch(self, batch: List[dict]):
+        data = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in batch).encode("utf-8")
+        lock_fd = os.open(self.dir / ".lock", os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(lock_fd, fcntl.LOCK_EX)
+            path = self._active_segment(len(data))
+            fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                start = os.fstat(fd).st_size
+                try:
+                    written = 0
+                    while written < len(data):
+                        written += os.write(fd, data[written:])
+                    if FSYNC:
+                        os.fsync(fd)
+                except OSError:
+                    # urwany zapis – obcinamy ogon, żeby ponowienie nie skleiło linii
+                    try:
+                        os.ftruncate(fd, start)
+                    except OSError:
+                        pass
+                    raise
+            finally:
+                os.close(fd)
+        finally:
+            os.close(lock_fd)  # zamknięcie zwalnia flock
+
+    def _active_segment(self, incoming: int) -> Path:
+        day = date.today().strftime("%Y%m%d")
+        last = None
+        for p in self.segments():
+            m = _SEGMENT_RE.match(p.name)
+            if m.group(1) == day:
+                last = p
+        if last is None:
+            return self.dir / f"leads-{day}-0001.jsonl"
+        size = last.stat().st_size
+        if size and size + incoming > SEGMENT_MAX_BYTES:
+            seq = int(_SEGMENT_RE.match(last.name).group(2)) + 1
+            return self.dir / f"leads-{day}-{seq:04d}.jsonl"
+        return last
+
+    # --- odczyt ---
+    def segments(self) -> List[Path]:
+        """Segmenty w kolejności chronologicznej."""
+        return sorted(p for p in self.dir.iterdir() if _SEGMENT_RE.match(p.name))
+
+    def iter_leads(self, first_day: Optional[date] = None, last_day: Optional[date] = None) -> Iterator[dict]:
+        """
+        Strumieniowo zwraca leady: najpierw z dawnego leads.json, potem z segmentów.
+        first_day/last_day pomijają segmenty spoza zakresu (po dacie w nazwie,
+        z zapasem dnia – nazwa ma datę lokalną, created_at jest w UTC); rekordy
+        trzeba i tak odfiltrować po created_at.
+        """
+        if self.legacy_json is not None and self.legacy_json.exists():
+            try:
+                yield from json.loads(self.legacy_json.read_text("utf-8"))
+            except ValueError:
+                pass
+        lo = (first_day - timedelta(days=1)).strftime("%Y%m%d") if first_day else None
+        hi = (last_day + timedelta(days=1)).strftime("%Y%m%d") if last_day else None
+        for path in self.segments():
+            day = _SEGMENT_RE.match(path.name).group(1)
+            if (lo is not None and day < lo) or (hi is not None and day > hi):
+                continue
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    # ostatnia linia może być w trakcie zapisu przez inny proces
+                    if not line.endswith("\n"):
+                        break
+                    yield json.loads(line)
+
+    def close(self, timeout: float = 5.0):
+        if self._thread is not None and self._pid == os.getpid():
+            self.flush(timeout)
+
+
+def open_journal(directory: Path, legacy_json: Optional[Path] = None) -> LeadsJournal:
+    """Tworzy dziennik i rejestruje dopisanie zaległych leadów przy wyjściu procesu."""
+    journal = LeadsJournal(directory, legacy_json)
+    atexit.register(journal.close)
+    return journal
@@ -1,11 +1,49 @@
-from fastapi import FastAPI
+"""
+Jedna aplikacja ASGI OLLBUD: wycena, KNR, czat, limity dzienne, leady i eksport.
+
+Dawne dwie aplikacje (Flask w wsgi_app.py i FastAPI) obsługiwały część
+tych samych ścieżek inaczej; teraz wszystko jest tutaj, pod dotychczasowymi
+ścieżkami. Passenger (WSGI) dostaje tę samą aplikację przez wsgi_app.py.
+
+- Handlery są async. Operacje, które czekają na dysk, blokadę pliku,
+  SQLite albo CPU (limity, indeks leadów, PDF, KNR, czat), idą przez
+  run_in_threadpool. Pętla zdarzeń nie stoi w tym czasie. Synchroniczny
+  czat (/api/chat) czeka na slot OpenAI w wątku, więc ma własny limit
+  wątków (_CHAT_THREADS) i nie zabiera puli pozostałym ścieżkom.
+- Odpowiedzi serializuje orjson (ORJSONResponse). Duże wyniki są zwracane
+  od razu jako ORJSONResponse, bez jsonable_encoder.
+- Ciała żądań waliduje app/schemas.py.
+- Błędy: {"error": ...} jak dawniej we Flasku, a „detail” zostaje dla
+  klientów dawnego FastAPI.
+"""
+import anyio
+import hmac
+import orjson
+import os
+from datetime import datetime
+from functools import partial
+from fastapi import Depends, FastAPI, Header, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import List
-from app.pricing import estimate_offer
-from app.chat_agent import run_chat_agent, ChatTurn
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
+from pydantic import BaseModel, ValidationError
+from starlette.exceptions import HTTPException as StarletteHTTPException
+from typing import List, Optional
+from app.pricing import estimate_offer, estimate_offer_batch
+from app.knr import find_knr_items_many, catalogues as knr_catalogues, cache_stats as knr_cache_stats
+from app.chat_agent import (
+    run_chat_agent, run_chat_agent_stream, run_session_chat, run_session_chat_stream,
+    ChatTurn, cache_stats as chat_cache_stats, fast_path_stats, upstream_stats,
+)
+from app.upstream import UpstreamError, UpstreamBusy, limiter, MAX_INFLIGHT, MAX_QUEUE
+from app.chat_sessions import SessionConflict, sessions
+from app.quota_store import QuotaTableFull
+from app.rules import rules
+from app import audit, metrics, schemas, storage, warmup
+from app.services import export, kosztorys, leads_export
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 
 # --- CORS ---
 app.add_middleware(
@@ -15,6 +53,29 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# czasy żądań i żądania w toku (patrz app/metrics.py)
+app.add_middleware(metrics.ASGIMiddleware, app_name="ollbud")
+
+
+# Przeciążenie / błędy OpenAI -> 429, 503, 504 z Retry-After zamiast wiszącego żądania
+@app.exception_handler(UpstreamError)
+async def _upstream_error(request, exc: UpstreamError):
+    headers = {"Retry-After": str(exc.retry_after)} if exc.retry_after else None
+    return ORJSONResponse(status_code=exc.status, content={"error": str(exc)}, headers=headers)
+
+
+@app.exception_handler(SessionConflict)
+async def _session_conflict(request, exc: SessionConflict):
+    # równoległe tury tej samej sesji nie dały się scalić – klient może wysłać wiadomość ponownie
+    return ORJSONResponse(status_code=409, content={"error": str(exc), "detail": str(exc)})
+
+
+@app.exception_handler(StarletteHTTPException)
+async def _http_error(request, exc: StarletteHTTPException):
+    # "error" – jak dawne endpointy Flaska, "detail" – jak dawne FastAPI
+    return ORJSONResponse(status_code=exc.status_code, content={"error": exc.detail, "detail": exc.detail},
+                          headers=getattr(exc, "headers", None))
+
 
 # --- MODEL DANYCH ---
 class OfferRequest(BaseModel):
@@ -22,16 +83,63 @@ class OfferRequest(BaseModel):
     standard: str
 
 
+class OfferBatchRequest(BaseModel):
+    jobs: List[OfferRequest]
+
+
+# Limit prac w jednym żądaniu wsadowym
+OFFER_BATCH_MAX = 100_000
+
+
+class KNRSearchRequest(BaseModel):
+    queries: List[str]
+    ilosci: Optional[List[Optional[float]]] = None
+    top_n: int = 5
+    katalog: Optional[str] = None     # np. "2-15" albo "2-02, 4-01" – tylko te katalogi
+    jednostka: Optional[str] = None   # np. "m2" – tylko pozycje w tej jednostce
+
+
+def _attachment(content, media_type: str, filename: str) -> Response:
+    return Response(content, media_type=media_type,
+                    headers={"Content-Disposition": f"attachment; filename={filename}"})
+
+
 # --- ENDPOINTY ---
+@app.get("/metrics", include_in_schema=False)
+async def metrics_endpoint():
+    return Response(await run_in_threadpool(metrics.render), media_type=metrics.CONTENT_TYPE)
+
+
 @app.get("/api/ping")
-def ping():
-    return {"ok": True}
+async def ping():
+    return {"ok": True, "ts": datetime.utcnow().isoformat()}
 
 
-@app.post("/api/offer/estimate")
-def offer_estimate(data: OfferRequest):
+# --- LIMITY DZIENNE ---
+@app.post("/api/quota/check")
+async def quota_check(data: schemas.QuotaCheck):
+    try:
+        return await run_in_threadpool(storage.quota_check_impl, data.client_id)
+    except QuotaTableFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+
+@app.post("/api/quota/consume")
+async def quota_consume(data: schemas.QuotaCheck):
+    try:
+        out = await run_in_threadpool(storage.quota_consume_impl, data.client_id)
+    except QuotaTableFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    audit.log("quota_consume", out["client_id"], count=out["count"], max=out["max"])
+    return out
+
+
+# --- WYCENA ---
+def _estimate_area(data: OfferRequest):
     try:
         result = estimate_offer(data.area_m2, data.standard)
+        audit.log("estimate", area_m2=data.area_m2, standard=data.standard,
+                  total_min=result["suma_od"], total_max=result["suma_do"])
         return result
     except Exception as e:
         import traceback
@@ -40,19 +148,330 @@ def offer_estimate(data: OfferRequest):
         return {"error": str(e)}
 
 
+def _estimate_scope(data: schemas.EstimateRequest):
+    est = rules().estimate_scope(data.scope, data.area_m2, data.standard, data.location)
+    # zapis leada do dziennika (tylko kolejka – zapis na dysk w tle)
+    storage.leads.append({
+        "client_id": data.client_id,
+        "created_at": datetime.utcnow().isoformat(),
+        "scope": data.scope,
+        "area_m2": data.area_m2,
+        "standard": data.standard,
+        "location": data.location,
+        "deadline": data.deadline,
+        "estimate_total": est["total"],
+        "rules_version": est["rules_version"],
+    })
+    audit.log("estimate", data.client_id, scope=data.scope, area_m2=data.area_m2, total=est["total"])
+    return est
+
+
+@app.post("/api/offer/estimate")
+async def offer_estimate(request: Request):
+    """
+    Dwa kształty ciała pod jedną ścieżką:
+    - z "scope" (formularz oferty, dawny Flask): schemas.EstimateRequest,
+      wycena zakresu prac + zapis leada,
+    - bez "scope" (dawny FastAPI): {area_m2, standard}, widełki ceny za m².
+    """
+    try:
+        payload = orjson.loads(await request.body())
+    except orjson.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="Nieprawidłowy JSON.")
+    try:
+        if isinstance(payload, dict) and "scope" in payload:
+            return _estimate_scope(schemas.EstimateRequest.model_validate(payload))
+        return _estimate_area(OfferRequest.model_validate(payload))
+    except ValidationError as e:
+        raise RequestValidationError([{**err, "loc": ("body", *err["loc"])} for err in e.errors(include_url=False)])
+
+
+@app.post("/api/offer/estimate/batch")
+async def offer_estimate_batch(data: OfferBatchRequest):
+    """
+    Wycena wielu prac w jednym żądaniu; results[i] jest taki sam jak
+    odpowiedź /api/offer/estimate dla jobs[i].
+    """
+    if len(data.jobs) > OFFER_BATCH_MAX:
+        raise HTTPException(status_code=413, detail=f"Maksymalnie {OFFER_BATCH_MAX} prac w jednym żądaniu.")
+    results = await run_in_threadpool(estimate_offer_batch, [j.area_m2 for j in data.jobs],
+                                      [j.standard for j in data.jobs])
+    audit.log("estimate_batch", jobs=len(results))
+    return ORJSONResponse({"results": results})
+
+
+# --- EKSPORT TXT / PDF ---
+@app.post("/api/offer/export/txt")
+async def offer_export_txt(data: schemas.ExportRequest):
+    content, filename = export.render_offer_txt(data)
+    audit.log("export", data.client_id, format="txt", filename=filename)
+    return _attachment(content, "text/plain; charset=utf-8", filename)
+
+
+@app.post("/api/offer/export/pdf")
+async def offer_export_pdf(data: schemas.ExportRequest):
+    """PDF oferty od razu (z cache albo z puli procesów renderujących)."""
+    try:
+        content, filename = await run_in_threadpool(export.render_offer_pdf, data)
+    except export.PdfUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except export.PdfRenderError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    audit.log("export", data.client_id, format="pdf", filename=filename)
+    return _attachment(content, "application/pdf", filename)
+
+
+@app.post("/api/offer/export/pdf/jobs", status_code=202)
+async def offer_export_pdf_submit(data: schemas.ExportRequest):
+    """Zlecenie PDF w tle; job_id służy do sprawdzania statusu i pobrania."""
+    try:
+        job_id, _ = await run_in_threadpool(export.submit_pdf, data.summary, data.pricing)
+    except export.PdfUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    audit.log("export", data.client_id, format="pdf", job_id=job_id)
+    return export.pdf_status(job_id)
+
+
+@app.get("/api/offer/export/pdf/jobs/{job_id}")
+async def offer_export_pdf_status(job_id: str):
+    if not export.valid_job_id(job_id):
+        raise HTTPException(status_code=404, detail="Nie ma takiego zadania.")
+    status = await run_in_threadpool(export.pdf_status, job_id)
+    if status["status"] == "unknown":
+        raise HTTPException(status_code=404, detail="Nie ma takiego zadania.")
+    return status
+
+
+@app.get("/api/offer/export/pdf/jobs/{job_id}/download")
+async def offer_export_pdf_download(job_id: str):
+    content = await run_in_threadpool(export.cached_pdf, job_id) if export.valid_job_id(job_id) else None
+    if content is None:
+        raise HTTPException(status_code=404, detail="PDF nie jest (jeszcze) gotowy.")
+    return _attachment(content, "application/pdf", export.pdf_filename())
+
+
+# --- LEADY (eksport z dziennika, raporty z indeksu) ---
+# Dane leadów tylko dla administracji: nagłówek X-Admin-Token = LEADS_ADMIN_TOKEN.
+# Bez ustawionego tokenu ścieżki są wyłączone.
+LEADS_ADMIN_TOKEN = os.getenv("LEADS_ADMIN_TOKEN", "")
+
+
+def _require_admin(x_admin_token: Optional[str] = Header(None)):
+    if not LEADS_ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Dostęp do leadów jest wyłączony (brak LEADS_ADMIN_TOKEN).")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token.encode(), LEADS_ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Nieprawidłowy token administratora.")
+
+
+def _lead_filter(request: Request) -> leads_export.LeadFilter:
+    try:
+        return leads_export.LeadFilter.from_args(request.query_params)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def _limit_arg(request: Request, default: int = 100) -> int:
+    raw = request.query_params.get("limit")
+    if not raw:
+        return default
+    try:
+        return int(raw)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Nieprawidłowy limit '{raw}'.")
+
+
+@app.get("/api/leads/export", dependencies=[Depends(_require_admin)])
+async def leads_export_download(request: Request):
+    """CSV/XLSX strumieniowo – generator czytający dziennik chodzi w puli wątków."""
+    fmt = request.query_params.get("format", "csv").lower()
+    flt = _lead_filter(request)
+    try:
+        body = leads_export.export_leads(storage.leads, flt, fmt)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    audit.log("leads_export", flt.client_id, format=fmt, date_from=request.query_params.get("from"),
+              date_to=request.query_params.get("to"), standard=flt.standard)
+    return StreamingResponse(body, media_type=leads_export.MIMETYPES[fmt],
+                             headers={"Content-Disposition": f"attachment; "
+                                                             f"filename={leads_export.export_filename(flt, fmt)}"})
+
+
+@app.get("/api/leads/stats", dependencies=[Depends(_require_admin)])
+async def leads_stats(request: Request):
+    by = request.query_params.get("by", "day").lower()
+    flt, limit = _lead_filter(request), _limit_arg(request)
+
+    def report():
+        storage.leads_index.catch_up()
+        return storage.leads_index.report(by, flt.date_from, flt.date_to, limit)
+    try:
+        rows = await run_in_threadpool(report)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return ORJSONResponse({"by": by, "from": request.query_params.get("from"),
+                           "to": request.query_params.get("to"), "rows": rows})
+
+
+@app.get("/api/leads/clients/{client_id}", dependencies=[Depends(_require_admin)])
+async def leads_client(client_id: str, request: Request):
+    flt, limit = _lead_filter(request), _limit_arg(request)
+
+    def history():
+        storage.leads_index.catch_up()
+        return storage.leads_index.client_leads(client_id, flt.date_from, flt.date_to, limit)
+    items = await run_in_threadpool(history)
+    return ORJSONResponse({"client_id": client_id, "count": len(items), "leads": items})
+
+
+# --- KNR ---
+@app.post("/api/knr/search")
+async def knr_search(data: KNRSearchRequest):
+    """
+    Wyszukiwanie KNR dla wielu prac naraz – wynik dla każdego zapytania
+    jak z pojedynczego get_knr_rate.
+    """
+    if data.ilosci is not None and len(data.ilosci) != len(data.queries):
+        raise HTTPException(status_code=422, detail="Liczba ilości musi odpowiadać liczbie zapytań.")
+    n = len(data.queries)
+    try:
+        results = await run_in_threadpool(find_knr_items_many, data.queries, data.ilosci, top_n=data.top_n,
+                                          katalogi=[data.katalog] * n, jednostki=[data.jednostka] * n)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return ORJSONResponse({"results": results})
+
+
+@app.get("/api/knr/catalogues")
+async def knr_catalogue_list():
+    """Katalogi w arkuszu(-ach) KNR z liczbą pozycji per jednostka – wartości filtra 'katalog'."""
+    try:
+        return ORJSONResponse({"katalogi": await run_in_threadpool(knr_catalogues)})
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+
+@app.post("/api/kosztorys")
+async def kosztorys_price(data: schemas.KosztorysRequest):
+    """
+    Kosztorys z listy pozycji (opis albo kod KNR + ilość): koszt R/M/S każdej
+    pozycji, narzut, VAT i sumy (patrz app/services/kosztorys.py).
+    """
+    if len(data.pozycje) > kosztorys.KOSZTORYS_MAX_ROWS:
+        raise HTTPException(status_code=413,
+                            detail=f"Maksymalnie {kosztorys.KOSZTORYS_MAX_ROWS} pozycji w jednym kosztorysie.")
+    try:
+        out = await run_in_threadpool(kosztorys.price_bill, [(p.pozycja, p.ilosc) for p in data.pozycje],
+                                      data.standard, data.area_m2, data.stawka_rg)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    audit.log("kosztorys", rows=len(data.pozycje), unresolved=len(out["nierozpoznane"]),
+              netto=out["sumy"]["netto"])
+    return ORJSONResponse(out)
+
+
+@app.get("/api/knr/stats")
+async def knr_stats():
+    return {"cache": knr_cache_stats()}
+
+
 # --- AGENT GPT /api/chat ---
 class ChatPayload(BaseModel):
-    history: List[ChatTurn]
+    # Tryb sesji: tylko nowa wiadomość (+ session_id z poprzedniej odpowiedzi; id spoza
+    # serwera albo wygasłe zaczyna nową sesję – nowe id wraca w odpowiedzi).
+    # Tryb zgodności: cała historia w każdym żądaniu.
+    history: List[ChatTurn] = []
+    message: Optional[str] = None
+    session_id: Optional[str] = None
+
+# Wątki czatu synchronicznego (czekanie na slot OpenAI + rundy modelu) – osobno od
+# domyślnej puli anyio, z której korzystają wszystkie pozostałe handlery
+_CHAT_THREADS = anyio.CapacityLimiter(MAX_INFLIGHT + MAX_QUEUE)
+
 
 @app.post("/api/chat", tags=["chat"])
-def api_chat(payload: ChatPayload):
+async def api_chat(payload: ChatPayload):
     """
     Odpowiada agent GPT. Gdy ma komplet danych, sam wywoła estimate_offer.
     """
-    out = run_chat_agent(payload.history)
-    return out
+    if limiter.full():
+        raise UpstreamBusy("Serwer jest przeciążony, spróbuj ponownie za chwilę.", limiter.retry_after())
+    if payload.message is not None:
+        call = partial(run_session_chat, payload.session_id, payload.message)
+    else:
+        call = partial(run_chat_agent, payload.history)
+    return await anyio.to_thread.run_sync(call, limiter=_CHAT_THREADS)
+
+
+def _sse(event: str, data) -> bytes:
+    return b"event: " + event.encode() + b"\ndata: " + orjson.dumps(data) + b"\n\n"
+
+
+@app.post("/api/chat/stream", tags=["chat"])
+async def api_chat_stream(payload: ChatPayload):
+    """
+    Jak /api/chat, ale odpowiedź płynie jako server-sent events:
+    session (id sesji), token (fragment odpowiedzi), tool_start / tool_done
+    (postęp narzędzi), interim (tokeny do tej pory to komentarz przed
+    narzędziami, nie odpowiedź), done (pełna odpowiedź) albo error.
+    """
+    if limiter.full():
+        # odmawiamy przed otwarciem strumienia, póki można jeszcze zwrócić 503
+        raise UpstreamBusy("Serwer jest przeciążony, spróbuj ponownie za chwilę.", limiter.retry_after())
+
+    async def events():
+        try:
+            if payload.message is not None:
+                stream = run_session_chat_stream(payload.session_id, payload.message)
+            else:
+                stream = run_chat_agent_stream(payload.history)
+            async for ev in stream:
+                yield _sse(ev["event"], ev["data"])
+        except UpstreamError as e:
+            yield _sse("error", {"error": str(e), "status": e.status, "retry_after": e.retry_after})
+        except SessionConflict as e:
+            yield _sse("error", {"error": str(e), "status": 409})
+        except Exception as e:
+            import traceback
+            print("=== BŁĄD W CHAT STREAM ===")
+            traceback.print_exc()
+            yield _sse("error", {"error": str(e)})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.delete("/api/chat/session/{session_id}", tags=["chat"])
+async def api_chat_session_delete(session_id: str):
+    """
+    Usuwa sesję – jak tury czatu, wymaga id nadanego przez serwer (uuid4 z odpowiedzi
+    /api/chat), którego nie da się zgadnąć. Nieznane albo wygasłe id – 404.
+    """
+    if not await run_in_threadpool(sessions.delete, session_id):
+        raise HTTPException(status_code=404, detail="Nie znaleziono sesji.")
+    return {"ok": True}
+
+
+@app.on_event("startup")
+def _warm_up():
+    # KNR, szablony, klienci OpenAI, pula PDF – przed pierwszym żądaniem (WARMUP, patrz app/warmup.py)
+    warmup.warm_up()
+
+
+@app.on_event("shutdown")
+def _flush_audit():
+    storage.leads.close()
+    audit.shutdown()
+    export.shutdown()
+
+
+@app.get("/api/chat/stats", tags=["chat"])
+async def chat_stats():
+    return {"completion_cache": chat_cache_stats(), "fast_path": fast_path_stats(), "upstream": upstream_stats()}
 
 
 @app.get("/")
-def root():
+async def root():
     return {"status": "OK", "service": "OLLBUD backend"}
@@ -0,0 +1,336 @@
+# app/metrics.py
+"""
+Metryki w formacie Prometheus (tekstowym).
+
+- ollbud_http_request_duration_seconds – histogram czasu żądań
+  (app, method, route = szablon trasy, status),
+- ollbud_http_requests_in_flight – żądania w toku (app),
+- ollbud_span_duration_seconds – histogram wewnętrznych etapów (span, outcome):
+  load_knr (budowa katalogu), find_knr_items(_many), quota_get/quota_consume,
+  leads_write, leads_catch_up, completion(_stream, _first_token), kosztorys,
+  pdf_export, pdf_render.
+
+Każdy proces liczy u siebie (bez blokad międzyprocesowych na ścieżce żądania)
+i co METRICS_FLUSH_INTERVAL zapisuje migawkę do METRICS_DIR/metrics-<pid>.json.
+/metrics scala migawki wszystkich workerów Passengera. Histogramy procesów,
+które już nie żyją, trafiają do archiwum (liczniki nie cofają się po restarcie
+workera), ich „w toku” – nie.
+
+Wyłączanie: METRICS_ENABLED=0.
+"""
+from __future__ import annotations
+import atexit
+import functools
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows (dev)
+    fcntl = None
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+METRICS_DIR = Path(os.getenv("METRICS_DIR", Path(__file__).resolve().parents[1] / "_data" / "metrics"))
+FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "2"))   # sekundy
+BUCKETS: Tuple[float, ...] = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                              1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+HTTP_DURATION = "ollbud_http_request_duration_seconds"
+HTTP_IN_FLIGHT = "ollbud_http_requests_in_flight"
+SPAN_DURATION = "ollbud_span_duration_seconds"
+_HELP = {
+    HTTP_DURATION: ("histogram", "Czas obsługi żądania HTTP."),
+    HTTP_IN_FLIGHT: ("gauge", "Żądania HTTP w toku."),
+    SPAN_DURATION: ("histogram", "Czas wewnętrznych etapów obsługi żądania."),
+}
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_ARCHIVE = "archive.json"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _series(name: str, labels: Dict[str, str]) -> str:
+    """Klucz serii = nazwa + etykiety w postaci Prometheus (posortowane)."""
+    inner = ",".join(f'{k}="{_escape(str(v))}"' for k, v in sorted(labels.items()))
+    return f"{name}{{{inner}}}"
+
+
+class Registry:
+    """Histogramy i gauge jednego procesu; po fork() dziecko zaczyna od zera."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self.histograms: Dict[str, List[float]] = {}   # kubełki..., +Inf, suma
+        self.gauges: Dict[str, float] = {}
+        self._dirty = False
+        self._thread: Optional[threading.Thread] = None
+
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self.histograms, self.gauges = {}, {}
+            self._lock = threading.Lock()
+            self._thread = None
+
+    def observe(self, name: str, labels: Dict[str, str], seconds: float):
+        self._check_pid()
+        key = _series(name, labels)
+        with self._lock:
+            h = self.histograms.get(key)
+            if h is None:
+                h = self.histograms[key] = [0.0] * (len(BUCKETS) + 2)
+            h[bisect_left(BUCKETS, seconds)] += 1
+            h[-1] += seconds
+            self._dirty = True
+        self._ensure_writer()
+
+    def add(self, name: str, labels: Dict[str, str], delta: float):
+        self._check_pid()
+        key = _series(name, labels)
+        with self._lock:
+            self.gauges[key] = self.gauges.get(key, 0.0) + delta
+            self._dirty = True
+        self._ensure_writer()
+
+    # --- migawki na dysku ---
+    def _ensure_writer(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="metrics-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        me = os.getpid()
+        while os.getpid() == me:
+            time.sleep(FLUSH_INTERVAL)
+            if self._dirty:
+                self.flush()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            self._dirty = False
+            return {"pid": os.getpid(), "buckets": list(BUCKETS),
+                    "histograms": {k: list(v) for k, v in self.histograms.items()},
+                    "gauges": dict(self.gauges)}
+
+    def flush(self):
+        if self._pid != os.getpid():
+            return
+        try:
+            METRICS_DIR.mkdir(parents=True, exist_ok=True)
+            path = METRICS_DIR / f"metrics-{os.getpid()}.json"
+            tmp = path.with_name(f".{path.name}.tmp")
+            tmp.write_text(json.dumps(self.snapshot(), separators=(",", ":")), "utf-8")
+            os.replace(tmp, path)
+        except OSError:
+            pass  # metryki nigdy nie psują obsługi żądań
+
+
+registry = Registry()
+atexit.register(registry.flush)
+
+
+# ====== API dla kodu aplikacji ======
+
+def observe_span(span: str, seconds: float, outcome: str = "ok"):
+    if METRICS_ENABLED:
+        registry.observe(SPAN_DURATION, {"span": span, "outcome": outcome}, seconds)
+
+
+@contextmanager
+def span(name: str):
+    """with metrics.span("load_knr"): ... – czas etapu; wyjątek liczony jako outcome="error"."""
+    if not METRICS_ENABLED:
+        yield
+        return
+    t0 = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        observe_span(name, time.perf_counter() - t0, outcome)
+
+
+def timed(name: str) -> Callable:
+    """Dekorator: cała funkcja jako span `name`."""
+    def wrap(fn):
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return inner
+    return wrap
+
+
+def _request_started(app: str):
+    registry.add(HTTP_IN_FLIGHT, {"app": app}, 1)
+
+
+def _request_finished(app: str, method: str, route: str, status: int, seconds: float):
+    registry.add(HTTP_IN_FLIGHT, {"app": app}, -1)
+    registry.observe(HTTP_DURATION, {"app": app, "method": method, "route": route, "status": str(status)},
+                     seconds)
+
+
+# ====== Middleware ======
+
+UNMATCHED = "<unmatched>"
+
+
+class ASGIMiddleware:
+    """
+    app.add_middleware(ASGIMiddleware, app_name="ollbud") – obejmuje też
+    żądania z Passengera (wsgi_app.py przekazuje je do tej samej aplikacji).
+    Czysty ASGI (nie BaseHTTPMiddleware), żeby nie buforować strumieni SSE.
+    Szablon trasy bierzemy z endpointu, który router wpisuje do scope.
+    """
+
+    def __init__(self, app, app_name: str = "ollbud"):
+        self.app = app
+        self.app_name = app_name
+        self._routes: Optional[Dict[Any, str]] = None
+
+    def _route(self, scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return UNMATCHED
+        if self._routes is None or endpoint not in self._routes:
+            router = scope.get("router") or getattr(scope.get("app"), "router", None)
+            self._routes = {getattr(r, "endpoint", None): getattr(r, "path", UNMATCHED)
+                            for r in getattr(router, "routes", [])}
+        return self._routes.get(endpoint, UNMATCHED)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        t0 = time.perf_counter()
+        status = [500]
+
+        async def _send(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        _request_started(self.app_name)
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            _request_finished(self.app_name, scope.get("method", ""), self._route(scope), status[0],
+                              time.perf_counter() - t0)
+
+
+# ====== Scalanie i eksport ======
+
+def _merge_into(acc: Dict[str, Any], snap: Dict[str, Any], with_gauges: bool):
+    if snap.get("buckets") != list(BUCKETS):
+        return  # migawka ze starszej konfiguracji kubełków – pomijamy
+    for key, h in snap.get("histograms", {}).items():
+        cur = acc["histograms"].get(key)
+        if cur is None:
+            acc["histograms"][key] = list(h)
+        else:
+            for i, v in enumerate(h):
+                cur[i] += v
+    if with_gauges:
+        for key, v in snap.get("gauges", {}).items():
+            acc["gauges"][key] = acc["gauges"].get(key, 0.0) + v
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _read(path: Path) -> Optional[Dict[str, Any]]:
+    try:
+        return json.loads(path.read_text("utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+def collect() -> Dict[str, Any]:
+    """Scala migawki wszystkich procesów; migawki martwych procesów przenosi do archiwum."""
+    registry.flush()
+    empty = lambda: {"pid": 0, "buckets": list(BUCKETS), "histograms": {}, "gauges": {}}
+    acc = {"histograms": {}, "gauges": {}}
+    if not METRICS_DIR.exists():
+        return acc
+    lock_fd = os.open(METRICS_DIR / ".lock", os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        if fcntl is not None:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX)
+        archive = _read(METRICS_DIR / _ARCHIVE) or empty()
+        dead = []
+        for path in METRICS_DIR.glob("metrics-*.json"):
+            snap = _read(path)
+            if snap is None:
+                continue
+            if _alive(int(snap.get("pid", 0))):
+                _merge_into(acc, snap, with_gauges=True)
+            else:
+                _merge_into(archive, snap, with_gauges=False)
+                dead.append(path)
+        if dead:
+            tmp = METRICS_DIR / f".{_ARCHIVE}.tmp"
+            tmp.write_text(json.dumps(archive, separators=(",", ":")), "utf-8")
+            os.replace(tmp, METRICS_DIR / _ARCHIVE)
+            for path in dead:
+                path.unlink(missing_ok=True)
+        _merge_into(acc, archive, with_gauges=False)
+    finally:
+        os.close(lock_fd)
+    return acc
+
+
+def _value(v: float) -> str:
+    """Liczby całkowite bez wykładnika (1234567, nie 1.23457e+06), reszta z pełną precyzją."""
+    v = float(v)
+    return str(int(v)) if v.is_integer() else repr(v)
+
+
+def render(data: Optional[Dict[str, Any]] = None) -> str:
+    """Tekst w formacie ekspozycji Prometheus 0.0.4."""
+    data = data if data is not None else collect()
+    families: Dict[str, List[str]] = {}
+    for key in sorted(data["histograms"]):
+        h = data["histograms"][key]
+        name, labels = key.split("{", 1)
+        labels = labels[:-1]
+        sep = "," if labels else ""
+        lines = families.setdefault(name, [])
+        cumulative = 0.0
+        for bound, count in zip(BUCKETS + (float("inf"),), h):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append(f'{name}_bucket{{{labels}{sep}le="{le}"}} {_value(cumulative)}')
+        lines.append(f"{name}_sum{{{labels}}} {_value(h[-1])}")
+        lines.append(f"{name}_count{{{labels}}} {_value(cumulative)}")
+    for key in sorted(data["gauges"]):
+        name = key.split("{", 1)[0]
+        families.setdefault(name, []).append(f"{key} {_value(data['gauges'][key])}")
+    out = []
+    for name, lines in families.items():
+        kind, help_text = _HELP.get(name, ("untyped", name))
+        out.append(f"# HELP {name} {help_text}")
+        out.append(f"# TYPE {name} {kind}")
+        out.extend(lines)
+    return "\n".join(out) + "\n"
@@ -1,56 +1,53 @@
+from typing import Dict, Sequence
+
+import numpy as np
+
+from app.rules import RuleSet, rules
+
+# Stawki, narzuty i progi VAT są w pliku reguł (app/pricing_rules.json, patrz app/rules.py)
+
+
 def estimate_offer(area_m2: float, standard: str):
     """
     Szacuje koszt robót dla danego metrażu i standardu.
-    Zasady:
+    Zasady (wartości z pliku reguł):
     - robocizna bazowa zależna od typu (blok, kamienica, deweloperski, budowa domu)
     - narzut 42.5%
     - VAT 8% dla mieszkań ≤150 m² i domów ≤300 m², inaczej 23%
     """
+    rs = rules()
     std = standard.lower()
     # --- stawki bazowe (robocizna netto, bez narzutów) ---
-    if "budowa" in std or "dom" in std:
-        base_rate = 1900  # z materiałami, stan surowy otwarty z dachem
-        type_name = "budowa domu"
-    elif "kamienica" in std:
-        base_rate = 1200
-        type_name = "kamienica"
-    elif "deweloperski" in std:
-        base_rate = 900
-        type_name = "deweloperski"
-    else:
-        base_rate = 1000
-        type_name = "blok"
+    typ = rs.types[rs.type_code(std)]
+    base_rate = typ["base_rate"]
 
     # --- robocizna ---
     labor_min = area_m2 * base_rate
-    labor_max = labor_min * 1.30  # +30% w górę
+    labor_max = labor_min * rs.labor_max_mul  # +30% w górę
 
     # --- narzut 42.5% ---
-    labor_min *= 1.425
-    labor_max *= 1.425
+    labor_min *= rs.overhead
+    labor_max *= rs.overhead
 
     # --- materiały ---
-    if "budowa" in std or "dom" in std:
+    if typ["includes_materials"]:
         # budowa: stawka już zawiera materiały
         materials_min = 0
         materials_max = 0
     else:
-        materials_min = labor_min * 0.6 * 1.425
-        materials_max = labor_min * 1.5 * 1.425
+        materials_min = labor_min * rs.materials_min * rs.overhead
+        materials_max = labor_min * rs.materials_max * rs.overhead
 
     # --- suma ---
     total_min = labor_min + materials_min
     total_max = labor_max + materials_max
 
     # --- VAT ---
-    if "budowa" in std or "dom" in std:
-        vat_rate = "8%" if area_m2 <= 300 else "23%"
-    else:
-        vat_rate = "8%" if area_m2 <= 150 else "23%"
+    vat_rate = rs.vat_low if area_m2 <= typ["vat_8_max_m2"] else rs.vat_high
 
     # ← ZWRACAMY wynik
     return {
-        "typ_prac": type_name,
+        "typ_prac": typ["name"],
         "powierzchnia_m2": area_m2,
         "robocizna_od": round(labor_min, 2),
         "robocizna_do": round(labor_max, 2),
@@ -58,5 +55,107 @@ def estimate_offer(area_m2: float, standard: str):
         "materiały_do": round(materials_max, 2),
         "suma_od": round(total_min, 2),
         "suma_do": round(total_max, 2),
-        "stawka_VAT": vat_rate
+        "stawka_VAT": vat_rate,
+        "wersja_cennika": rs.version,
     }
+
+
+# ====== Wersja wsadowa (przeliczanie całych list leadów, siatki porównawcze) ======
+
+_RESULT_KEYS = ("typ_prac", "powierzchnia_m2", "robocizna_od", "robocizna_do", "materiały_od",
+                "materiały_do", "suma_od", "suma_do", "stawka_VAT", "wersja_cennika")
+
+
+def _round2(x: np.ndarray) -> np.ndarray:
+    """
+    round(x, 2) z Pythona dla tablicy. np.round liczy rint(x*100)/100 i przy
+    wartościach bardzo bliskich połówce grosza (błąd mnożenia) potrafi wybrać
+    inny grosz – takie elementy przeliczamy wbudowanym round().
+    """
+    y = x * 100
+    out = np.rint(y) / 100
+    frac = np.abs(y - np.floor(y) - 0.5)
+    suspect = (frac <= 8 * np.finfo(np.float64).eps * np.maximum(np.abs(y), 1)) | ~(np.abs(y) < 2.0 ** 52)
+    for i in np.flatnonzero(suspect):
+        out[i] = round(float(x[i]), 2)
+    return out
+
+
+def _batch_columns(areas: np.ndarray, codes: np.ndarray, rs: RuleSet) -> Dict[str, np.ndarray]:
+    """Wszystkie kolumny wyniku w jednym przebiegu (kolejność działań jak w estimate_offer)."""
+    base = np.array([t["base_rate"] for t in rs.types], dtype=np.float64)[codes]
+    incl_materials = np.array([bool(t["includes_materials"]) for t in rs.types])[codes]
+    vat_limit = np.array([t["vat_8_max_m2"] for t in rs.types], dtype=np.float64)[codes]
+
+    labor_min = areas * base
+    labor_max = labor_min * rs.labor_max_mul
+    labor_min = labor_min * rs.overhead
+    labor_max = labor_max * rs.overhead
+    materials_min = np.where(incl_materials, 0.0, labor_min * rs.materials_min * rs.overhead)
+    materials_max = np.where(incl_materials, 0.0, labor_min * rs.materials_max * rs.overhead)
+    return {
+        "robocizna_od": _round2(labor_min),
+        "robocizna_do": _round2(labor_max),
+        "materiały_od": _round2(materials_min),
+        "materiały_do": _round2(materials_max),
+        "suma_od": _round2(labor_min + materials_min),
+        "suma_do": _round2(labor_max + materials_max),
+        "vat_8": areas <= vat_limit,
+    }
+
+
+def _classify(standards: Sequence[str], rs: RuleSet) -> np.ndarray:
+    """Kody typów; każdy różny napis klasyfikujemy raz."""
+    memo: Dict[str, int] = {}
+    codes = np.empty(len(standards), dtype=np.int8)
+    for i, s in enumerate(standards):
+        code = memo.get(s)
+        if code is None:
+            code = memo[s] = rs.type_code(s.lower())
+        codes[i] = code
+    return codes
+
+
+def estimate_offer_batch(areas, standards=None):
+    """
+    estimate_offer dla wielu prac naraz.
+
+    areas, standards – sekwencje/tablice tej samej długości; zwraca listę
+    słowników identycznych z estimate_offer(areas[i], standards[i]).
+    Można też podać DataFrame z kolumnami area_m2 i standard – wtedy wynik
+    jest DataFrame'em z kolumnami jak klucze estimate_offer (ten sam indeks).
+    """
+    frame = None
+    if hasattr(areas, "columns"):
+        frame = areas
+        areas, standards = frame["area_m2"], frame["standard"].tolist()
+    elif not hasattr(areas, "__len__"):
+        areas = list(areas)
+    standards = list(standards)
+    if len(areas) != len(standards):
+        raise ValueError("Liczba metraży musi odpowiadać liczbie standardów.")
+
+    rs = rules()
+    codes = _classify(standards, rs)
+    cols = _batch_columns(np.asarray(areas, dtype=np.float64), codes, rs)
+    names = np.array([t["name"] for t in rs.types], dtype=object)
+    vat = np.where(cols.pop("vat_8"), rs.vat_low, rs.vat_high).astype(object)
+    incl_materials = np.array([bool(t["includes_materials"]) for t in rs.types])[codes]
+
+    if frame is not None:
+        import pandas as pd
+        return pd.DataFrame({"typ_prac": names[codes], "powierzchnia_m2": areas, **cols, "stawka_VAT": vat,
+                             "wersja_cennika": rs.version},
+                            index=frame.index, columns=list(_RESULT_KEYS))
+
+    lists = {k: v.tolist() for k, v in cols.items()}
+    # typy ze stawką z materiałami: materiały to całkowite 0, jak w estimate_offer
+    for key in ("materiały_od", "materiały_do"):
+        lists[key] = [0 if inc else v for inc, v in zip(incl_materials.tolist(), lists[key])]
+    areas = areas.tolist() if isinstance(areas, np.ndarray) else list(areas)
+    return [
+        dict(zip(_RESULT_KEYS, row))
+        for row in zip(names[codes].tolist(), areas, lists["robocizna_od"], lists["robocizna_do"],
+                       lists["materiały_od"], lists["materiały_do"], lists["suma_od"], lists["suma_do"],
+                       vat.tolist(), [rs.version] * len(areas))
+    ]
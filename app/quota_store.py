@@ -0,0 +1,209 @@
+# app/quota_store.py
+"""
+Dzienny limit zapytań współdzielony przez wszystkie procesy Passengera.
+
+Stan trzymamy w pliku zmapowanym w pamięć (mmap) jako tablicę haszującą
+o stałym rozmiarze z adresowaniem otwartym. Każdy slot to:
+skrót client_id (16 B) | dzień (ordinal) | count | max | zarezerwowane.
+
+Wpis pasuje po (dzień, skrót). Slot z wcześniejszym dniem to „nagrobek”:
+wyszukiwanie idzie za niego dalej, a nowy wpis zajmuje pierwszy napotkany
+nagrobek – wpisy z poprzednich dni wygasają same, bez sprzątania. Dni
+w slocie tylko rosną, więc przed każdym wpisem z dnia D leżą wyłącznie
+sloty z dniem ≥ D; łańcuch kończy się na slocie pustym albo starszym niż
+wczoraj. Dzięki temu proces, któremu zegar koło północy pokazuje jeszcze
+poprzedni dzień, nie nadpisuje wpisów z nowego dnia (ani odwrotnie – jego
+wczorajsze wpisy nie przerywają łańcuchów dzisiejszych).
+
+Atomowość check-and-consume między procesami daje flock na osobnym
+pliku blokady.
+"""
+from __future__ import annotations
+import hashlib
+import json
+import mmap
+import os
+import struct
+import threading
+from contextlib import contextmanager
+from datetime import date
+from pathlib import Path
+from typing import Optional, Tuple
+
+from app import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows (dev) – tylko blokada w obrębie procesu
+    fcntl = None
+
+MAGIC = b"OLLQUOTA"
+VERSION = 1
+HEADER = struct.Struct("<8sIII44x")       # magic, wersja, liczba slotów, flaga importu
+SLOT = struct.Struct("<16sIIII")          # skrót, dzień, count, max, zarezerwowane
+DEFAULT_SLOTS = int(os.getenv("QUOTA_SLOTS", "65536"))
+
+
+class QuotaTableFull(RuntimeError):
+    pass
+
+
+def _key(client_id: str) -> bytes:
+    return hashlib.blake2b(client_id.encode("utf-8"), digest_size=16).digest()
+
+
+class QuotaStore:
+    def __init__(self, path: Path, lock_path: Path, slots: int = DEFAULT_SLOTS,
+                 legacy_json: Optional[Path] = None, default_max: int = 3):
+        self.path = Path(path)
+        self.lock_path = Path(lock_path)
+        self.slots = slots
+        self.legacy_json = legacy_json
+        self.default_max = default_max
+        self._mm: Optional[mmap.mmap] = None
+        self._lock_fd: Optional[int] = None
+        self._lock_pid: Optional[int] = None
+        self._tlock = threading.Lock()
+
+    # --- blokady ---
+    def _lock_file(self) -> int:
+        # flock dotyczy otwartego opisu pliku, który po fork() jest współdzielony
+        # z rodzicem – dlatego każdy proces otwiera plik blokady sam.
+        pid = os.getpid()
+        if self._lock_fd is None or self._lock_pid != pid:
+            self._lock_fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+            self._lock_pid = pid
+        return self._lock_fd
+
+    @contextmanager
+    def _locked(self, exclusive: bool = True):
+        with self._tlock:
+            if fcntl is None:
+                yield
+                return
+            fd = self._lock_file()
+            fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+
+    # --- plik tablicy ---
+    def _open(self) -> mmap.mmap:
+        if self._mm is not None:
+            return self._mm
+        size = HEADER.size + self.slots * SLOT.size
+        with self._locked():
+            if self._mm is not None:
+                return self._mm
+            if self._needs_create():
+                self._create(size)
+            fd = os.open(self.path, os.O_RDWR)
+            try:
+                mm = mmap.mmap(fd, 0)
+            finally:
+                os.close(fd)
+            magic, version, slots, imported = HEADER.unpack_from(mm, 0)
+            if magic != MAGIC or version != VERSION:
+                mm.close()
+                raise ValueError(f"Nieprawidłowy plik limitów: {self.path}")
+            # Rozmiar tablicy zapisany w pliku ma pierwszeństwo nad ENV
+            self.slots = slots
+            self._mm = mm
+            if not imported:
+                self._import_legacy()
+                HEADER.pack_into(mm, 0, MAGIC, VERSION, self.slots, 1)
+                mm.flush()
+        return self._mm
+
+    def _needs_create(self) -> bool:
+        """Brak pliku albo pusty / wyzerowany nagłówek (proces padł przy zakładaniu starszą metodą)."""
+        try:
+            with open(self.path, "rb") as f:
+                head = f.read(HEADER.size)
+        except FileNotFoundError:
+            return True
+        return len(head) < HEADER.size or not head.strip(b"\0")
+
+    def _create(self, size: int):
+        """Zakłada plik pod nazwą tymczasową i podmienia atomowo – nigdy nie zostaje pół-plik."""
+        tmp = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+        fd = os.open(tmp, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.ftruncate(fd, size)
+            os.write(fd, HEADER.pack(MAGIC, VERSION, self.slots, 0))
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        os.replace(tmp, self.path)
+
+    def _import_legacy(self):
+        """Jednorazowy import dzisiejszych liczników z dawnego quota.json."""
+        if self.legacy_json is None or not self.legacy_json.exists():
+            return
+        try:
+            data = json.loads(self.legacy_json.read_text("utf-8"))
+        except Exception:
+            return
+        today = date.today()
+        for client_id, days in (data or {}).items():
+            q = (days or {}).get(today.isoformat())
+            if not q:
+                continue
+            pos, found = self._find(_key(client_id), today.toordinal())
+            self._write(pos, _key(client_id), today.toordinal(),
+                        int(q.get("count", 0)), int(q.get("max", self.default_max)))
+
+    # --- tablica haszująca ---
+    def _find(self, key: bytes, day: int) -> Tuple[int, bool]:
+        """Zwraca (slot, czy_znaleziony). Gdy nie znaleziony – slot do wstawienia."""
+        mm = self._mm
+        start = int.from_bytes(key[:8], "little") % self.slots
+        free = None
+        for i in range(self.slots):
+            pos = (start + i) % self.slots
+            k, d, _, _, _ = SLOT.unpack_from(mm, HEADER.size + pos * SLOT.size)
+            if d == day and k == key:
+                return pos, True
+            if d < day - 1:
+                # pusty albo sprzed wczoraj – dalej nie ma już wpisów z tego dnia
+                return (pos if free is None else free), False
+            if d < day and free is None:
+                free = pos   # wczorajszy nagrobek: wpis może być jeszcze dalej
+        if free is not None:
+            return free, False
+        raise QuotaTableFull("Tablica limitów jest pełna – zwiększ QUOTA_SLOTS.")
+
+    def _read(self, pos: int) -> Tuple[int, int]:
+        _, _, count, mx, _ = SLOT.unpack_from(self._mm, HEADER.size + pos * SLOT.size)
+        return count, mx
+
+    def _write(self, pos: int, key: bytes, day: int, count: int, mx: int):
+        SLOT.pack_into(self._mm, HEADER.size + pos * SLOT.size, key, day, count, mx, 0)
+
+    # --- API ---
+    @metrics.timed("quota_get")
+    def get(self, client_id: str, day: Optional[date] = None) -> Tuple[int, int]:
+        """Zwraca (count, max) klienta na dany dzień."""
+        self._open()
+        d = (day or date.today()).toordinal()
+        with self._locked(exclusive=False):
+            try:
+                pos, found = self._find(_key(client_id), d)
+            except QuotaTableFull:   # pełna tablica bez tego wpisu – klient nic dziś nie zużył
+                found = False
+            return self._read(pos) if found else (0, self.default_max)
+
+    @metrics.timed("quota_consume")
+    def consume(self, client_id: str, day: Optional[date] = None) -> Tuple[int, int]:
+        """Atomowo zużywa jedno zapytanie (jeśli limit pozwala) i zwraca (count, max)."""
+        self._open()
+        key = _key(client_id)
+        d = (day or date.today()).toordinal()
+        with self._locked():
+            pos, found = self._find(key, d)
+            count, mx = self._read(pos) if found else (0, self.default_max)
+            if count < mx:
+                count += 1
+            self._write(pos, key, d, count, mx)
+            return count, mx
@@ -0,0 +1,188 @@
+# app/rules.py
+"""
+Reguły cenowe z pliku (PRICING_RULES_PATH, domyślnie app/pricing_rules.json).
+
+Plik jest wersjonowany ("version") i przy wczytaniu kompilowany do RuleSet:
+- jeden matcher na słowa kluczowe zakresu prac, drugi na strefy lokalizacji,
+  trzeci na typy budynków – tekst przechodzimy raz, zamiast sprawdzać po
+  kolei 'malow' in s, 'podł' in s, ...,
+- tabele stawek i mnożników (słowniki, krotki) gotowe do użycia.
+
+Zmiana pliku jest wykrywana przy kolejnym użyciu (stat najwyżej co
+PRICING_RULES_CHECK_INTERVAL s); błędny plik nie zastępuje działających reguł.
+Aplikacja (app/main.py) i app/pricing korzystają z rules().
+"""
+from __future__ import annotations
+import json
+import os
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, FrozenSet, List, Optional, Sequence, Tuple
+
+RULES_PATH = os.getenv("PRICING_RULES_PATH", str(Path(__file__).with_name("pricing_rules.json")))
+CHECK_INTERVAL = float(os.getenv("PRICING_RULES_CHECK_INTERVAL", "5"))
+MATCH_MEMO_MAX = 4096
+
+
+class KeywordMatcher:
+    """
+    Które słowa kluczowe (ich właściciele) występują w tekście – jeden przebieg
+    skompilowanego wyrażenia z alternatywą wszystkich słów (silnik re w C).
+    Nakładające się trafienia łapie lookahead; na jednej pozycji raportowane
+    jest tylko najdłuższe słowo, więc słowa będące jego fragmentem dopisujemy
+    do jego właścicieli już przy kompilacji.
+    """
+
+    def __init__(self, patterns: Sequence[Tuple[str, int]]):
+        owners: Dict[str, set] = {}
+        for text, owner in patterns:
+            if text:
+                owners.setdefault(text, set()).add(owner)
+        self._owners: Dict[str, FrozenSet[int]] = {
+            text: frozenset().union(*(o for sub, o in owners.items() if sub in text))
+            for text in owners
+        }
+        alternatives = "|".join(re.escape(t) for t in sorted(owners, key=len, reverse=True))
+        self._rx = re.compile(f"(?=({alternatives}))") if owners else None
+        # te same opisy i lokalizacje wracają często – wynik pamiętamy per tekst
+        self._memo: Dict[str, FrozenSet[int]] = {}
+
+    def owners(self, text: str) -> FrozenSet[int]:
+        hit = self._memo.get(text)
+        if hit is not None:
+            return hit
+        found = set()
+        if self._rx is not None:
+            for h in set(self._rx.findall(text)):
+                found |= self._owners[h]
+        hit = frozenset(found)
+        if len(self._memo) >= MATCH_MEMO_MAX:
+            self._memo.clear()
+        self._memo[text] = hit
+        return hit
+
+
+def _matcher(entries: Sequence[Dict[str, Any]]) -> KeywordMatcher:
+    return KeywordMatcher([(kw.lower(), i) for i, e in enumerate(entries) for kw in e.get("keywords", [])])
+
+
+class RuleSet:
+    def __init__(self, raw: Dict[str, Any]):
+        self.version = str(raw["version"])
+        scope = raw["scope"]
+        self.scope_items: List[Dict[str, Any]] = scope["items"]
+        self._scope_ac = _matcher(self.scope_items)
+        self.standard_mul: Dict[str, float] = scope["standards"]
+        self.default_standard_mul: float = scope["default_standard_mul"]
+        self.zones: List[Dict[str, Any]] = scope["zones"]
+        self._zone_ac = _matcher(self.zones)
+        self.default_zone_mul: float = scope["default_zone_mul"]
+        self.buffer: float = scope["buffer"]
+        self.currency: str = scope["currency"]
+        self.notes: str = scope["notes"]
+        self._scope_memo: Dict[FrozenSet[int], Tuple[Tuple[Dict[str, Any], ...], int]] = {}
+
+        offer = raw["offer"]
+        self.types: List[Dict[str, Any]] = offer["types"]
+        defaults = [i for i, t in enumerate(self.types) if not t.get("keywords")]
+        if len(defaults) != 1:
+            raise ValueError("Reguły: dokładnie jeden typ budynku musi być bez słów kluczowych (domyślny).")
+        self.default_type = defaults[0]
+        self._type_ac = _matcher(self.types)
+        self.labor_max_mul: float = offer["labor_max_mul"]
+        self.overhead: float = offer["overhead"]
+        self.materials_min: float = offer["materials_min"]
+        self.materials_max: float = offer["materials_max"]
+        self.vat_low: str = offer["vat_low"]
+        self.vat_high: str = offer["vat_high"]
+
+        # stawka roboczogodziny do kosztorysu (zł/r-g); starsze pliki reguł nie mają tej sekcji
+        self.labor_rate: float = float(raw.get("kosztorys", {}).get("labor_rate", 45.0))
+
+    # --- zakres prac ---
+    def _scope_lines(self, matched: FrozenSet[int]) -> Tuple[Tuple[Dict[str, Any], ...], int]:
+        """(pozycje bez ilości, suma stawek) dla zbioru trafionych reguł – liczone raz na zbiór."""
+        hit = self._scope_memo.get(matched)
+        if hit is None:
+            order = sorted(matched)
+            exclusive = [i for i in order if self.scope_items[i].get("exclusive")]
+            if exclusive:
+                order = exclusive[:1]
+            lines = tuple({"name": self.scope_items[i]["name"], "unit": self.scope_items[i]["unit"],
+                           "rate": self.scope_items[i]["rate"]} for i in order)
+            rate = 0
+            for line in lines:
+                rate += line["rate"]
+            hit = self._scope_memo[matched] = (lines, rate)
+        return hit
+
+    def zone_mul(self, location: str) -> float:
+        matched = self._zone_ac.owners(location.lower())
+        return self.zones[min(matched)]["mul"] if matched else self.default_zone_mul
+
+    def estimate_scope(self, scope: str, area_m2: float, standard: str, location: str) -> Dict[str, Any]:
+        """Wycena zakresu prac (dawne estimate_offer z wsgi_app i app/services/estimate)."""
+        m2 = float(area_m2 or 0)
+        lines, rate = self._scope_lines(self._scope_ac.owners((scope or "").lower()))
+        items = [{"name": l["name"], "unit": l["unit"], "qty": m2, "rate": l["rate"]} for l in lines]
+        std_mul = self.standard_mul.get(standard, self.default_standard_mul)
+        loc_mul = self.zone_mul(location or "")
+
+        subtotal = round(rate * m2 * std_mul * loc_mul)
+        buffer = round(subtotal * self.buffer)
+        total = subtotal + buffer
+        return {"items": items, "subtotal": subtotal, "buffer": buffer, "total": total,
+                "currency": self.currency, "notes": self.notes, "rules_version": self.version}
+
+    # --- typ budynku (app/pricing) ---
+    def type_code(self, std: str) -> int:
+        """Indeks typu w self.types; std już po lower()."""
+        matched = self._type_ac.owners(std)
+        return min(matched) if matched else self.default_type
+
+
+_rules: Optional[RuleSet] = None
+_stamp: Optional[Tuple[int, int]] = None
+_checked = 0.0
+_lock = threading.Lock()
+
+
+def _file_stamp(path: str) -> Tuple[int, int]:
+    st = os.stat(path)
+    return st.st_mtime_ns, st.st_size
+
+
+def _load(path: str) -> RuleSet:
+    return RuleSet(json.loads(Path(path).read_text("utf-8")))
+
+
+def rules() -> RuleSet:
+    """Aktualne reguły; co CHECK_INTERVAL sprawdza, czy plik się zmienił."""
+    global _rules, _stamp, _checked
+    now = time.monotonic()
+    if _rules is not None and now - _checked < CHECK_INTERVAL:
+        return _rules
+    with _lock:
+        if _rules is not None and now - _checked < CHECK_INTERVAL:
+            return _rules
+        stamp = None
+        try:
+            stamp = _file_stamp(RULES_PATH)
+            if stamp != _stamp:
+                _rules, _stamp = _load(RULES_PATH), stamp
+        except Exception:
+            if _rules is None:
+                raise
+            import traceback
+            print("=== BŁĄD WCZYTYWANIA REGUŁ CENOWYCH (zostają poprzednie) ===")
+            traceback.print_exc()
+            if stamp is not None:
+                _stamp = stamp  # ten sam błędny plik czytamy ponownie dopiero po kolejnej zmianie
+        _checked = now
+        return _rules
+
+
+def rules_version() -> str:
+    return rules().version
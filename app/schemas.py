@@ -1,54 +1,52 @@
 from pydantic import BaseModel, Field
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 
 
 class QuotaCheck(BaseModel):
-client_id: str
+    client_id: str
 
 
 class QuotaResponse(BaseModel):
-client_id: str
-date: str
-count: int
-max: int
-remaining: int
-reset_at: str
+    client_id: str
+    date: str
+    count: int
+    max: int
+    remaining: int
+    reset_at: str
 
 
 class EstimateRequest(BaseModel):
-client_id: str
-scope: str
-area_m2: float = Field(ge=0)
-standard: str # ekonomiczny | standard | premium
-location: str
-deadline: str | None = None
+    client_id: str
+    scope: str
+    area_m2: float = Field(ge=0)
+    standard: str  # ekonomiczny | standard | premium
+    location: str
+    deadline: str | None = None
 
 
 class EstimateResponse(BaseModel):
-items: List[Dict[str, Any]]
-subtotal: int
-buffer: int
-total: int
-currency: str
-notes: str
+    items: List[Dict[str, Any]]
+    subtotal: int
+    buffer: int
+    total: int
+    currency: str
+    notes: str
+    rules_version: Optional[str] = None  # wersja pliku reguł cenowych
 
 
 class ExportRequest(BaseModel):
-client_id: str
-summary: Dict[str, Any] # np. zakres, area, standard, location, deadline
-pricing: Dict[str, Any] # subtotal, buffer, total, currency
+    client_id: str
+    summary: Dict[str, Any]  # np. zakres, area, standard, location, deadline
+    pricing: Dict[str, Any]  # subtotal, buffer, total, currency
 
----
 
+class KosztorysPozycja(BaseModel):
+    pozycja: str  # opis pracy albo kod KNR (np. "KNR 2-15 0101-01")
+    ilosc: float = Field(ge=0)
 
-## app/deps.py
-```python
-from app.database import SessionLocal
 
-
-def get_db():
-db = SessionLocal()
-try:
-yield db
-finally:
-db.close()
\ No newline at end of file
+class KosztorysRequest(BaseModel):
+    pozycje: List[KosztorysPozycja]
+    standard: Optional[str] = None  # typ budynku – do stawki VAT (jak /api/offer/estimate)
+    area_m2: Optional[float] = Field(default=None, ge=0)
+    stawka_rg: Optional[float] = Field(default=None, gt=0)  # zł za roboczogodzinę; domyślnie z reguł
@@ -1,46 +1,306 @@
-from typing import Dict, Any, Tuple
-from jinja2 import Environment, FileSystemLoader, select_autoescape
+"""
+Eksport oferty do PDF/TXT.
+
+PDF renderuje pula procesów (PDF_WORKERS) – każdy proces raz wczytuje
+szablon Jinja i WeasyPrint (z czcionkami, rozgrzewka na próbnym dokumencie),
+więc renderowanie nie blokuje workera HTTP i nie płaci za start za każdym razem.
+
+Wynik trafia do cache na dysku (PDF_CACHE_DIR) pod skrótem SHA-256 z
+summary + pricing + wersji szablonu (skrót liczony raz, ponownie dopiero po
+zmianie mtime któregoś szablonu). Ten skrót jest też identyfikatorem
+zadania w API asynchronicznym (submit_pdf / pdf_status / cached_pdf), więc
+status i pobranie działają z każdego workera. Bez WeasyPrint zgłaszamy
+PdfUnavailable – nie udajemy PDF-a plikiem HTML.
+"""
+from __future__ import annotations
+import hashlib
+import importlib.util
+import json
+import multiprocessing
+import os
+import re
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
 from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
 
+from app import metrics
 
-try:
-from weasyprint import HTML
-WEASY_AVAILABLE = True
-except Exception:
-WEASY_AVAILABLE = False
+TEMPLATES_DIR = Path(os.getenv("PDF_TEMPLATES_DIR", Path(__file__).resolve().parents[2] / "templates"))
+TEMPLATE_NAME = "offer.html"
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", "2"))
+PDF_TIMEOUT = float(os.getenv("PDF_TIMEOUT", "30"))            # sekundy, ścieżka synchroniczna
+PDF_CACHE_DIR = Path(os.getenv("PDF_CACHE_DIR", Path(__file__).resolve().parents[2] / "_data" / "pdf_cache"))
+PDF_CACHE_MAX_FILES = int(os.getenv("PDF_CACHE_MAX_FILES", "5000"))
+TEMPLATE_CHECK_INTERVAL = float(os.getenv("PDF_TEMPLATE_CHECK_INTERVAL", "5"))
+PENDING_STALE = PDF_TIMEOUT * 4    # znacznik 'w toku' starszy niż to = proces padł
 
+WEASY_AVAILABLE = importlib.util.find_spec("weasyprint") is not None
 
-env = Environment(
-loader=FileSystemLoader("templates"),
-autoescape=select_autoescape(["html", "xml"]),
-)
 
+class PdfUnavailable(RuntimeError):
+    """Brak WeasyPrint (lub jego bibliotek systemowych) – PDF nie powstanie."""
+
+
+class PdfRenderError(RuntimeError):
+    pass
+
+
+# ====== Proces renderujący (pula) ======
+
+_w_template = None
+_w_html = None
+_w_error: Optional[str] = None
+
+
+def _worker_init(templates_dir: str):
+    """Raz na proces: szablon + WeasyPrint + rozgrzewka czcionek."""
+    global _w_template, _w_html, _w_error
+    from jinja2 import Environment, FileSystemLoader, select_autoescape
+
+    env = Environment(loader=FileSystemLoader(templates_dir), autoescape=select_autoescape(["html", "xml"]))
+    _w_template = env.get_template(TEMPLATE_NAME)
+    try:
+        from weasyprint import HTML
+        HTML(string="<p style='font-family: Arial, sans-serif'>OLLBUD</p>").write_pdf()
+        _w_html = HTML
+    except Exception as e:  # brak pango/cairo itp.
+        _w_error = f"{type(e).__name__}: {e}"
+
+
+def _worker_render(summary: Dict[str, Any], pricing: Dict[str, Any], generated_at: str) -> bytes:
+    if _w_html is None:
+        raise PdfUnavailable(f"WeasyPrint niedostępny w procesie renderującym ({_w_error}).")
+    html = _w_template.render(summary=summary, pricing=pricing,
+                              generated_at=datetime.fromisoformat(generated_at))
+    return _w_html(string=html, base_url=str(TEMPLATES_DIR)).write_pdf()
+
+
+def _worker_ping() -> int:
+    return os.getpid()
+
+
+# ====== Pula, cache i zadania (proces aplikacji) ======
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_pid: Optional[int] = None
+_pool_lock = threading.Lock()
+_jobs: Dict[str, Future] = {}
+_jobs_lock = threading.Lock()
+_writes = 0
+_KEY = re.compile(r"[0-9a-f]{64}")
+
+
+_template_version: Optional[str] = None
+_template_stamp: Optional[Tuple[Tuple[str, int, int], ...]] = None
+_template_checked = 0.0
+_template_lock = threading.Lock()
+
+
+def _template_files() -> Tuple[Tuple[str, int, int], ...]:
+    stamp = []
+    for path in sorted(TEMPLATES_DIR.glob("*.html")):
+        st = path.stat()
+        stamp.append((path.name, st.st_mtime_ns, st.st_size))
+    return tuple(stamp)
+
+
+def template_version() -> str:
+    """
+    Skrót szablonów do klucza cache PDF. Liczony raz (rozgrzewka albo pierwsze
+    użycie), potem tylko stat co TEMPLATE_CHECK_INTERVAL s – szablony czytamy
+    i hashujemy ponownie dopiero, gdy zmieni się mtime/rozmiar któregoś z nich.
+    """
+    global _template_version, _template_stamp, _template_checked
+    now = time.monotonic()
+    if _template_version is not None and now - _template_checked < TEMPLATE_CHECK_INTERVAL:
+        return _template_version
+    with _template_lock:
+        if _template_version is not None and now - _template_checked < TEMPLATE_CHECK_INTERVAL:
+            return _template_version
+        stamp = _template_files()
+        if stamp != _template_stamp or _template_version is None:
+            h = hashlib.sha256()
+            for name, _, _ in stamp:
+                h.update(name.encode("utf-8"))
+                h.update((TEMPLATES_DIR / name).read_bytes())
+            _template_version, _template_stamp = h.hexdigest()[:16], stamp
+        _template_checked = now
+        return _template_version
 
-def render_offer_pdf(payload) -> Tuple[bytes, str]:
-template = env.get_template("offer.html")
-html = template.render(summary=payload.summary, pricing=payload.pricing, generated_at=datetime.now())
 
+def _pool_get() -> ProcessPoolExecutor:
+    global _pool, _pool_pid
+    if _pool is not None and _pool_pid == os.getpid():
+        return _pool
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            # spawn: procesy renderujące nie dziedziczą wątków ani połączeń aplikacji
+            _pool = ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=multiprocessing.get_context("spawn"),
+                                        initializer=_worker_init, initargs=(str(TEMPLATES_DIR),))
+            _pool_pid = os.getpid()
+            with _jobs_lock:
+                _jobs.clear()
+    return _pool
 
-if not WEASY_AVAILABLE:
-# Fallback: zwróć prosty PDF-like w bajtach tekstowych (nieprawdziwy PDF) – dla dev
-# Rekomendacja: zainstalować WeasyPrint w środowisku produkcyjnym.
-return html.encode("utf-8"), f"OLL_BUD_oferta_{datetime.now().date()}.pdf"
 
+def warm_up():
+    """Uruchamia i rozgrzewa wszystkie procesy puli (np. przy starcie aplikacji)."""
+    if not WEASY_AVAILABLE:
+        return
+    pool = _pool_get()
+    for f in [pool.submit(_worker_ping) for _ in range(PDF_WORKERS)]:
+        f.result()
 
-pdf_bytes = HTML(string=html).write_pdf()
-return pdf_bytes, f"OLL_BUD_oferta_{datetime.now().date()}.pdf"
+
+def shutdown():
+    global _pool
+    if _pool is not None and _pool_pid == os.getpid():
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def offer_key(summary: Dict[str, Any], pricing: Dict[str, Any]) -> str:
+    # PDF nosi datę wygenerowania (jak nazwa pliku) – ta sama oferta innego dnia to nowy PDF
+    raw = json.dumps({"summary": summary, "pricing": pricing, "template": template_version(),
+                      "day": datetime.now().date().isoformat()},
+                     ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def valid_job_id(key: str) -> bool:
+    return bool(_KEY.fullmatch(key))
+
+
+def _path(key: str, suffix: str) -> Path:
+    if not valid_job_id(key):
+        raise ValueError("Nieprawidłowy identyfikator zadania.")
+    return PDF_CACHE_DIR / key[:2] / f"{key}{suffix}"
+
+
+def _write_atomic(path: Path, data: bytes):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def _prune():
+    files = sorted(PDF_CACHE_DIR.glob("*/*.pdf"), key=lambda p: p.stat().st_mtime)
+    for p in files[:max(len(files) - PDF_CACHE_MAX_FILES, 0)]:
+        p.unlink(missing_ok=True)
+
+
+def _finish(key: str, fut: Future, t0: float):
+    global _writes
+    metrics.observe_span("pdf_render", time.perf_counter() - t0, "error" if fut.cancelled() or fut.exception() else "ok")
+    try:
+        _write_atomic(_path(key, ".pdf"), fut.result())
+        _path(key, ".error").unlink(missing_ok=True)
+        _writes += 1
+        if _writes % 100 == 0:
+            _prune()
+    except Exception as e:
+        _write_atomic(_path(key, ".error"), f"{type(e).__name__}: {e}".encode("utf-8"))
+    finally:
+        _path(key, ".pending").unlink(missing_ok=True)
+        with _jobs_lock:
+            _jobs.pop(key, None)
+
+
+def cached_pdf(key: str) -> Optional[bytes]:
+    try:
+        return _path(key, ".pdf").read_bytes()
+    except OSError:
+        return None
+
+
+def pdf_filename() -> str:
+    return f"OLL_BUD_oferta_{datetime.now().date()}.pdf"
+
+
+def submit_pdf(summary: Dict[str, Any], pricing: Dict[str, Any]) -> Tuple[str, Optional[Future]]:
+    """
+    Zleca renderowanie (jeśli PDF-a nie ma jeszcze w cache). Zwraca (job_id, future);
+    future jest None, gdy wynik już jest albo renderuje go inny worker.
+    """
+    if not WEASY_AVAILABLE:
+        raise PdfUnavailable("Generowanie PDF niedostępne – brak WeasyPrint na serwerze.")
+    key = offer_key(summary, pricing)
+    if _path(key, ".pdf").exists():
+        return key, None
+    pool = _pool_get()
+    with _jobs_lock:
+        fut = _jobs.get(key)
+        if fut is not None:
+            return key, fut
+        pending = _path(key, ".pending")
+        try:
+            if time.time() - pending.stat().st_mtime < PENDING_STALE:
+                return key, None   # renderuje inny worker
+        except OSError:
+            pass
+        _write_atomic(pending, str(os.getpid()).encode())
+        _path(key, ".error").unlink(missing_ok=True)
+        fut = _jobs[key] = pool.submit(_worker_render, summary, pricing, datetime.now().isoformat())
+    t0 = time.perf_counter()
+    fut.add_done_callback(lambda f: _finish(key, f, t0))
+    return key, fut
+
+
+def pdf_status(key: str) -> Dict[str, Any]:
+    """Status zadania: done | pending | error | unknown."""
+    if _path(key, ".pdf").exists():
+        return {"job_id": key, "status": "done"}
+    try:
+        return {"job_id": key, "status": "error", "error": _path(key, ".error").read_text("utf-8")}
+    except OSError:
+        pass
+    try:
+        if time.time() - _path(key, ".pending").stat().st_mtime < PENDING_STALE:
+            return {"job_id": key, "status": "pending"}
+    except OSError:
+        pass
+    return {"job_id": key, "status": "unknown"}
+
+
+@metrics.timed("pdf_export")
+def render_offer_pdf(payload) -> Tuple[bytes, str]:
+    """Ścieżka synchroniczna: PDF z cache albo z puli (czeka najwyżej PDF_TIMEOUT)."""
+    key, fut = submit_pdf(payload.summary, payload.pricing)
+    deadline = time.monotonic() + PDF_TIMEOUT
+    if fut is not None:
+        try:
+            fut.result(timeout=PDF_TIMEOUT)
+        except PdfUnavailable:
+            raise
+        except Exception as e:
+            raise PdfRenderError(f"Nie udało się wygenerować PDF: {e}") from e
+    # wynik zapisuje callback (albo inny worker) – czekamy na plik
+    while True:
+        data = cached_pdf(key)
+        if data is not None:
+            return data, pdf_filename()
+        status = pdf_status(key)
+        if status["status"] == "error":
+            raise PdfRenderError(status["error"])
+        if time.monotonic() > deadline:
+            raise PdfRenderError("Przekroczono czas generowania PDF.")
+        time.sleep(0.05)
 
 
 def render_offer_txt(payload) -> Tuple[str, str]:
-s, p = payload.summary, payload.pricing
-content = (
-"OLLBUD – szkic oferty (wstępny)\n\n"
-f"Zakres: {s.get('scope')}\n"
-f"Metraż: {s.get('area_m2')} m²\n"
-f"Standard: {s.get('standard')}\n"
-f"Lokalizacja: {s.get('location')}\n"
-f"Termin: {s.get('deadline')}\n\n"
-f"Wycena orientacyjna: {p.get('total')} {p.get('currency', 'PLN')} (w tym bufor: {p.get('buffer')})\n"
-"Uwaga: dokument wygenerowany automatycznie – wymaga weryfikacji po wizji lokalnej.\n"
-)
-return content, f"OLL_BUD_szkic_{datetime.now().date()}.txt"
\ No newline at end of file
+    s, p = payload.summary, payload.pricing
+    content = (
+        "OLLBUD – szkic oferty (wstępny)\n\n"
+        f"Zakres: {s.get('scope')}\n"
+        f"Metraż: {s.get('area_m2')} m²\n"
+        f"Standard: {s.get('standard')}\n"
+        f"Lokalizacja: {s.get('location')}\n"
+        f"Termin: {s.get('deadline')}\n\n"
+        f"Wycena orientacyjna: {p.get('total')} {p.get('currency', 'PLN')} (w tym bufor: {p.get('buffer')})\n"
+        "Uwaga: dokument wygenerowany automatycznie – wymaga weryfikacji po wizji lokalnej.\n"
+    )
+    return content, f"OLL_BUD_szkic_{datetime.now().date()}.txt"
@@ -0,0 +1,144 @@
+"""
+Kosztorys z listy pozycji: (opis albo kod KNR, ilość) -> koszt każdej pozycji i sumy.
+
+1. Rozpoznanie pozycji:
+   - najpierw dokładnie po kodzie albo po pełnej nazwie pozycji – słowniki
+     katalogu (KNRCatalog.by_code / by_name),
+   - potem pozostałe opisy – jednym wyszukiwaniem hurtowym w katalogu
+     (knr._ranked_many, z cache). Każdy różny opis szukamy raz, a do
+     dokładnego porównania bierzemy KOSZTORYS_SHORTLIST kandydatów z indeksu
+     n-gramów (wystarczy, bo potrzebne jest tylko najlepsze trafienie).
+     Trafienie poniżej KOSZTORYS_MIN_SCORE oznacza pozycję nierozpoznaną,
+     która nie wchodzi do sum.
+2. Koszty liczone wektorowo dla wszystkich pozycji naraz:
+   - RG = R × ilość, koszt R = RG × stawka r-g (reguły: kosztorys.labor_rate),
+   - koszt M = M × ilość, koszt S = S × ilość,
+   - koszty bezpośrednie = Cena_jedn × ilość, gdy katalog ma cenę
+     jednostkową; w przeciwnym razie R + M + S,
+   - wartość netto = koszty bezpośrednie × narzut (offer.overhead, jak w app/pricing).
+3. VAT jak w app/pricing: stawka obniżona, gdy podano metraż i mieści się
+   w limicie typu budynku (standard). Bez metrażu – stawka podstawowa.
+"""
+from __future__ import annotations
+import os
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app import knr, metrics
+from app.pricing import _round2
+from app.rules import rules
+
+KOSZTORYS_MAX_ROWS = int(os.getenv("KOSZTORYS_MAX_ROWS", "2000"))
+# Minimalna trafność dopasowania opisu (0-100), żeby pozycję wycenić
+KOSZTORYS_MIN_SCORE = float(os.getenv("KOSZTORYS_MIN_SCORE", "60"))
+KOSZTORYS_SHORTLIST = int(os.getenv("KOSZTORYS_SHORTLIST", "100"))
+
+
+def _resolve(cat: knr.KNRCatalog, texts: Sequence[str]) -> Tuple[np.ndarray, np.ndarray, List[Optional[str]]]:
+    """(indeksy w katalogu lub -1, trafność, sposób: 'kod' | 'opis' | None) dla każdej pozycji."""
+    n = len(texts)
+    idx = np.full(n, -1, dtype=np.int64)
+    score = np.zeros(n, dtype=np.float64)
+    how: List[Optional[str]] = [None] * n
+    fuzzy: List[int] = []
+    for i, text in enumerate(texts):
+        if not text.strip():
+            continue
+        hit = cat.by_code(text)
+        if hit is not None:
+            idx[i], score[i], how[i] = hit, 100.0, "kod"
+            continue
+        hit = cat.by_name(text)
+        if hit is not None:
+            idx[i], score[i], how[i] = hit, 100.0, "opis"
+        else:
+            fuzzy.append(i)
+    if fuzzy:
+        unique = list(dict.fromkeys(texts[i] for i in fuzzy))
+        best = {q: r[0] if r else None for q, r in zip(unique, knr._ranked_many(cat, unique, 1, KOSZTORYS_SHORTLIST))}
+        for i in fuzzy:
+            hit = best[texts[i]]
+            if hit is not None and hit[1] >= KOSZTORYS_MIN_SCORE:
+                idx[i], score[i], how[i] = hit[0], hit[1], "opis"
+    return idx, score, how
+
+
+def _column(values: Optional[np.ndarray], sel: np.ndarray) -> np.ndarray:
+    """Kolumna katalogu dla wybranych pozycji; brak kolumny / puste komórki = 0."""
+    if values is None:
+        return np.zeros(len(sel), dtype=np.float64)
+    return np.nan_to_num(np.asarray(values[sel], dtype=np.float64))
+
+
+@metrics.timed("kosztorys")
+def price_bill(rows: Sequence[Tuple[str, float]], standard: Optional[str] = None,
+               area_m2: Optional[float] = None, labor_rate: Optional[float] = None) -> Dict[str, Any]:
+    """
+    rows – [(opis albo kod KNR, ilość)]; standard i area_m2 – do stawki VAT
+    (jak w estimate_offer); labor_rate – stawka r-g zamiast tej z reguł.
+    Zwraca {"pozycje": [...], "sumy": {...}, ...}.
+    """
+    if len(rows) > KOSZTORYS_MAX_ROWS:
+        raise ValueError(f"Maksymalnie {KOSZTORYS_MAX_ROWS} pozycji w jednym kosztorysie.")
+    rs = rules()
+    cat = knr._load_knr()
+    rate = float(labor_rate) if labor_rate is not None else rs.labor_rate
+    texts = [str(t or "") for t, _ in rows]
+    qty = np.fromiter((float(q) for _, q in rows), dtype=np.float64, count=len(rows))
+
+    idx, score, how = _resolve(cat, texts)
+    ok = idx >= 0
+    sel, q = idx[ok], qty[ok]
+
+    R, M, S, price = (_column(c, sel) for c in (cat.R, cat.M, cat.S, cat.Cena_jedn))
+    rg = R * q
+    cost_r, cost_m, cost_s = _round2(rg * rate), _round2(M * q), _round2(S * q)
+    direct = np.where(price > 0, _round2(price * q), _round2(cost_r + cost_m + cost_s))
+    netto = _round2(direct * rs.overhead)
+
+    # --- pozycje (w kolejności z żądania) ---
+    cols = {"R": R, "M": M, "S": S, "Cena_jedn": price, "RG": rg, "koszt_R": cost_r, "koszt_M": cost_m,
+            "koszt_S": cost_s, "koszty_bezposrednie": direct, "wartosc_netto": netto}
+    lists = {k: v.tolist() for k, v in cols.items()}
+    positions: List[Dict[str, Any]] = []
+    k = 0
+    for i, text in enumerate(texts):
+        row: Dict[str, Any] = {"lp": i + 1, "pozycja": text, "ilosc": float(qty[i]), "dopasowanie": how[i]}
+        if ok[i]:
+            j = int(idx[i])
+            row.update(kod=cat.kod(j), nazwa=cat.nazwa[j], jednostka=cat.jednostka(j),
+                       score=round(float(score[i]), 1))
+            for key, values in lists.items():
+                row[key] = round(values[k], 4) if key in ("R", "M", "S", "Cena_jedn", "RG") else values[k]
+            k += 1
+        positions.append(row)
+
+    # --- sumy i VAT (jak app/pricing.estimate_offer) ---
+    typ = rs.types[rs.type_code((standard or "").lower())]
+    vat_rate = rs.vat_low if area_m2 is not None and area_m2 <= typ["vat_8_max_m2"] else rs.vat_high
+    total_direct = round(float(direct.sum()), 2)
+    total_netto = round(float(netto.sum()), 2)
+    vat = round(total_netto * float(vat_rate.rstrip("%")) / 100, 2)
+    return {
+        "pozycje": positions,
+        "sumy": {
+            "RG": round(float(rg.sum()), 4),
+            "koszt_R": round(float(cost_r.sum()), 2),
+            "koszt_M": round(float(cost_m.sum()), 2),
+            "koszt_S": round(float(cost_s.sum()), 2),
+            "koszty_bezposrednie": total_direct,
+            "narzut": round(total_netto - total_direct, 2),
+            "netto": total_netto,
+            "stawka_VAT": vat_rate,
+            "VAT": vat,
+            "brutto": round(total_netto + vat, 2),
+        },
+        "nierozpoznane": [p["lp"] for p in positions if p["dopasowanie"] is None],
+        "typ_prac": typ["name"],
+        "stawka_rg": rate,
+        "narzut": rs.overhead,
+        "waluta": rs.currency,
+        "wersja_katalogu": cat.version,
+        "wersja_cennika": rs.version,
+    }
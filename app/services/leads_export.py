@@ -0,0 +1,140 @@
+"""
+Eksport leadów do CSV/XLSX dla działu sprzedaży.
+
+Rekordy idą prosto z dziennika (leads.iter_leads()) przez filtr do pliku –
+nic nie jest zbierane w liście, więc pamięć nie rośnie z liczbą leadów:
+- CSV: generator oddaje porcje po EXPORT_CHUNK_ROWS wierszy (odpowiedź chunked),
+- XLSX: openpyxl w trybie write-only zapisuje wiersze na bieżąco do pliku
+  tymczasowego, który potem wysyłamy kawałkami i usuwamy.
+"""
+from __future__ import annotations
+import csv
+import io
+import os
+import tempfile
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+EXPORT_CHUNK_ROWS = int(os.getenv("LEADS_EXPORT_CHUNK_ROWS", "500"))
+FILE_CHUNK_BYTES = 64 * 1024
+
+# pola jak w app.models.Lead (bez id) + wersja reguł cenowych z app.main.offer_estimate
+COLUMNS = ("created_at", "client_id", "scope", "area_m2", "standard", "location",
+           "deadline", "estimate_total", "rules_version")
+FORMATS = ("csv", "xlsx")
+MIMETYPES = {
+    "csv": "text/csv",   # Starlette dopisuje charset=utf-8
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+
+class LeadFilter:
+    """Filtr po dacie utworzenia (włącznie, daty UTC jak w created_at), client_id i standardzie."""
+
+    def __init__(self, date_from: Optional[date] = None, date_to: Optional[date] = None,
+                 client_id: Optional[str] = None, standard: Optional[str] = None):
+        if date_from and date_to and date_from > date_to:
+            raise ValueError("Data początkowa jest późniejsza niż końcowa.")
+        self.date_from = date_from
+        self.date_to = date_to
+        # created_at to ISO – porównujemy prefiks 'RRRR-MM-DD' jako tekst, bez parsowania
+        self._lo = date_from.isoformat() if date_from else None
+        self._hi = date_to.isoformat() if date_to else None
+        self.client_id = client_id
+        self.standard = standard.lower() if standard else None
+
+    @classmethod
+    def from_args(cls, args) -> "LeadFilter":
+        """Z parametrów zapytania: from, to (RRRR-MM-DD), client_id, standard."""
+        def day(name: str) -> Optional[date]:
+            value = args.get(name)
+            if not value:
+                return None
+            try:
+                return date.fromisoformat(value)
+            except ValueError:
+                raise ValueError(f"Nieprawidłowa data w parametrze '{name}' (oczekiwano RRRR-MM-DD).")
+        return cls(day("from"), day("to"), args.get("client_id") or None, args.get("standard") or None)
+
+    def __call__(self, lead: Dict[str, Any]) -> bool:
+        if self.client_id is not None and lead.get("client_id") != self.client_id:
+            return False
+        if self.standard is not None and (lead.get("standard") or "").lower() != self.standard:
+            return False
+        if self._lo is not None or self._hi is not None:
+            day = (lead.get("created_at") or "")[:10]
+            if not day or (self._lo is not None and day < self._lo) or (self._hi is not None and day > self._hi):
+                return False
+        return True
+
+
+def iter_filtered(journal, flt: LeadFilter) -> Iterator[Dict[str, Any]]:
+    for lead in journal.iter_leads(flt.date_from, flt.date_to):
+        if flt(lead):
+            yield lead
+
+
+# Tekst od użytkownika zaczynający się od tych znaków Excel/Calc wykonałby jako formułę
+_FORMULA_START = ("=", "+", "-", "@", "\t", "\r")
+
+
+def _cell(value: Any) -> Any:
+    if isinstance(value, str) and value.startswith(_FORMULA_START):
+        return "'" + value
+    return value
+
+
+def _row(lead: Dict[str, Any]) -> list:
+    return [_cell(lead.get(c)) for c in COLUMNS]
+
+
+def stream_csv(leads: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+    """CSV (UTF-8 z BOM – Excel poprawnie pokaże polskie znaki) w porcjach."""
+    buf = io.StringIO()
+    writer = csv.writer(buf, delimiter=";")
+    buf.write("\ufeff")
+    writer.writerow(COLUMNS)
+    n = 0
+    for lead in leads:
+        writer.writerow(_row(lead))
+        n += 1
+        if n % EXPORT_CHUNK_ROWS == 0:
+            yield buf.getvalue().encode("utf-8")
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue().encode("utf-8")
+
+
+def stream_xlsx(leads: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+    """XLSX przez openpyxl write-only (wiersze nie zostają w pamięci), wysyłany z pliku tymczasowego."""
+    from openpyxl import Workbook
+
+    fd, path = tempfile.mkstemp(prefix="leads-", suffix=".xlsx")
+    os.close(fd)
+    try:
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet("Leady")
+        ws.append(COLUMNS)
+        for lead in leads:
+            ws.append(_row(lead))
+        wb.save(path)
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(FILE_CHUNK_BYTES)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        os.unlink(path)
+
+
+def export_leads(journal, flt: LeadFilter, fmt: str = "csv") -> Iterator[bytes]:
+    if fmt not in FORMATS:
+        raise ValueError(f"Nieobsługiwany format '{fmt}' (dostępne: {', '.join(FORMATS)}).")
+    rows = iter_filtered(journal, flt)
+    return stream_csv(rows) if fmt == "csv" else stream_xlsx(rows)
+
+
+def export_filename(flt: LeadFilter, fmt: str) -> str:
+    span = "_".join(d.isoformat() for d in (flt.date_from, flt.date_to) if d) or datetime.now().date().isoformat()
+    return f"OLL_BUD_leady_{span}.{fmt}"
@@ -0,0 +1,50 @@
+# app/storage.py
+"""
+Dane plikowe aplikacji (dawniej na górze wsgi_app.py):
+- limity dzienne klientów – QuotaStore (mmap, wspólny dla workerów),
+- dziennik leadów (zapis paczkami w tle) i indeks raportów leadów.
+
+Wszystko tu jest synchroniczne; handlery async w app/main.py wołają
+operacje, które mogą czekać na dysk lub blokadę, przez run_in_threadpool.
+"""
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from app.quota_store import QuotaStore
+from app.leads_journal import open_journal
+from app.leads_index import LeadsIndex
+
+# ====== PROSTA "Baza" plikowa (SQLite można dołożyć później) ======
+DATA_DIR = Path(__file__).resolve().parents[1] / "_data"
+DATA_DIR.mkdir(exist_ok=True)
+QUOTA_FILE = DATA_DIR / "quota.json"  # tylko do jednorazowego importu
+QUOTA_STORE_FILE = DATA_DIR / "quota.bin"
+LEADS_FILE = DATA_DIR / "leads.json"  # dawny format – czytany tylko przez iter_leads()
+LEADS_DIR = DATA_DIR / "leads"
+
+# Dziennik leadów: zapis paczkami w tle, odczyt strumieniowy przez leads.iter_leads()
+leads = open_journal(LEADS_DIR, legacy_json=LEADS_FILE)
+# Indeks raportów – dopisywany po każdej paczce zapisanej do dziennika
+leads_index = LeadsIndex(DATA_DIR / "leads_index.db", leads)
+leads.on_commit(leads_index.catch_up)
+
+# ====== Logika limitu dziennego ======
+DEFAULT_DAILY_MAX = 3
+
+# Tablica limitów w pamięci współdzielonej (mmap) – wspólna dla wszystkich workerów
+_quota = QuotaStore(QUOTA_STORE_FILE, DATA_DIR / "quota.lock",
+                    legacy_json=QUOTA_FILE, default_max=DEFAULT_DAILY_MAX)
+
+def _quota_response(client_id: str, today: date, count: int, max_: int):
+    remaining = max(max_ - count, 0)
+    reset_at = (datetime.now() + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0).isoformat()
+    return {"client_id": client_id, "date": today.isoformat(), "count": count, "max": max_, "remaining": remaining, "reset_at": reset_at}
+
+def quota_check_impl(client_id: str):
+    today = date.today()
+    count, max_ = _quota.get(client_id, today)
+    return _quota_response(client_id, today, count, max_)
+
+def quota_consume_impl(client_id: str):
+    today = date.today()
+    count, max_ = _quota.consume(client_id, today)
+    return _quota_response(client_id, today, count, max_)
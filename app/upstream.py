@@ -0,0 +1,309 @@
+# app/upstream.py
+"""
+Ograniczanie ruchu do OpenAI.
+
+- limiter: najwyżej OPENAI_MAX_INFLIGHT wywołań naraz w procesie, do
+  OPENAI_MAX_QUEUE czekających; gdy kolejka jest pełna, od razu UpstreamBusy
+  (503 + Retry-After) zamiast wiszącego żądania,
+- Deadline: jeden limit czasu (CHAT_DEADLINE) na całą odpowiedź czatu,
+  wszystkie rundy razem; każde wywołanie dostaje tylko pozostały czas,
+- with_retries / astream: ponowienia z losowym (jitter) wykładniczym
+  odstępem, tylko dopóki mieszczą się w deadline; slot limitera zajmuje
+  każda próba osobno, nie przerwa między nimi,
+- klienci HTTP z konfigurowalną pulą połączeń (OPENAI_POOL_SIZE).
+
+SDK openai i httpx importujemy dopiero przy pierwszym wywołaniu modelu –
+workery obsługujące tylko wycenę czy limity nie płacą za nie przy starcie.
+"""
+from __future__ import annotations
+import asyncio
+import math
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Deque, Dict, Optional
+
+if TYPE_CHECKING:
+    import httpx
+
+MAX_INFLIGHT = int(os.getenv("OPENAI_MAX_INFLIGHT", "8"))
+MAX_QUEUE = int(os.getenv("OPENAI_MAX_QUEUE", "32"))
+DEADLINE = float(os.getenv("CHAT_DEADLINE", "45"))            # sekundy, cała odpowiedź
+MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "3"))
+BACKOFF_BASE = float(os.getenv("OPENAI_BACKOFF_BASE", "0.5"))
+POOL_SIZE = int(os.getenv("OPENAI_POOL_SIZE", "20"))
+CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "5"))
+
+class UpstreamError(Exception):
+    """Błąd po stronie OpenAI / przeciążenie; status i Retry-After dla odpowiedzi HTTP."""
+    status = 503
+
+    def __init__(self, detail: str, retry_after: Optional[int] = None):
+        super().__init__(detail)
+        self.retry_after = retry_after
+
+
+class UpstreamBusy(UpstreamError):
+    status = 503
+
+
+class UpstreamRateLimited(UpstreamError):
+    status = 429
+
+
+class UpstreamTimeout(UpstreamError):
+    status = 504
+
+
+class Deadline:
+    def __init__(self, seconds: float = DEADLINE):
+        self.at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return self.at - time.monotonic()
+
+    def check(self) -> float:
+        left = self.remaining()
+        if left <= 0:
+            raise UpstreamTimeout("Przekroczono czas oczekiwania na odpowiedź modelu.")
+        return left
+
+
+class _Waiter:
+    """Czekający na slot: wątek (Event) albo korutyna (future swojej pętli)."""
+    __slots__ = ("event", "loop", "fut", "granted")
+
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.loop = loop
+        self.fut = loop.create_future() if loop is not None else None
+        self.event = threading.Event() if loop is None else None
+        self.granted = False
+
+    def wake(self) -> bool:
+        if self.loop is None:
+            self.event.set()
+            return True
+        try:
+            self.loop.call_soon_threadsafe(lambda f=self.fut: f.done() or f.set_result(None))
+        except RuntimeError:   # pętla już zamknięta – slot dostanie następny
+            return False
+        return True
+
+
+class Limiter:
+    """
+    Semafor z ograniczoną kolejką, wspólny dla ścieżki synchronicznej i async.
+    Czekający stoją w jednej kolejce FIFO, a zwolniony slot przechodzi wprost
+    na pierwszego z nich. Korutyny czekają na future w swojej pętli (bez wątku
+    z puli), a anulowanie usuwa je z kolejki albo oddaje slot, który zdążyły dostać.
+    """
+
+    def __init__(self, max_inflight: int = MAX_INFLIGHT, max_queue: int = MAX_QUEUE):
+        self.max_inflight = max_inflight
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self._waiters: Deque[_Waiter] = deque()
+        self.inflight = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.retries = 0
+        self._avg_hold = 2.0    # średni czas zajęcia slotu (EWMA), do Retry-After
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def retry_after(self) -> int:
+        return max(1, math.ceil(self._avg_hold * (self.waiting + 1) / self.max_inflight))
+
+    def full(self) -> bool:
+        return self.inflight >= self.max_inflight and self.waiting >= self.max_queue
+
+    def _enqueue(self, loop: Optional[asyncio.AbstractEventLoop] = None) -> Optional[_Waiter]:
+        """Zajmuje slot od razu (None) albo staje w kolejce (waiter); pełna kolejka – UpstreamBusy."""
+        with self._lock:
+            if self.inflight < self.max_inflight and not self._waiters:
+                self.inflight += 1
+                return None
+            if len(self._waiters) >= self.max_queue:
+                self.rejected += 1
+                raise UpstreamBusy("Serwer jest przeciążony, spróbuj ponownie za chwilę.", self.retry_after())
+            waiter = _Waiter(loop)
+            self._waiters.append(waiter)
+            return waiter
+
+    def _abandon(self, waiter: _Waiter) -> bool:
+        """Czekający rezygnuje; True = zdążył dostać slot i musi go oddać."""
+        with self._lock:
+            if waiter.granted:
+                return True
+            self._waiters.remove(waiter)
+            return False
+
+    def _busy(self) -> UpstreamBusy:
+        self.timeouts += 1
+        return UpstreamBusy("Serwer jest przeciążony, spróbuj ponownie za chwilę.", self.retry_after())
+
+    def acquire(self, deadline: Deadline):
+        waiter = self._enqueue()
+        if waiter is None:
+            return
+        waiter.event.wait(max(deadline.remaining(), 0))
+        if not self._abandon(waiter):
+            raise self._busy()
+
+    async def aacquire(self, deadline: Deadline):
+        waiter = self._enqueue(asyncio.get_running_loop())
+        if waiter is None:
+            return
+        try:
+            await asyncio.wait_for(waiter.fut, max(deadline.remaining(), 0))
+            return
+        except asyncio.TimeoutError:
+            if self._abandon(waiter):
+                return   # slot przyszedł razem z upływem czasu – bierzemy go
+            raise self._busy()
+        except asyncio.CancelledError:
+            if self._abandon(waiter):
+                self.release()
+            raise
+
+    def release(self, held: Optional[float] = None):
+        with self._lock:
+            if held is not None:
+                self._avg_hold = 0.9 * self._avg_hold + 0.1 * held
+            while self._waiters:
+                waiter = self._waiters.popleft()
+                waiter.granted = True
+                if waiter.wake():
+                    return       # slot przechodzi na czekającego – inflight bez zmian
+            self.inflight -= 1
+
+    @contextmanager
+    def slot(self, deadline: Deadline):
+        self.acquire(deadline)
+        t0 = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - t0)
+
+    @asynccontextmanager
+    async def aslot(self, deadline: Deadline):
+        await self.aacquire(deadline)
+        t0 = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - t0)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"inflight": self.inflight, "waiting": self.waiting, "max_inflight": self.max_inflight,
+                "max_queue": self.max_queue, "rejected": self.rejected, "timeouts": self.timeouts,
+                "retries": self.retries}
+
+
+limiter = Limiter()
+
+
+def _retryable() -> tuple:
+    # wyrażenie w except liczone jest dopiero przy wyjątku – openai jest już wtedy załadowane
+    import openai
+    return openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError
+
+
+def _retry_delay(exc: Exception, attempt: int) -> float:
+    response = getattr(exc, "response", None)
+    header = response.headers.get("retry-after") if response is not None else None
+    if header:
+        try:
+            return float(header)
+        except ValueError:
+            pass
+    return BACKOFF_BASE * (2 ** attempt) * random.uniform(0.5, 1.5)
+
+
+def _give_up(exc: Exception, delay: float) -> UpstreamError:
+    import openai
+    retry_after = max(1, math.ceil(delay))
+    if isinstance(exc, openai.RateLimitError):
+        return UpstreamRateLimited("Limit zapytań do modelu wyczerpany, spróbuj ponownie za chwilę.", retry_after)
+    if isinstance(exc, openai.APITimeoutError):
+        return UpstreamTimeout("Przekroczono czas oczekiwania na odpowiedź modelu.")
+    return UpstreamError("Model jest chwilowo niedostępny, spróbuj ponownie za chwilę.", retry_after)
+
+
+def _retry_after(e: Exception, attempt: int, deadline: Deadline) -> float:
+    """Przerwa przed kolejną próbą albo UpstreamError, gdy ponawiać już nie warto."""
+    delay = _retry_delay(e, attempt)
+    if attempt >= MAX_RETRIES or delay >= deadline.remaining():
+        raise _give_up(e, delay) from e
+    limiter.retries += 1
+    return delay
+
+
+def with_retries(call: Callable[[float], Any], deadline: Deadline) -> Any:
+    """
+    call(timeout) z ponowieniami w granicach deadline. Każda próba zajmuje
+    własny slot limitera – przerwa między próbami nie blokuje innych żądań.
+    """
+    attempt = 0
+    while True:
+        try:
+            with limiter.slot(deadline):
+                return call(deadline.check())
+        except _retryable() as e:
+            delay = _retry_after(e, attempt, deadline)
+        attempt += 1
+        time.sleep(delay)
+
+
+@asynccontextmanager
+async def astream(call: Callable[[float], Awaitable[Any]], deadline: Deadline):
+    """
+    Otwiera strumień await call(timeout) z ponowieniami jak with_retries. Slot
+    zajmuje każda próba osobno, a udana – aż do wyjścia z bloku (koniec strumienia).
+    """
+    attempt = 0
+    while True:
+        await limiter.aacquire(deadline)
+        t0 = time.monotonic()
+        try:
+            stream = await call(deadline.check())
+        except _retryable() as e:
+            limiter.release(time.monotonic() - t0)
+            delay = _retry_after(e, attempt, deadline)
+        except BaseException:
+            limiter.release(time.monotonic() - t0)
+            raise
+        else:
+            try:
+                yield stream
+            finally:
+                limiter.release(time.monotonic() - t0)
+            return
+        attempt += 1
+        await asyncio.sleep(delay)
+
+
+def _limits() -> httpx.Limits:
+    import httpx
+    return httpx.Limits(max_connections=POOL_SIZE, max_keepalive_connections=POOL_SIZE)
+
+
+def _timeout() -> httpx.Timeout:
+    import httpx
+    return httpx.Timeout(DEADLINE, connect=CONNECT_TIMEOUT)
+
+
+def http_client() -> httpx.Client:
+    import openai
+    return openai.DefaultHttpxClient(limits=_limits(), timeout=_timeout())
+
+
+def async_http_client() -> httpx.AsyncClient:
+    import openai
+    return openai.DefaultAsyncHttpxClient(limits=_limits(), timeout=_timeout())
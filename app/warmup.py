@@ -0,0 +1,179 @@
+# app/warmup.py
+"""
+Rozgrzewka workerów i raport czasu importu.
+
+Ciężkie zależności (pandas, rapidfuzz, SDK openai, jinja2) ładują się
+dopiero przy pierwszym użyciu, więc worker obsługujący tylko /api/ping czy
+wycenę startuje szybko. Żeby pierwsze zapytanie o KNR czy czat nie płaciło
+za to w trakcie żądania, rozgrzewka robi to przed przyjęciem ruchu.
+
+Kroki (WARMUP, po przecinku; pusty = bez rozgrzewki):
+- imports   – moduły używane przez KNR, czat i PDF (rapidfuzz, openai, jinja2),
+- rules     – reguły cenowe,
+- knr       – katalog KNR (snapshot, indeks n-gramów) + jedno próbne wyszukiwanie,
+- templates – szablon oferty (kompilacja, wersja do kluczy cache PDF),
+- openai    – klienci OpenAI z pulą połączeń,
+- pdf       – pula procesów PDF (export.warm_up()).
+
+warm_up() wykonuje wszystko w bieżącym procesie (start FastAPI, a w
+passenger_wsgi.py – każdy worker Passengera importuje go sam).
+prefork() jest dla serwerów, które ładują aplikację raz i forkują workery
+(WARMUP_PREFORK=1): kroki bezpieczne przed fork() robi w procesie nadrzędnym –
+strony modułów i katalogu są potem współdzielone copy-on-write – a openai
+i pdf odkłada do każdego workera zaraz po fork().
+
+Raport: python -m app.warmup [moduł ...]
+"""
+from __future__ import annotations
+import gc
+import os
+import sys
+import time
+import traceback
+from typing import Callable, Dict, Iterable, List, Optional
+
+STEPS_ENV = os.getenv("WARMUP", "imports,rules,knr,templates,openai,pdf")
+# kroki, które tworzą wątki, połączenia lub procesy – tylko po fork()
+_POST_FORK = ("openai", "pdf")
+
+
+def _imports():
+    import rapidfuzz.fuzz  # noqa: F401
+    import rapidfuzz.process  # noqa: F401
+    import openai  # noqa: F401
+    import jinja2  # noqa: F401
+
+
+def _rules():
+    from app.rules import rules
+    rules()
+
+
+def _knr():
+    from app import knr
+    cat = knr._load_knr()
+    knr._rank(cat, "malowanie ścian", 1)
+
+
+def _templates():
+    from jinja2 import Environment, FileSystemLoader, select_autoescape
+    from app.services import export
+    env = Environment(loader=FileSystemLoader(str(export.TEMPLATES_DIR)),
+                      autoescape=select_autoescape(["html", "xml"]))
+    env.get_template(export.TEMPLATE_NAME)
+    export.template_version()
+
+
+def _openai():
+    from app import chat_agent
+    chat_agent.openai_client()
+    chat_agent.openai_aclient()
+
+
+def _pdf():
+    from app.services import export
+    export.warm_up()
+
+
+STEPS: Dict[str, Callable[[], None]] = {
+    "imports": _imports,
+    "rules": _rules,
+    "knr": _knr,
+    "templates": _templates,
+    "openai": _openai,
+    "pdf": _pdf,
+}
+
+last_report: Dict[str, object] = {}
+
+
+def configured_steps() -> List[str]:
+    return [s.strip() for s in STEPS_ENV.split(",") if s.strip()]
+
+
+def warm_up(steps: Optional[Iterable[str]] = None) -> Dict[str, object]:
+    """
+    Wykonuje kroki rozgrzewki; błąd kroku (np. brak pliku KNR) jest wypisywany
+    i nie zatrzymuje startu. Zwraca {krok: ms albo 'błąd: ...'}.
+    """
+    report: Dict[str, object] = {}
+    for name in configured_steps() if steps is None else steps:
+        fn = STEPS.get(name)
+        if fn is None:
+            report[name] = "nieznany krok"
+            continue
+        t0 = time.perf_counter()
+        try:
+            fn()
+            report[name] = round((time.perf_counter() - t0) * 1000, 1)
+        except Exception as e:
+            report[name] = f"błąd: {type(e).__name__}: {e}"
+            print(f"=== ROZGRZEWKA: krok '{name}' nieudany (start bez niego) ===")
+            traceback.print_exc()
+    last_report.update(report)
+    print(f"=== ROZGRZEWKA (pid {os.getpid()}): {report} ===")
+    return report
+
+
+_forked_steps: List[str] = []
+
+
+def _after_fork():
+    if _forked_steps:
+        warm_up(_forked_steps)
+
+
+def prefork() -> Dict[str, object]:
+    """
+    Rozgrzewka w procesie nadrzędnym przed fork(). Po niej gc.freeze():
+    obiekty z rozgrzewki nie są skanowane przez GC, więc jego przebiegi
+    w workerach nie kopiują współdzielonych stron.
+    """
+    steps = configured_steps()
+    before = [s for s in steps if s not in _POST_FORK]
+    _forked_steps[:] = [s for s in steps if s in _POST_FORK]
+    report = warm_up(before)
+    if _forked_steps:
+        os.register_at_fork(after_in_child=_after_fork)
+    gc.freeze()
+    return report
+
+
+# ====== Raport czasu importu ======
+
+def import_report(module: str, top: int = 25) -> List[Dict[str, object]]:
+    """
+    Importuje `module` w czystym interpreterze z -X importtime i zwraca
+    najdroższe moduły (czas łączny z zależnościami i własny, ms).
+    """
+    import subprocess
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=root + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          capture_output=True, text=True, cwd=root, env=env)
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append({"module": name.strip(), "depth": depth,
+                     "cumulative_ms": int(cumulative_us) / 1000, "self_ms": int(self_us) / 1000})
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "import nieudany")
+    rows.sort(key=lambda r: -r["cumulative_ms"])
+    return rows[:top]
+
+
+def main(argv: Optional[List[str]] = None):
+    modules = (argv if argv is not None else sys.argv[1:]) or ["app.main"]
+    for module in modules:
+        rows = import_report(module)
+        total = rows[0]["cumulative_ms"] if rows else 0
+        print(f"\n{module}: {total:.0f} ms")
+        for r in rows:
+            print(f"  {r['cumulative_ms']:8.1f} ms  (własny {r['self_ms']:6.1f})  {'  ' * r['depth']}{r['module']}")
+
+
+if __name__ == "__main__":
+    main()
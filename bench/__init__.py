@@ -0,0 +1,12 @@
+"""
+Mikrobenchmarki gorących ścieżek: wycena, wyszukiwanie KNR, limity dzienne,
+dziennik leadów, eksport i pętla czatu (z podstawionym transportem OpenAI).
+
+    python -m bench.data                       # jednorazowo: dane syntetyczne
+    python -m bench.run                        # pomiar -> bench/results/<czas>.json
+    python -m bench.run --save-baseline        # zapisz wynik jako bench/baseline.json
+    python -m bench.run --baseline bench/baseline.json   # porównaj, kod 1 przy regresji
+
+Dane (katalogi KNR 1k/10k/100k pozycji, plik limitów, dziennik leadów)
+powstają deterministycznie (stałe ziarno) w BENCH_DATA_DIR, domyślnie bench/_data.
+"""
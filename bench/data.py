@@ -0,0 +1,158 @@
+"""
+Syntetyczne dane do benchmarków (deterministyczne – stałe ziarno).
+
+- katalog KNR w formacie jak data/knr.xlsx (kolumny z app.knr.COLUMN_MAP),
+- plik limitów (QuotaStore) z wypełnionymi slotami klientów,
+- dziennik leadów (segmenty JSONL jak z app.main.offer_estimate).
+
+Raz wygenerowane pliki są używane ponownie (kompilacja snapshotu KNR dla
+100k pozycji trwa kilkadziesiąt sekund – płacimy ją tylko raz).
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import random
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import List
+
+DATA_DIR = Path(os.getenv("BENCH_DATA_DIR", Path(__file__).resolve().parent / "_data"))
+SEED = 20261018
+KNR_SIZES = (1_000, 10_000, 100_000)
+QUOTA_CLIENTS = 20_000
+LEADS_COUNT = 100_000
+LEADS_DAYS = 60
+
+_VERBS = ["Malowanie", "Gruntowanie", "Tynkowanie", "Szpachlowanie", "Układanie", "Montaż", "Demontaż",
+          "Rozebranie", "Wykonanie", "Licowanie", "Izolacja", "Ocieplenie", "Obsadzenie", "Wymiana",
+          "Czyszczenie", "Uzupełnienie", "Naprawa", "Przygotowanie"]
+_OBJECTS = ["ścian", "sufitów", "posadzek", "płytek ceramicznych", "paneli podłogowych", "wykładziny PCW",
+            "tynków cementowo-wapiennych", "gładzi gipsowej", "płyt gipsowo-kartonowych", "ościeżnic",
+            "drzwi wewnętrznych", "okien PCV", "parapetów", "rur PVC", "przewodów elektrycznych",
+            "gniazd wtykowych", "grzejników", "stropów", "schodów", "balustrad", "listew przypodłogowych",
+            "rynien", "kominów", "fundamentów", "ścianek działowych", "wylewki samopoziomującej"]
+_MODIFIERS = ["dwukrotne", "jednokrotne", "farbą emulsyjną", "farbą akrylową", "na kleju", "na zaprawie",
+              "z materiałów rozbiórkowych", "w pomieszczeniach mokrych", "na podłożu betonowym",
+              "na podłożu drewnianym", "z wywozem gruzu", "ręcznie", "mechanicznie", "z rusztowania",
+              "wewnątrz budynku", "na zewnątrz budynku", "w budynkach mieszkalnych"]
+_UNITS = ["m2", "m2", "m2", "m", "szt.", "m3", "kg", "t"]
+
+
+def _knr_name(rnd: random.Random) -> str:
+    parts = [rnd.choice(_VERBS), rnd.choice(_OBJECTS)]
+    for m in rnd.sample(_MODIFIERS, rnd.randint(1, 2)):
+        parts.append(m)
+    r = rnd.random()
+    if r < 0.3:
+        parts.append(f"o grubości {rnd.choice([5, 8, 10, 12, 15, 20, 25])} mm")
+    elif r < 0.5:
+        parts.append(f"w pomieszczeniach o pow. do {rnd.choice([5, 8, 10, 20])} m2")
+    elif r < 0.6:
+        parts.append(f"wysokość do {rnd.choice(['3,5', '4,5', '6'])} m")
+    return " ".join(parts)
+
+
+def knr_path(rows: int) -> Path:
+    return DATA_DIR / f"knr-{rows}" / "knr.xlsx"
+
+
+def make_knr(rows: int) -> Path:
+    """Arkusz KNR z `rows` pozycjami (openpyxl write-only, żeby 100k wierszy nie trzymać w pamięci)."""
+    path = knr_path(rows)
+    if path.exists():
+        return path
+    from openpyxl import Workbook
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    rnd = random.Random(SEED + rows)
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("KNR")
+    ws.append(["kod", "nazwa", "jednostka", "R", "M", "S", "Cena_jedn"])
+    for i in range(rows):
+        kod = f"KNR {rnd.randint(2, 4)}-{rnd.randint(1, 40):02d} {i // 20 + 100:04d}-{i % 20 + 1:02d}"
+        r, m, s = round(rnd.uniform(0.05, 12), 4), round(rnd.uniform(0, 80), 2), round(rnd.uniform(0, 9), 2)
+        ws.append([kod, _knr_name(rnd), rnd.choice(_UNITS), r, m, s, round(r * 45 + m + s, 2)])
+    tmp = path.with_suffix(".tmp.xlsx")
+    wb.save(tmp)
+    os.replace(tmp, path)
+    return path
+
+
+def knr_queries(names: List[str], n: int, seed: int = SEED) -> List[str]:
+    """Zapytania jak od użytkownika: fragment nazwy pozycji, bez jednego słowa, małymi literami."""
+    rnd = random.Random(seed)
+    out = []
+    for name in rnd.sample(names, min(n, len(names))):
+        words = name.split()
+        if len(words) > 2:
+            words.pop(rnd.randrange(len(words)))
+        out.append(" ".join(words[:4]).lower())
+    return out
+
+
+def knr_sources(names: List[str], n: int, seed: int = SEED) -> List[str]:
+    """Nazwy pozycji, z których knr_queries (ten sam seed) zrobiło zapytania – w tej samej kolejności."""
+    return random.Random(seed).sample(names, min(n, len(names)))
+
+
+def make_quota(directory: Path, clients: int = QUOTA_CLIENTS):
+    """Plik limitów z `clients` zajętymi slotami (dzisiejsze wpisy, jak po dniu ruchu)."""
+    from app.quota_store import QuotaStore
+
+    directory.mkdir(parents=True, exist_ok=True)
+    store = QuotaStore(directory / "quota.bin", directory / "quota.lock")
+    today = date.today()
+    for i in range(clients):
+        store.consume(f"client-{i:06d}", today)
+    return store
+
+
+def leads_dir(count: int = LEADS_COUNT) -> Path:
+    return DATA_DIR / f"leads-{count}"
+
+
+def make_leads(count: int = LEADS_COUNT, days: int = LEADS_DAYS) -> Path:
+    """Dziennik leadów: `count` rekordów rozłożonych na `days` dni (jeden segment na dzień)."""
+    d = leads_dir(count)
+    if d.exists() and any(d.glob("leads-*.jsonl")):
+        return d
+    d.mkdir(parents=True, exist_ok=True)
+    rnd = random.Random(SEED + count)
+    start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=days)
+    per_day = count // days
+    scopes = ["malowanie ścian", "remont łazienki", "układanie podłogi", "remont kuchni",
+              "remont kompleksowy mieszkania", "malowanie i podłogi"]
+    for day in range(days):
+        t0 = start + timedelta(days=day)
+        n = per_day if day < days - 1 else count - per_day * (days - 1)
+        lines = []
+        for k in range(n):
+            area = round(rnd.uniform(15, 140), 1)
+            lines.append(json.dumps({
+                "client_id": f"client-{rnd.randrange(QUOTA_CLIENTS):06d}",
+                "created_at": (t0 + timedelta(seconds=k * 86400 // max(n, 1))).isoformat(),
+                "scope": rnd.choice(scopes),
+                "area_m2": area,
+                "standard": rnd.choice(["ekonomiczny", "standard", "premium"]),
+                "location": rnd.choice(["Kraków", "Wieliczka", "Skawina", "Niepołomice"]),
+                "deadline": rnd.choice([None, "lipiec", "do końca roku"]),
+                "estimate_total": int(area * rnd.uniform(50, 2000)),
+                "rules_version": "2026.10.2",
+            }, ensure_ascii=False))
+        (d / f"leads-{t0:%Y%m%d}-0001.jsonl").write_text("\n".join(lines) + "\n", "utf-8")
+    return d
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Generuje dane syntetyczne do benchmarków.")
+    ap.add_argument("--sizes", default=",".join(map(str, KNR_SIZES)), help="rozmiary katalogów KNR")
+    ap.add_argument("--leads", type=int, default=LEADS_COUNT)
+    args = ap.parse_args()
+    for rows in (int(s) for s in args.sizes.split(",") if s):
+        print(f"KNR {rows}: {make_knr(rows)}")
+    print(f"leady {args.leads}: {make_leads(args.leads)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Podstawiony transport HTTP dla klienta OpenAI – run_chat_agent przechodzi
+całą ścieżkę SDK (serializacja, parsowanie odpowiedzi, limiter, ponowienia),
+ale bez sieci i bez kosztów.
+
+Scenariusz jak w typowej rozmowie: pierwsza runda zwraca wywołania narzędzi
+(estimate_offer + get_knr_rate), po wynikach narzędzi – odpowiedź tekstową.
+Opcjonalne `latency` symuluje czas odpowiedzi modelu.
+"""
+from __future__ import annotations
+import itertools
+import json
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+FINAL_REPLY = (
+    "Orientacyjnie remont łazienki 6 m² w bloku to 25–35 tys. zł netto z materiałami. "
+    "Pozycje KNR: skucie płytek, hydroizolacja, licowanie ścian płytkami."
+)
+
+
+class FakeOpenAI:
+    def __init__(self, knr_queries: Optional[List[str]] = None, latency: float = 0.0):
+        self.knr_queries = knr_queries or ["licowanie ścian płytkami", "malowanie sufitów"]
+        self.latency = latency
+        self.calls = 0
+        self._ids = itertools.count(1)
+
+    def _message(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        last = body["messages"][-1]
+        if body.get("tools") and last["role"] == "user":
+            calls = [
+                ("estimate_offer", {"area_m2": 6, "standard": "blok"}),
+                ("get_knr_rate", {"pozycje": [{"query": q, "ilosc": 6} for q in self.knr_queries]}),
+            ]
+            return {"role": "assistant", "content": None, "tool_calls": [
+                {"id": f"call_{next(self._ids)}", "type": "function",
+                 "function": {"name": name, "arguments": json.dumps(args, ensure_ascii=False)}}
+                for name, args in calls
+            ]}
+        return {"role": "assistant", "content": FINAL_REPLY}
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        body = json.loads(request.content)
+        msg = self._message(body)
+        return httpx.Response(200, json={
+            "id": f"chatcmpl-bench-{self.calls}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body["model"],
+            "choices": [{"index": 0, "message": msg,
+                         "finish_reason": "tool_calls" if msg.get("tool_calls") else "stop"}],
+            "usage": {"prompt_tokens": 900, "completion_tokens": 60, "total_tokens": 960},
+        })
+
+    def client(self):
+        from openai import OpenAI
+        return OpenAI(api_key="bench", max_retries=0,
+                      http_client=httpx.Client(transport=httpx.MockTransport(self.handler)))
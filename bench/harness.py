@@ -0,0 +1,104 @@
+"""
+Pomiar pojedynczej funkcji i porównanie z wynikiem bazowym.
+
+measure() robi dwa przebiegi:
+- czasowy: każde wywołanie osobno (perf_counter_ns) -> rozkład opóźnień
+  (min/p50/p90/p99/max/średnia) i przepustowość,
+- alokacyjny (tracemalloc, wolniejszy, więc krótszy): szczyt pamięci
+  zaalokowanej w trakcie jednego wywołania i pamięć, która po nim została.
+"""
+from __future__ import annotations
+import gc
+import math
+import statistics
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional
+
+
+def _pct(sorted_vals: List[float], q: float) -> float:
+    return sorted_vals[min(int(len(sorted_vals) * q), len(sorted_vals) - 1)]
+
+
+def measure(fn: Callable[[], Any], repeat: int, warmup: int = 3, items: int = 1,
+            alloc_repeat: Optional[int] = None, max_seconds: float = 20.0) -> Dict[str, Any]:
+    """
+    fn – wywołanie bez argumentów; items – ile jednostek pracy robi jedno
+    wywołanie (np. wierszy w paczce), do przepustowości items/s.
+    Przebieg czasowy kończy się po `repeat` wywołaniach albo po max_seconds.
+    """
+    for _ in range(warmup):
+        fn()
+    gc.collect()
+
+    lat: List[float] = []
+    budget = time.perf_counter() + max_seconds
+    for _ in range(repeat):
+        t0 = time.perf_counter_ns()
+        fn()
+        lat.append((time.perf_counter_ns() - t0) / 1000)   # µs
+        if time.perf_counter() > budget:
+            break
+    lat.sort()
+    mean = statistics.fmean(lat)
+
+    peaks, retained = [], 0
+    n_alloc = min(alloc_repeat if alloc_repeat is not None else max(len(lat) // 10, 3), len(lat))
+    gc.collect()
+    tracemalloc.start()
+    try:
+        start, _ = tracemalloc.get_traced_memory()
+        for _ in range(n_alloc):
+            before, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            fn()
+            _, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - before)
+        gc.collect()
+        retained = tracemalloc.get_traced_memory()[0] - start
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "n": len(lat),
+        "items": items,
+        "min_us": round(lat[0], 2),
+        "p50_us": round(_pct(lat, 0.5), 2),
+        "p90_us": round(_pct(lat, 0.9), 2),
+        "p99_us": round(_pct(lat, 0.99), 2),
+        "max_us": round(lat[-1], 2),
+        "mean_us": round(mean, 2),
+        "stdev_us": round(statistics.stdev(lat), 2) if len(lat) > 1 else 0.0,
+        "ops_per_s": round(1e6 / mean, 1) if mean else math.inf,
+        "items_per_s": round(items * 1e6 / mean, 1) if mean else math.inf,
+        "alloc_peak_kb": round(statistics.median(peaks) / 1024, 1) if peaks else None,
+        "alloc_retained_kb": round(retained / 1024 / max(n_alloc, 1), 2) if peaks else None,
+    }
+
+
+def compare(current: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]],
+            threshold: float = 0.2, alloc_threshold: float = 0.25) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Porównanie po p50 (mniej wrażliwe na pojedyncze przestoje niż średnia)
+    i po szczycie alokacji. Regresja = gorzej o więcej niż próg.
+    """
+    out: Dict[str, List[Dict[str, Any]]] = {"regressions": [], "improvements": [], "missing": []}
+    for name, base in baseline.items():
+        cur = current.get(name)
+        if cur is None:
+            out["missing"].append({"name": name})
+            continue
+        checks = [("p50_us", threshold)]
+        if base.get("alloc_peak_kb") and cur.get("alloc_peak_kb") is not None:
+            checks.append(("alloc_peak_kb", alloc_threshold))
+        for metric, limit in checks:
+            if not base.get(metric):
+                continue
+            ratio = cur[metric] / base[metric]
+            row = {"name": name, "metric": metric, "baseline": base[metric], "current": cur[metric],
+                   "change": round(ratio - 1, 3)}
+            if ratio > 1 + limit:
+                out["regressions"].append(row)
+            elif ratio < 1 - limit:
+                out["improvements"].append(row)
+    return out
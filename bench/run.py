@@ -0,0 +1,363 @@
+"""
+Uruchamia benchmarki i zapisuje wynik jako JSON (bench/results/<czas>.json).
+
+    python -m bench.run [--sizes 1000,10000,100000] [--only knr,quota] [--quick]
+                        [--baseline bench/baseline.json] [--threshold 0.2]
+                        [--save-baseline] [--out plik.json] [--list]
+
+Z --baseline porównuje p50 i szczyt alokacji każdego przypadku z wynikiem
+bazowym; gdy któryś jest gorszy o więcej niż próg – kod wyjścia 1.
+"""
+from __future__ import annotations
+import os
+import tempfile
+
+# Przed importem modułów aplikacji: bez wątku obserwującego KNR, bez cache
+# odpowiedzi modelu (każda runda ma przejść przez transport), bez audytu;
+# metryki liczone jak w produkcji, ale migawki poza katalogiem aplikacji.
+os.environ.setdefault("KNR_WATCH_INTERVAL", "0")
+os.environ.setdefault("CHAT_CACHE_ENABLED", "0")
+os.environ.setdefault("AUDIT_ENABLED", "0")
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+os.environ.setdefault("METRICS_DIR", os.path.join(tempfile.gettempdir(), "ollbud-bench-metrics"))
+
+import argparse
+import atexit
+import functools
+import itertools
+import json
+import platform
+import random
+import shutil
+import subprocess
+import sys
+from dataclasses import dataclass
+from datetime import datetime
+from importlib import metadata
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from bench import data
+from bench.harness import compare, measure
+
+ROOT = Path(__file__).resolve().parent
+RESULTS_DIR = ROOT / "results"
+BASELINE = ROOT / "baseline.json"
+_TMP = Path(tempfile.mkdtemp(prefix="ollbud-bench-"))
+atexit.register(shutil.rmtree, _TMP, ignore_errors=True)
+
+
+@dataclass
+class Case:
+    name: str
+    build: Callable[[], Callable[[], Any]]   # przygotowanie (leniwe) -> mierzona funkcja
+    repeat: int = 2000
+    items: int = 1
+    warmup: int = 3
+
+
+# ====== Wycena i eksport ======
+
+def pricing_cases() -> List[Case]:
+    from app import pricing, schemas
+    from app.rules import rules
+    from app.services import export
+
+    rnd = random.Random(data.SEED)
+    n = 10_000
+    areas = [round(rnd.uniform(10, 400), 1) for _ in range(n)]
+    stds = [rnd.choice(["blok", "kamienica", "deweloperski", "budowa domu"]) for _ in range(n)]
+    summary = {"scope": "remont łazienki i malowanie", "area_m2": 48, "standard": "premium",
+               "location": "Kraków", "deadline": "wrzesień"}
+    pricing_out = rules().estimate_scope(summary["scope"], 48, "premium", "Kraków")
+    txt_req = schemas.ExportRequest(client_id="bench", summary=summary, pricing=pricing_out)
+    return [
+        Case("pricing.estimate_offer", lambda: lambda: pricing.estimate_offer(55.0, "kamienica"), 20_000),
+        Case(f"pricing.estimate_offer_batch[{n}]",
+             lambda: lambda: pricing.estimate_offer_batch(areas, stds), 50, items=n),
+        Case("rules.estimate_scope",
+             lambda: lambda: rules().estimate_scope("malowanie ścian i podłogi w kuchni", 48, "premium",
+                                                    "Wieliczka"), 20_000),
+        Case("export.render_offer_txt", lambda: lambda: export.render_offer_txt(txt_req), 20_000),
+        Case("export.offer_key", lambda: lambda: export.offer_key(summary, pricing_out), 5_000),
+    ]
+
+
+# ====== KNR ======
+
+def _activate_knr(rows: int):
+    """Ustawia syntetyczny katalog `rows` jako aktywny (kompiluje snapshot przy pierwszym użyciu)."""
+    from app import knr
+
+    path = data.make_knr(rows)
+    if knr.KNR_PATH != str(path) or knr._KNR is None:
+        knr.KNR_PATH = str(path)
+        knr.KNR_SNAPSHOT_DIR = str(path.parent / ".knr_snapshot")
+        knr._swap(knr._build_catalog())
+    return knr
+
+
+@functools.lru_cache(maxsize=None)
+def _queries(rows: int) -> List[str]:
+    knr = _activate_knr(rows)
+    return data.knr_queries(knr._load_knr().nazwa, 500)
+
+
+def knr_cases(rows: int) -> List[Case]:
+    def cold():
+        knr = _activate_knr(rows)
+        qs = itertools.cycle(_queries(rows))
+
+        def fn():
+            knr._RESULT_CACHE.clear()
+            return knr.find_knr_items(next(qs), top_n=5, ilosc=12.5)
+        return fn
+
+    def scoped():
+        knr = _activate_knr(rows)
+        cat = knr._load_knr()
+        # filtr jak z szybkiej ścieżki: katalog i jednostka pozycji, z której powstało zapytanie
+        by_name = {n: i for i, n in enumerate(cat.nazwa)}
+        qs = itertools.cycle([(q, cat.katalog(by_name[n]), cat.jednostka(by_name[n]))
+                              for q, n in zip(_queries(rows), data.knr_sources(cat.nazwa, 500))])
+
+        def fn():
+            knr._RESULT_CACHE.clear()
+            q, katalog, jednostka = next(qs)
+            return knr.find_knr_items(q, top_n=5, ilosc=12.5, katalog=katalog, jednostka=jednostka)
+        return fn
+
+    def warm():
+        knr = _activate_knr(rows)
+        qs = _queries(rows)[:100]
+        for q in qs:
+            knr.find_knr_items(q, top_n=5)
+        it = itertools.cycle(qs)
+        return lambda: knr.find_knr_items(next(it), top_n=5, ilosc=12.5)
+
+    def many():
+        knr = _activate_knr(rows)
+        qs = _queries(rows)
+        batches = itertools.cycle([qs[i:i + 10] for i in range(0, len(qs), 10)])
+
+        def fn():
+            knr._RESULT_CACHE.clear()
+            return knr.find_knr_items_many(next(batches), [12.5] * 10)
+        return fn
+
+    def load():
+        knr = _activate_knr(rows)
+        return knr._build_catalog
+
+    def bill():
+        from app.services import kosztorys
+
+        knr = _activate_knr(rows)
+        cat = knr._load_knr()
+        # 400 opisów + 100 kodów, jak lista pozycji od klienta
+        codes = [cat.kod(i) for i in range(0, rows, max(rows // 100, 1))][:100]
+        positions = [(q, 12.5) for q in _queries(rows)[:400]] + [(c, 3.0) for c in codes]
+
+        def fn():
+            knr._RESULT_CACHE.clear()
+            return kosztorys.price_bill(positions, "blok", 60.0)
+        return fn
+
+    repeat = 300 if rows >= 100_000 else 1000
+    return [
+        Case(f"knr[{rows}].load_snapshot", load, 20),
+        Case(f"knr[{rows}].find_knr_items.cold", cold, repeat),
+        Case(f"knr[{rows}].find_knr_items.scoped.cold", scoped, repeat),
+        Case(f"knr[{rows}].find_knr_items.warm", warm, 20_000),
+        Case(f"knr[{rows}].find_knr_items_many[10].cold", many, max(repeat // 10, 20), items=10),
+        Case(f"knr[{rows}].kosztorys[500].cold", bill, 20, items=500),
+    ]
+
+
+# ====== Limity dzienne ======
+
+def quota_cases() -> List[Case]:
+    @functools.lru_cache(maxsize=None)
+    def setup():
+        from app import storage
+        storage._quota = data.make_quota(_TMP / "quota")
+        return storage
+
+    def ids(new_ratio: float):
+        rnd = random.Random(data.SEED)
+        fresh = itertools.count()
+
+        def next_id():
+            if rnd.random() < new_ratio:
+                return f"new-{next(fresh):06d}"
+            return f"client-{rnd.randrange(data.QUOTA_CLIENTS):06d}"
+        return next_id
+
+    def consume():
+        app, next_id = setup(), ids(0.1)
+        return lambda: app.quota_consume_impl(next_id())
+
+    def check():
+        app, next_id = setup(), ids(0.0)
+        return lambda: app.quota_check_impl(next_id())
+
+    return [
+        Case(f"quota.consume_impl[{data.QUOTA_CLIENTS}]", consume, 10_000),
+        Case(f"quota.check_impl[{data.QUOTA_CLIENTS}]", check, 10_000),
+    ]
+
+
+# ====== Leady ======
+
+def leads_cases() -> List[Case]:
+    from app.leads_journal import LeadsJournal
+    from app.services import leads_export
+
+    record = {"client_id": "client-000001", "created_at": datetime.utcnow().isoformat(),
+              "scope": "remont łazienki", "area_m2": 6, "standard": "standard", "location": "Kraków",
+              "deadline": None, "estimate_total": 12000, "rules_version": "2026.10.2"}
+    batch = 100
+
+    def append():
+        journal = LeadsJournal(_TMP / "leads-append")
+
+        def fn():
+            for _ in range(batch):
+                journal.append(record)
+            journal.flush()
+        return fn
+
+    def scan():
+        journal = LeadsJournal(data.make_leads())
+        return lambda: sum(1 for _ in journal.iter_leads())
+
+    def export_day():
+        journal = LeadsJournal(data.make_leads())
+        day = datetime.strptime(journal.segments()[len(journal.segments()) // 2].name[6:14], "%Y%m%d").date()
+        flt = leads_export.LeadFilter(day, day)
+        return lambda: sum(len(c) for c in leads_export.export_leads(journal, flt, "csv"))
+
+    return [
+        Case(f"leads.append_flush[{batch}]", append, 200, items=batch),
+        Case(f"leads.iter_leads[{data.LEADS_COUNT}]", scan, 5, items=data.LEADS_COUNT, warmup=1),
+        Case("leads.export_csv[1 dzień]", export_day, 50),
+    ]
+
+
+# ====== Czat (podstawiony transport OpenAI) ======
+
+def chat_cases(rows: int) -> List[Case]:
+    from bench.fake_openai import FakeOpenAI
+
+    @functools.lru_cache(maxsize=None)
+    def setup():
+        _activate_knr(rows)
+        from app import chat_agent
+        fake = FakeOpenAI(_queries(rows)[:2])
+        chat_agent.client = fake.client()
+        return chat_agent
+
+    def model_round():
+        agent = setup()
+        history = [agent.ChatTurn(role="user", content="Ile kosztuje remont łazienki 6 m2 w bloku?")]
+        return lambda: agent.run_chat_agent(history)
+
+    def fast():
+        agent = setup()
+        history = [agent.ChatTurn(role="user", content="blok 55 m2")]
+        return lambda: agent.run_chat_agent(history)
+
+    return [
+        Case("chat.run_chat_agent[2 rundy, narzędzia]", model_round, 500),
+        Case("chat.run_chat_agent[szybka ścieżka]", fast, 5_000),
+    ]
+
+
+# ====== Uruchomienie ======
+
+def all_cases(sizes: List[int]) -> List[Case]:
+    cases = pricing_cases()
+    for rows in sizes:
+        cases += knr_cases(rows)
+    cases += quota_cases() + leads_cases() + chat_cases(sizes[len(sizes) // 2] if sizes else 1000)
+    return cases
+
+
+def _meta(args) -> Dict[str, Any]:
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT.parent,
+                             capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        rev = None
+    versions = {}
+    for pkg in ("numpy", "pandas", "rapidfuzz", "openai", "openpyxl"):
+        try:
+            versions[pkg] = metadata.version(pkg)
+        except metadata.PackageNotFoundError:
+            versions[pkg] = None
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "git": rev,
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "packages": versions,
+        "args": vars(args),
+    }
+
+
+def _print_row(name: str, r: Dict[str, Any]):
+    print(f"{name:<48} p50 {r['p50_us']:>11.1f} µs  p99 {r['p99_us']:>11.1f} µs  "
+          f"{r['items_per_s']:>12.1f} /s  alloc {r['alloc_peak_kb'] or 0:>9.1f} KB")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Benchmarki gorących ścieżek OLLBUD.")
+    ap.add_argument("--sizes", default=",".join(map(str, data.KNR_SIZES)), help="rozmiary katalogów KNR")
+    ap.add_argument("--only", default="", help="fragmenty nazw przypadków, po przecinku")
+    ap.add_argument("--quick", action="store_true", help="10x mniej powtórzeń")
+    ap.add_argument("--out", help="plik wyniku (domyślnie bench/results/<czas>.json)")
+    ap.add_argument("--baseline", help="wynik bazowy do porównania")
+    ap.add_argument("--threshold", type=float, default=0.2, help="dopuszczalne pogorszenie p50 (0.2 = 20%%)")
+    ap.add_argument("--save-baseline", action="store_true", help=f"zapisz wynik także jako {BASELINE}")
+    ap.add_argument("--list", action="store_true", help="tylko wypisz przypadki")
+    args = ap.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    only = [s for s in args.only.split(",") if s]
+    cases = [c for c in all_cases(sizes) if not only or any(p in c.name for p in only)]
+    if args.list:
+        print("\n".join(c.name for c in cases))
+        return 0
+
+    results: Dict[str, Dict[str, Any]] = {}
+    for case in cases:
+        fn = case.build()
+        repeat = max(case.repeat // 10, 5) if args.quick else case.repeat
+        results[case.name] = r = measure(fn, repeat, warmup=case.warmup, items=case.items)
+        _print_row(case.name, r)
+
+    doc = {"meta": _meta(args), "results": results}
+    out = Path(args.out) if args.out else RESULTS_DIR / f"{datetime.now():%Y%m%d-%H%M%S}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(doc, ensure_ascii=False, indent=2), "utf-8")
+    print(f"\nwynik: {out}")
+    if args.save_baseline:
+        BASELINE.write_text(json.dumps(doc, ensure_ascii=False, indent=2), "utf-8")
+        print(f"baseline: {BASELINE}")
+
+    if not args.baseline:
+        return 0
+    base = json.loads(Path(args.baseline).read_text("utf-8"))
+    diff = compare(results, base["results"], args.threshold)
+    doc["comparison"] = {"baseline": args.baseline, "baseline_meta": base.get("meta"), **diff}
+    out.write_text(json.dumps(doc, ensure_ascii=False, indent=2), "utf-8")
+    for kind in ("improvements", "regressions"):
+        for row in diff[kind]:
+            print(f"{'REGRESJA ' if kind == 'regressions' else 'poprawa  '} {row['name']:<48} {row['metric']:<14} "
+                  f"{row['baseline']} -> {row['current']} ({row['change']:+.0%})")
+    return 1 if diff["regressions"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
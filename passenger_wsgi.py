@@ -2,4 +2,11 @@ import os, sys
 BASE_DIR = os.path.dirname(__file__)
 sys.path.insert(0, BASE_DIR)
 
-from wsgi_app import application  # Flask WSGI app
+from wsgi_app import application  # app/main.py przez a2wsgi
+from app import warmup
+
+# Rozgrzewka przed przyjęciem ruchu (kroki: WARMUP, patrz app/warmup.py)
+if os.getenv("WARMUP_PREFORK", "0") == "1":
+    warmup.prefork()
+else:
+    warmup.warm_up()
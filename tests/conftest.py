@@ -0,0 +1,14 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# przed importem app.*: metryki, sesje czatu i cache PDF w katalogu tymczasowym,
+# bez wątku obserwującego plik KNR
+_TMP = Path(tempfile.mkdtemp(prefix="ollbud-tests-"))
+os.environ.setdefault("METRICS_DIR", str(_TMP / "metrics"))
+os.environ.setdefault("CHAT_SESSIONS_DB", str(_TMP / "chat_sessions.db"))
+os.environ.setdefault("PDF_CACHE_DIR", str(_TMP / "pdf_cache"))
+os.environ.setdefault("KNR_WATCH_INTERVAL", "0")
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
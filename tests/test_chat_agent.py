@@ -0,0 +1,43 @@
+import pytest
+
+from app import chat_agent, knr
+
+
+@pytest.fixture
+def loads(monkeypatch):
+    """Wywołania _load_knr – klucz cache nie może wczytywać (kompilować) katalogu."""
+    calls = []
+
+    def load():
+        calls.append(1)
+        raise FileNotFoundError("katalog nie powinien być wczytywany")
+
+    monkeypatch.setattr(knr, "_load_knr", load)
+    return calls
+
+
+def test_cache_key_does_not_load_catalogue(tmp_path, monkeypatch, loads):
+    monkeypatch.setattr(knr, "_KNR", None)
+    monkeypatch.setattr(knr, "KNR_PATH", str(tmp_path / "brak.xlsx"))
+    monkeypatch.setattr(knr, "KNR_SNAPSHOT_DIR", str(tmp_path / ".knr_snapshot"))
+    messages = [{"role": "user", "content": "ile kosztuje malowanie  ścian?"}]
+    key = chat_agent._cache_key(messages, True)
+    assert key == chat_agent._cache_key([{"role": "user", "content": "ile kosztuje malowanie ścian?"}], True)
+    assert chat_agent._knr_version() is None
+    assert loads == []
+
+
+def test_cache_key_uses_compiled_snapshot_version(tmp_path, monkeypatch, loads):
+    from openpyxl import Workbook
+
+    wb = Workbook()
+    ws = wb.active
+    ws.append(["kod", "nazwa", "jednostka", "R"])
+    ws.append(["KNR 2-02 0101-01", "Malowanie ścian", "m2", 0.5])
+    wb.save(tmp_path / "knr.xlsx")
+    monkeypatch.setattr(knr, "KNR_PATH", str(tmp_path / "knr.xlsx"))
+    monkeypatch.setattr(knr, "KNR_SNAPSHOT_DIR", str(tmp_path / ".knr_snapshot"))
+    version = knr._build_catalog().version          # snapshot skompilowany (np. przez warmup innego workera)
+    monkeypatch.setattr(knr, "_KNR", None)
+    assert chat_agent._knr_version() == version
+    assert loads == []
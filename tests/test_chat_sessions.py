@@ -0,0 +1,126 @@
+import sqlite3
+import time
+
+import pytest
+
+from app import chat_sessions
+from app.chat_sessions import SessionConflict, SessionStore, valid_session_id
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SessionStore(str(tmp_path / "sessions.db"), ttl=3600)
+
+
+def _saved(store, turns=("dzień dobry",)):
+    s = store.load(None)
+    for t in turns:
+        s.add_turn("user", t)
+    store.save(s)
+    return s.id
+
+
+def test_ids_are_issued_by_server(store):
+    assert valid_session_id(store.load(None).id)
+    for client_id in ("moja-sesja", "0" * 32, "A" * 32, ""):
+        s = store.load(client_id)
+        assert s.id != client_id and valid_session_id(s.id) and s.version is None
+        store.save(s)
+    assert store.load("moja-sesja").id != "moja-sesja"
+
+
+def test_roundtrip_and_expired_session_is_not_taken_over(tmp_path):
+    store = SessionStore(str(tmp_path / "sessions.db"), ttl=0.2)
+    sid = _saved(store)
+    loaded = store.load(sid)
+    assert loaded.id == sid and loaded.version == 1
+    assert loaded.turns == [{"role": "user", "content": "dzień dobry"}]
+    time.sleep(0.3)
+    fresh = store.load(sid)
+    assert fresh.id != sid and fresh.turns == []
+
+
+def test_concurrent_turns_are_merged(store):
+    sid = _saved(store)
+    a, b = store.load(sid), store.load(sid)
+    a.add_turn("user", "tura A")
+    a.run_tool("estimate_offer", {"area_m2": 50, "standard": "blok"}, lambda n, args: {"suma": 1}, "r1")
+    b.add_turn("user", "tura B")
+    b.run_tool("estimate_offer", {"area_m2": 70, "standard": "kamienica"}, lambda n, args: {"suma": 2}, "r1")
+    store.save(a)
+    store.save(b)      # wersja się zmieniła – CAS nie przechodzi, b scala się ze stanem po a
+    merged = store.load(sid)
+    assert [t["content"] for t in merged.turns] == ["dzień dobry", "tura A", "tura B"]
+    assert len(merged.tool_results) == 2
+    assert merged.facts["area_m2"] == 70
+    assert merged.version == 3
+
+
+def test_tool_results_keyed_by_data_version(store):
+    s = store.load(None)
+    calls = []
+    run = lambda n, args: calls.append(n) or len(calls)
+    assert s.run_tool("get_knr_rate", {"query": "tynk"}, run, "v1") == 1
+    assert s.run_tool("get_knr_rate", {"query": "tynk"}, run, "v1") == 1
+    assert s.run_tool("get_knr_rate", {"query": "tynk"}, run, "v2") == 2
+
+
+def test_conflict_after_attempts(store, monkeypatch):
+    sid = _saved(store)
+    s = store.load(sid)
+    s.add_turn("user", "x")
+    monkeypatch.setattr(store, "_write", lambda conn, session: False)
+    with pytest.raises(SessionConflict):
+        store.save(s)
+
+
+def test_delete_only_live_server_ids(store):
+    sid = _saved(store)
+    assert store.delete("nie-istnieje") is False
+    assert store.delete("f" * 32) is False
+    assert store.delete(sid) is True
+    assert store.delete(sid) is False
+    assert store.load(sid).id != sid
+
+
+def test_migrates_table_without_version(tmp_path):
+    path = tmp_path / "old.db"
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE chat_session (id TEXT PRIMARY KEY, data TEXT NOT NULL, updated REAL NOT NULL)")
+    conn.execute("INSERT INTO chat_session VALUES (?, ?, ?)", ("a" * 32, '{"turns": []}', time.time()))
+    conn.commit()
+    conn.close()
+    store = SessionStore(str(path))
+    s = store.load("a" * 32)
+    assert s.id == "a" * 32 and s.version == 0
+    s.add_turn("user", "po migracji")
+    store.save(s)
+    assert store.load("a" * 32).version == 1
+
+
+@pytest.fixture
+def client(store, monkeypatch):
+    from fastapi.testclient import TestClient
+    from app import chat_agent, main
+
+    monkeypatch.setattr(chat_sessions, "sessions", store)
+    monkeypatch.setattr(chat_agent, "sessions", store)
+    monkeypatch.setattr(main, "sessions", store)
+    return TestClient(main.app)
+
+
+def test_delete_route(client, store):
+    sid = _saved(store)
+    assert client.delete(f"/api/chat/session/{'0' * 32}").status_code == 404
+    assert client.delete("/api/chat/session/cudza-sesja").status_code == 404
+    assert client.delete(f"/api/chat/session/{sid}").status_code == 200
+    assert client.delete(f"/api/chat/session/{sid}").status_code == 404
+
+
+def test_conflict_maps_to_409(client, store, monkeypatch):
+    from app import chat_agent
+
+    monkeypatch.setattr(chat_agent, "run_chat_agent", lambda history, session=None: {"reply": "ok", "timings": []})
+    monkeypatch.setattr(store, "_write", lambda conn, session: False)
+    resp = client.post("/api/chat", json={"message": "dzień dobry"})
+    assert resp.status_code == 409
@@ -0,0 +1,51 @@
+import os
+
+import pytest
+
+from app.services import export
+
+
+@pytest.fixture
+def templates(tmp_path, monkeypatch):
+    (tmp_path / "offer.html").write_text("<p>{{ summary }}</p>", "utf-8")
+    monkeypatch.setattr(export, "TEMPLATES_DIR", tmp_path)
+    monkeypatch.setattr(export, "TEMPLATE_CHECK_INTERVAL", 0)
+    monkeypatch.setattr(export, "_template_version", None)
+    monkeypatch.setattr(export, "_template_stamp", None)
+    return tmp_path
+
+
+def _touch(path, content, mtime_ns):
+    path.write_text(content, "utf-8")
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def test_template_version_is_hashed_only_after_mtime_change(templates):
+    offer = templates / "offer.html"
+    mtime = offer.stat().st_mtime_ns
+    v1 = export.template_version()
+    # ta sama długość i mtime – bez ponownego czytania pliku skrót się nie zmienia
+    _touch(offer, "<b>{{ summary }}</b>", mtime)
+    assert export.template_version() == v1
+    _touch(offer, "<b>{{ summary }}</b>", mtime + 10**9)
+    v2 = export.template_version()
+    assert v2 != v1
+    (templates / "footer.html").write_text("stopka", "utf-8")
+    assert export.template_version() not in (v1, v2)
+
+
+def test_template_version_rechecks_only_after_interval(templates, monkeypatch):
+    monkeypatch.setattr(export, "TEMPLATE_CHECK_INTERVAL", 3600)
+    v1 = export.template_version()
+    (templates / "footer.html").write_text("stopka", "utf-8")
+    assert export.template_version() == v1
+    monkeypatch.setattr(export, "TEMPLATE_CHECK_INTERVAL", 0)
+    assert export.template_version() != v1
+
+
+def test_offer_key_follows_template_version(templates):
+    key = export.offer_key({"a": 1}, {"b": 2})
+    assert export.valid_job_id(key)
+    assert export.offer_key({"a": 1}, {"b": 2}) == key
+    _touch(templates / "offer.html", "nowy", templates.joinpath("offer.html").stat().st_mtime_ns + 10**9)
+    assert export.offer_key({"a": 1}, {"b": 2}) != key
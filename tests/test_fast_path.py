@@ -0,0 +1,76 @@
+import pytest
+
+from app.fast_path import FastPath
+
+STANDARDS = ["blok", "kamienica", "dom", "deweloperski", "budowa", "budowa domu"]
+
+
+@pytest.fixture(scope="module")
+def fp():
+    return FastPath(STANDARDS)
+
+
+@pytest.mark.parametrize("message, area, standard", [
+    ("blok 55 m2", 55.0, "blok"),
+    ("Mieszkanie w bloku 48,5 m²", 48.5, "blok"),
+    ("remont kamienicy 70 m2.", 70.0, "kamienica"),
+    ("budowa domu 120 m2", 120.0, "budowa domu"),
+    ("budowy domów 140 m2", 140.0, "budowa domu"),
+    ("dom 150 m2!", 150.0, "dom"),
+    ("deweloperski 62 m2", 62.0, "deweloperski"),
+    ("wycena w deweloperskim 40 mkw", 40.0, "deweloperski"),
+])
+def test_estimate(fp, message, area, standard):
+    intent, reason = fp.parse(message)
+    assert reason == ""
+    assert intent == {"kind": "estimate", "area_m2": area, "standard": standard}
+
+
+@pytest.mark.parametrize("message, query", [
+    ("domofon 2 szt", "domofon"),
+    ("instalacja domowa 15 m", "instalacja domowa"),
+    ("blokada drzwi 3 szt", "blokada drzwi"),
+    ("materiały budowlane 10 szt", "materiały budowlane"),
+])
+def test_similar_words_are_not_building_types(fp, message, query):
+    intent, _ = fp.parse(message)
+    assert intent["kind"] == "knr"
+    assert [p["query"] for p in intent["positions"]] == [query]
+
+
+def test_knr_positions(fp):
+    intent, _ = fp.parse("malowanie ścian 120 m2, montaż paneli 60 m2 oraz rozbiórka ścianki 12 m2")
+    assert [(p["query"], p["ilosc"], p["unit"], p["katalog"]) for p in intent["positions"]] == [
+        ("malowanie ścian", 120.0, "m2", None),
+        ("montaż paneli", 60.0, "m2", None),
+        ("rozbiórka ścianki", 12.0, "m2", "4-01"),
+    ]
+
+
+@pytest.mark.parametrize("message, reason", [
+    ("ile kosztuje blok 55 m2?", "question"),
+    ("malowanie ścian 120 m2?", "question"),
+    ("czy 40 m2 to dużo? blok", "question"),
+    ("", "length"),
+    ("malowanie " * 40 + "10 m2", "length"),
+    ("dzień dobry", "no_quantity"),
+    ("blok 55 m2 i 20 mb", "estimate_shape"),
+    ("blok 55 m2 z balkonem", "estimate_extra_words"),
+    ("120 m2", "knr_no_job"),
+    ("malowanie 20 m2 na jutro rano", "knr_trailing_text"),
+])
+def test_fallback_reasons(fp, message, reason):
+    assert fp.parse(message) == (None, reason)
+
+
+def test_answer_counts_hits_and_fallbacks():
+    fp = FastPath(STANDARDS)
+    result = {"typ_prac": "blok", "powierzchnia_m2": 55, "robocizna_od": 1, "robocizna_do": 2,
+              "materiały_od": 3, "materiały_do": 4, "suma_od": 4, "suma_do": 6, "stawka_VAT": "8%"}
+    calls = []
+    out = fp.answer("blok 55 m2", lambda name, args: calls.append((name, args)) or result)
+    assert out["kind"] == "estimate" and "55 m²" in out["reply"]
+    assert calls == [("estimate_offer", {"area_m2": 55.0, "standard": "blok"})]
+    assert fp.answer("ile za blok 55 m2?", lambda n, a: result) is None
+    stats = fp.stats()
+    assert stats["hits"]["estimate"] == 1 and stats["fallbacks"] == {"question": 1}
@@ -0,0 +1,103 @@
+import json
+import random
+
+import pytest
+
+from app import knr
+
+WORDS = ["malowanie", "ścian", "sufitów", "gruntowanie", "tynk", "gipsowy", "płytki", "montaż", "paneli",
+         "podłogowych", "wylewka", "betonowa", "demontaż", "drzwi", "okien"]
+UNITS = ["m2", "m", "szt."]
+
+
+def _names(rnd: random.Random, rows: int):
+    # mały słownik = dużo identycznych i prawie identycznych nazw (remisy w WRatio);
+    # część nazw różni się tylko wielkością liter i polskimi znakami
+    out = []
+    for i in range(rows):
+        name = " ".join(rnd.sample(WORDS[:6] if i % 3 else WORDS, rnd.randint(2, 3)))
+        if i % 7 == 0:
+            name = name.upper()
+        if i % 11 == 0:
+            name = name.replace("ś", "s").replace("ł", "l").replace("ż", "z")
+        out.append(name)
+    return out
+
+
+@pytest.fixture(scope="module")
+def catalog(tmp_path_factory):
+    from openpyxl import Workbook
+
+    tmp = tmp_path_factory.mktemp("knr")
+    rnd = random.Random(7)
+    wb = Workbook()
+    ws = wb.active
+    ws.append(["kod", "nazwa", "jednostka", "R", "M", "S", "Cena_jedn"])
+    for i, name in enumerate(_names(rnd, 1500)):
+        kod = f"KNR 2-{2 + i % 3:02d} {i // 20 + 100:04d}-{i % 20 + 1:02d}"
+        price = None if i % 5 == 0 else round(rnd.uniform(10, 90), 2)
+        ws.append([kod, name, UNITS[i % len(UNITS)], round(rnd.uniform(0.1, 5), 4), 1.5, 0.5, price])
+    wb.save(tmp / "knr.xlsx")
+
+    mp = pytest.MonkeyPatch()
+    mp.setattr(knr, "KNR_PATH", str(tmp / "knr.xlsx"))
+    mp.setattr(knr, "KNR_SNAPSHOT_DIR", str(tmp / ".knr_snapshot"))
+    mp.setattr(knr, "_KNR", None)
+    knr._swap(knr._build_catalog())
+    yield knr
+    mp.undo()
+    knr._RESULT_CACHE.clear()
+
+
+def _queries(catalog_names):
+    rnd = random.Random(11)
+    qs = rnd.sample(catalog_names, 40)                             # dokładne nazwy (wiele remisów)
+    qs += [" ".join(n.split()[:2]).lower() for n in rnd.sample(catalog_names, 40)]
+    qs += ["malowanie", "tynk", "mlowanie scin", "xyz", "pł", ""]   # krótkie / literówki – pełne przeszukanie
+    return qs
+
+
+def _dump(results):
+    # json porównuje też NaN (puste Cena_jedn), na którym == zawodzi
+    return json.dumps(results, sort_keys=True)
+
+
+@pytest.mark.parametrize("top_n", [1, 5, 12])
+def test_many_matches_single(catalog, top_n):
+    qs = _queries(catalog._load_knr().nazwa.tolist())
+    ilosci = [None if i % 2 else float(i) for i in range(len(qs))]
+    catalog._RESULT_CACHE.clear()
+    many = catalog.find_knr_items_many(qs, ilosci, top_n=top_n)
+    catalog._RESULT_CACHE.clear()
+    single = [catalog.find_knr_items(q, top_n=top_n, ilosc=il) for q, il in zip(qs, ilosci)]
+    assert _dump(many) == _dump(single)
+
+
+def test_many_matches_single_scoped(catalog):
+    qs = _queries(catalog._load_knr().nazwa.tolist())
+    katalogi = [[None, "2-02", "2-03", ["2-02", "2-04"]][i % 4] for i in range(len(qs))]
+    jednostki = [[None, "m2", None, "szt."][i % 4] for i in range(len(qs))]
+    catalog._RESULT_CACHE.clear()
+    many = catalog.find_knr_items_many(qs, top_n=5, katalogi=katalogi, jednostki=jednostki)
+    catalog._RESULT_CACHE.clear()
+    single = [catalog.find_knr_items(q, top_n=5, katalog=k, jednostka=j)
+              for q, k, j in zip(qs, katalogi, jednostki)]
+    assert _dump(many) == _dump(single)
+
+
+def test_many_partly_cached_and_duplicates(catalog):
+    qs = _queries(catalog._load_knr().nazwa.tolist())[:20]
+    catalog._RESULT_CACHE.clear()
+    single = [catalog.find_knr_items(q, top_n=5) for q in qs[:10]]   # połowa partii już w cache
+    many = catalog.find_knr_items_many(qs[:10] + qs + qs[:3], top_n=5)
+    catalog._RESULT_CACHE.clear()
+    expected = single + [catalog.find_knr_items(q, top_n=5) for q in qs + qs[:3]]
+    assert _dump(many) == _dump(expected)
+
+
+def test_many_rejects_mismatched_lengths(catalog):
+    with pytest.raises(ValueError):
+        catalog.find_knr_items_many(["tynk", "malowanie"], ilosci=[1.0])
+    with pytest.raises(ValueError):
+        catalog.find_knr_items_many(["tynk"], katalogi=["2-02", "2-03"])
+    assert catalog.find_knr_items_many([]) == []
@@ -0,0 +1,33 @@
+import pytest
+
+from app.knr_snapshot import StringTable
+
+NAMES = ["Malowanie ścian", "", "tynk gipsowy", "żółć", "x"]
+
+
+@pytest.fixture
+def table(tmp_path):
+    StringTable.write(tmp_path / "nazwa", NAMES)
+    return StringTable.open(tmp_path / "nazwa")
+
+
+def test_string_table_reads_lazily(table):
+    assert len(table) == len(NAMES)
+    assert [table[i] for i in range(len(NAMES))] == NAMES
+    assert table[-1] == "x"
+    with pytest.raises(IndexError):
+        table[len(NAMES)]
+    assert table.tolist() == NAMES
+    assert list(table) == NAMES
+
+
+def test_string_table_take(table):
+    assert table.take([3, 0, 3]) == ["żółć", "Malowanie ścian", "żółć"]
+    assert table.take([]) == []
+
+
+def test_empty_string_table(tmp_path):
+    StringTable.write(tmp_path / "kod", ["", ""])
+    t = StringTable.open(tmp_path / "kod")
+    assert t.tolist() == ["", ""]
+    assert t.take([1]) == [""]
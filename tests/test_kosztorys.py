@@ -0,0 +1,91 @@
+import pytest
+
+from app import knr
+from app.services import kosztorys
+from app.services.kosztorys import price_bill
+
+ROWS = [
+    # kod, nazwa, jednostka, R, M, S, Cena_jedn
+    ("KNR 2-02 0101-01", "Malowanie ścian dwukrotne", "m2", 0.5, 2.0, 0.1, None),
+    ("KNR 2-02 0102-01", "Tynk gipsowy maszynowy", "m2", 1.2, 8.0, 0.5, 40.0),
+    ("KNR 4-01 0201-01", "Rozebranie ścianki działowej z cegły", "m2", 2.0, None, None, None),
+]
+
+
+@pytest.fixture(scope="module")
+def catalog(tmp_path_factory):
+    from openpyxl import Workbook
+
+    tmp = tmp_path_factory.mktemp("kosztorys")
+    wb = Workbook()
+    ws = wb.active
+    ws.append(["kod", "nazwa", "jednostka", "R", "M", "S", "Cena_jedn"])
+    for row in ROWS:
+        ws.append(list(row))
+    wb.save(tmp / "knr.xlsx")
+
+    mp = pytest.MonkeyPatch()
+    mp.setattr(knr, "KNR_PATH", str(tmp / "knr.xlsx"))
+    mp.setattr(knr, "KNR_SNAPSHOT_DIR", str(tmp / ".knr_snapshot"))
+    mp.setattr(knr, "_KNR", None)
+    knr._swap(knr._build_catalog())
+    yield knr._KNR
+    mp.undo()
+    knr._RESULT_CACHE.clear()
+
+
+def test_positions_resolved_by_code_name_and_description(catalog):
+    bill = price_bill([("KNR 2-02 0101-01", 10), ("Tynk gipsowy maszynowy", 5),
+                       ("rozebranie scianki dzialowej", 2), ("xyz qwerty", 3), ("", 1)],
+                      standard="blok", area_m2=60)
+    p = bill["pozycje"]
+    assert [r["dopasowanie"] for r in p] == ["kod", "opis", "opis", None, None]
+    assert [r.get("kod") for r in p[:3]] == [r[0] for r in ROWS]
+    assert p[0]["score"] == 100 and p[1]["score"] == 100 and 60 <= p[2]["score"] < 100
+    assert bill["nierozpoznane"] == [4, 5]
+    assert "wartosc_netto" not in p[3]
+
+    # malowanie: bez ceny jednostkowej – R + M + S
+    assert (p[0]["RG"], p[0]["koszt_R"], p[0]["koszt_M"], p[0]["koszt_S"]) == (5.0, 225.0, 20.0, 1.0)
+    assert p[0]["koszty_bezposrednie"] == 246.0
+    assert p[0]["wartosc_netto"] == round(246.0 * 1.425, 2)
+    # tynk: cena jednostkowa z katalogu ma pierwszeństwo
+    assert p[1]["koszty_bezposrednie"] == 200.0
+    # rozbiórka: puste M i S liczone jako 0
+    assert (p[2]["koszt_M"], p[2]["koszt_S"], p[2]["koszty_bezposrednie"]) == (0.0, 0.0, 180.0)
+
+
+def test_sums_and_vat(catalog):
+    rows = [("KNR 2-02 0101-01", 10), ("Tynk gipsowy maszynowy", 5), ("KNR 4-01 0201-01", 2)]
+    bill = price_bill(rows, standard="blok", area_m2=60)
+    s = bill["sumy"]
+    netto = sum(r["wartosc_netto"] for r in bill["pozycje"])
+    assert s["koszty_bezposrednie"] == 626.0
+    assert s["netto"] == pytest.approx(netto)
+    assert s["narzut"] == round(s["netto"] - 626.0, 2)
+    assert s["stawka_VAT"] == "8%" and s["VAT"] == round(s["netto"] * 0.08, 2)
+    assert s["brutto"] == round(s["netto"] + s["VAT"], 2)
+    assert s["RG"] == 5.0 + 6.0 + 4.0
+    assert bill["typ_prac"] == "blok" and bill["wersja_katalogu"] == catalog.version
+
+    assert price_bill(rows, standard="blok", area_m2=200)["sumy"]["stawka_VAT"] == "23%"
+    assert price_bill(rows, standard="blok")["sumy"]["stawka_VAT"] == "23%"
+    assert price_bill(rows, standard="budowa domu", area_m2=200)["sumy"]["stawka_VAT"] == "8%"
+
+
+def test_labor_rate_override(catalog):
+    bill = price_bill([("KNR 4-01 0201-01", 2)], labor_rate=50)
+    assert bill["stawka_rg"] == 50.0
+    assert bill["pozycje"][0]["koszt_R"] == 200.0
+
+
+def test_duplicate_descriptions_priced_alike(catalog):
+    bill = price_bill([("rozebranie scianki dzialowej", 1), ("rozebranie scianki dzialowej", 3)])
+    a, b = bill["pozycje"]
+    assert a["kod"] == b["kod"] and b["wartosc_netto"] == pytest.approx(3 * a["wartosc_netto"])
+
+
+def test_too_many_rows(catalog, monkeypatch):
+    monkeypatch.setattr(kosztorys, "KOSZTORYS_MAX_ROWS", 2)
+    with pytest.raises(ValueError):
+        price_bill([("KNR 2-02 0101-01", 1)] * 3)
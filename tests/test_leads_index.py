@@ -0,0 +1,103 @@
+import json
+from datetime import date
+
+import pytest
+
+from app import leads_journal
+from app.leads_index import LeadsIndex
+from app.leads_journal import LeadsJournal
+
+TODAY = date.today().isoformat()
+
+
+@pytest.fixture
+def journal(tmp_path, monkeypatch):
+    monkeypatch.setattr(leads_journal, "FSYNC", False)
+    j = LeadsJournal(tmp_path / "leads")
+    yield j
+    j.close()
+
+
+@pytest.fixture
+def index(tmp_path, journal):
+    return LeadsIndex(tmp_path / "index.db", journal)
+
+
+def _lead(n, client="k1", standard="Blok", total=1000):
+    return {"created_at": f"{TODAY}T12:00:{n:02d}", "client_id": client, "standard": standard,
+            "location": "Kraków", "estimate_total": total, "n": n}
+
+
+def _append(journal, leads):
+    for lead in leads:
+        journal.append(lead)
+    assert journal.flush(5)
+
+
+def test_catch_up_is_incremental(journal, index):
+    _append(journal, [_lead(i) for i in range(3)])
+    assert index.catch_up() == 3
+    assert index.catch_up() == 0
+    _append(journal, [_lead(3, client="k2", standard="kamienica", total=500)])
+    assert index.catch_up() == 1
+    assert index.report("day") == [{"key": TODAY, "count": 4, "total": 3500}]
+    assert index.report("standard") == [{"key": "blok", "count": 3, "total": 3000},
+                                        {"key": "kamienica", "count": 1, "total": 500}]
+    assert [l["n"] for l in index.client_leads("k1")] == [2, 1, 0]
+    assert index.stats()["leads"] == 4
+
+
+def test_half_written_line_waits_for_next_catch_up(journal, index):
+    _append(journal, [_lead(0)])
+    seg = journal.segments()[-1]
+    line = json.dumps(_lead(1), ensure_ascii=False).encode("utf-8") + b"\n"
+    with open(seg, "ab") as f:
+        f.write(line[:10])
+    assert index.catch_up() == 1
+    with open(seg, "ab") as f:
+        f.write(line[10:])
+    assert index.catch_up() == 1
+    assert index.stats()["leads"] == 2
+
+
+def test_two_workers_do_not_count_twice(tmp_path, journal, index):
+    other = LeadsIndex(tmp_path / "index.db", journal)
+    _append(journal, [_lead(i) for i in range(5)])
+    assert index.catch_up() + other.catch_up() == 5
+    _append(journal, [_lead(5)])
+    assert other.catch_up() + index.catch_up() == 1
+    assert index.stats()["leads"] == 6
+
+
+def test_catch_up_follows_segment_rollover(journal, index, monkeypatch):
+    monkeypatch.setattr(leads_journal, "SEGMENT_MAX_BYTES", 300)
+    for i in range(8):
+        _append(journal, [_lead(i)])
+        if i % 3 == 0:
+            index.catch_up()
+    index.catch_up()
+    assert len(journal.segments()) > 1
+    assert index.stats()["leads"] == 8
+    assert index.stats()["sources"] == len(journal.segments())
+
+
+def test_rebuild_matches_catch_up(tmp_path, journal, index):
+    _append(journal, [_lead(i, client=f"k{i % 2}", total=100 * i) for i in range(6)])
+    index.catch_up()
+    before = (index.report("client"), index.report("day"), index.client_leads("k0"))
+    assert index.rebuild() == 6
+    assert (index.report("client"), index.report("day"), index.client_leads("k0")) == before
+
+
+def test_legacy_json_is_read_once(tmp_path, monkeypatch):
+    monkeypatch.setattr(leads_journal, "FSYNC", False)
+    legacy = tmp_path / "leads.json"
+    legacy.write_text(json.dumps([_lead(0), _lead(1, client=None)]), "utf-8")
+    j = LeadsJournal(tmp_path / "leads", legacy_json=legacy)
+    try:
+        index = LeadsIndex(tmp_path / "index.db", j)
+        assert index.catch_up() == 2
+        assert index.catch_up() == 0
+        assert index.stats()["client_rows"] == 1
+    finally:
+        j.close()
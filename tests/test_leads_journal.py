@@ -0,0 +1,83 @@
+import errno
+import json
+
+import pytest
+
+from app import leads_journal
+from app.leads_journal import LeadsJournal
+
+
+@pytest.fixture
+def journal(tmp_path, monkeypatch):
+    monkeypatch.setattr(leads_journal, "FSYNC", False)
+    monkeypatch.setattr(leads_journal, "RETRY_MIN", 0.01)
+    j = LeadsJournal(tmp_path / "leads")
+    yield j
+    j.close()
+
+
+def _lines(j):
+    return [json.loads(line) for p in j.segments() for line in p.read_text("utf-8").splitlines()]
+
+
+def test_group_commit_writes_batch_once(journal, monkeypatch):
+    batches = []
+    write = journal._write_batch
+    monkeypatch.setattr(journal, "_write_batch", lambda b: (batches.append(len(b)), write(b)))
+    monkeypatch.setattr(leads_journal, "FLUSH_INTERVAL", 0.5)
+    for i in range(20):
+        journal.append({"n": i})
+    assert journal.flush(5)
+    assert sum(batches) == 20 and len(batches) < 20
+    assert [r["n"] for r in journal.iter_leads()] == list(range(20))
+
+
+def test_segment_rollover(journal, monkeypatch):
+    monkeypatch.setattr(leads_journal, "SEGMENT_MAX_BYTES", 200)
+    for i in range(10):
+        journal.append({"n": i, "opis": "x" * 40})
+        assert journal.flush(5)
+    segs = journal.segments()
+    assert len(segs) > 1
+    assert all(p.stat().st_size <= 200 for p in segs)
+    assert [r["n"] for r in journal.iter_leads()] == list(range(10))
+
+
+def test_failed_batch_is_retried_and_hooks_wait(journal, monkeypatch):
+    commits = []
+    journal.on_commit(lambda: commits.append(len(_lines(journal))))
+    write = journal._write_batch
+    failures = [OSError(errno.ENOSPC, "No space left on device")] * 2
+
+    def flaky(batch):
+        if failures:
+            raise failures.pop()
+        write(batch)
+
+    monkeypatch.setattr(journal, "_write_batch", flaky)
+    journal.append({"n": 1})
+    assert journal.flush(5)
+    assert failures == []
+    assert _lines(journal) == [{"n": 1}]
+    # hook tylko po udanym zapisie, i to z rekordem już na dysku
+    assert commits == [1]
+
+
+def test_partial_write_is_truncated_before_retry(journal, monkeypatch):
+    journal.append({"n": 0})
+    assert journal.flush(5)
+    real_write = leads_journal.os.write
+    calls = []
+
+    def short_then_fail(fd, data):
+        calls.append(len(data))
+        if len(calls) == 1:
+            real_write(fd, data[:5])
+            raise OSError(errno.EIO, "I/O error")
+        return real_write(fd, data)
+
+    monkeypatch.setattr(leads_journal.os, "write", short_then_fail)
+    journal.append({"n": 1})
+    assert journal.flush(5)
+    monkeypatch.undo()
+    assert _lines(journal) == [{"n": 0}, {"n": 1}]
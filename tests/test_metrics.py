@@ -0,0 +1,104 @@
+import json
+import os
+
+import pytest
+
+from app import metrics
+from app.metrics import BUCKETS, SPAN_DURATION, Registry
+
+
+def _snap(pid, histograms=None, gauges=None, buckets=BUCKETS):
+    return {"pid": pid, "buckets": list(buckets), "histograms": histograms or {}, "gauges": gauges or {}}
+
+
+def _hist(count, total, bucket=0):
+    h = [0.0] * (len(BUCKETS) + 2)
+    h[bucket] = float(count)
+    h[-1] = total
+    return h
+
+
+def test_render_keeps_large_counts_exact():
+    key = metrics._series(SPAN_DURATION, {"span": "quota_get", "outcome": "ok"})
+    out = metrics.render({"histograms": {key: _hist(1234567, 2469134.0)},
+                          "gauges": {'ollbud_http_requests_in_flight{app="ollbud"}': 12345678.0}})
+    assert 'ollbud_span_duration_seconds_bucket{outcome="ok",span="quota_get",le="0.001"} 1234567' in out
+    assert 'ollbud_span_duration_seconds_bucket{outcome="ok",span="quota_get",le="+Inf"} 1234567' in out
+    assert 'ollbud_span_duration_seconds_count{outcome="ok",span="quota_get"} 1234567' in out
+    assert 'ollbud_span_duration_seconds_sum{outcome="ok",span="quota_get"} 2469134' in out
+    assert 'ollbud_http_requests_in_flight{app="ollbud"} 12345678' in out
+    assert "e+" not in out
+    assert "# TYPE ollbud_span_duration_seconds histogram" in out
+
+
+def test_render_float_sum_full_precision():
+    key = metrics._series(SPAN_DURATION, {"span": "load_knr", "outcome": "ok"})
+    out = metrics.render({"histograms": {key: _hist(3, 0.1 + 0.2, bucket=6)}, "gauges": {}})
+    assert f'ollbud_span_duration_seconds_sum{{outcome="ok",span="load_knr"}} {0.1 + 0.2!r}' in out
+    assert 'le="0.05"} 0\n' in out and 'le="0.1"} 3\n' in out
+
+
+def test_merge_adds_histograms_and_skips_other_buckets():
+    acc = {"histograms": {}, "gauges": {}}
+    metrics._merge_into(acc, _snap(1, {"a{}": _hist(2, 1.5)}, {"g{}": 1.0}), with_gauges=True)
+    metrics._merge_into(acc, _snap(2, {"a{}": _hist(3, 2.0)}, {"g{}": 2.0}), with_gauges=False)
+    metrics._merge_into(acc, _snap(3, {"a{}": _hist(100, 9.0)}, buckets=(1.0,)), with_gauges=True)
+    assert acc["histograms"]["a{}"][0] == 5 and acc["histograms"]["a{}"][-1] == 3.5
+    assert acc["gauges"] == {"g{}": 1.0}
+
+
+@pytest.fixture
+def metrics_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_DIR", tmp_path)
+    monkeypatch.setattr(metrics, "registry", Registry())
+    return tmp_path
+
+
+def _dead_pid():
+    pid = 2 ** 22 + 12345
+    while metrics._alive(pid):
+        pid += 1
+    return pid
+
+
+def test_collect_archives_dead_workers(metrics_dir):
+    me, dead = os.getpid(), _dead_pid()
+    metrics.registry.observe(SPAN_DURATION, {"span": "x", "outcome": "ok"}, 0.002)
+    metrics.registry.add("g", {}, 1)
+    (metrics_dir / f"metrics-{dead}.json").write_text(
+        json.dumps(_snap(dead, {'ollbud_span_duration_seconds{outcome="ok",span="x"}': _hist(4, 0.004, 1)},
+                         {'g{}': 7.0})), "utf-8")
+    data = metrics.collect()
+    key = 'ollbud_span_duration_seconds{outcome="ok",span="x"}'
+    assert data["histograms"][key][1] == 5
+    assert data["gauges"] == {'g{}': 1.0}             # „w toku” martwego procesu nie liczymy
+    assert not (metrics_dir / f"metrics-{dead}.json").exists()
+    assert (metrics_dir / f"metrics-{me}.json").exists()
+    # archiwum zostaje – liczniki nie cofają się przy kolejnym odczycie
+    assert metrics.collect()["histograms"][key][1] == 5
+
+
+def test_quota_spans(metrics_dir, tmp_path):
+    from app.quota_store import QuotaStore
+
+    store = QuotaStore(tmp_path / "quota.bin", tmp_path / "quota.lock", slots=8, default_max=3)
+    store.consume("k")
+    store.get("k")
+    spans = metrics.registry.histograms
+    assert metrics._series(SPAN_DURATION, {"span": "quota_consume", "outcome": "ok"}) in spans
+    assert metrics._series(SPAN_DURATION, {"span": "quota_get", "outcome": "ok"}) in spans
+
+
+def test_load_knr_span_only_on_build(metrics_dir, monkeypatch):
+    from app import knr
+
+    built = []
+    monkeypatch.setattr(knr, "KNRCatalog", lambda snap: built.append(snap) or object())
+    monkeypatch.setattr(knr, "open_snapshot", lambda paths, root, read: "snapshot")
+    monkeypatch.setattr(knr, "_KNR", None)
+    monkeypatch.setattr(knr, "knr_paths", lambda: [__file__])
+    cat = knr._load_knr()
+    assert knr._load_knr() is cat and knr._load_knr() is cat
+    key = metrics._series(SPAN_DURATION, {"span": "load_knr", "outcome": "ok"})
+    assert len(built) == 1
+    assert sum(metrics.registry.histograms[key][:-1]) == 1
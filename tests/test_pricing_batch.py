@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+
+from app.pricing import estimate_offer, estimate_offer_batch
+from app.rules import rules
+
+STANDARDS = ["blok", "Kamienica", "stan deweloperski", "budowa domu", "dom", ""]
+
+
+def _edge_areas():
+    # progi VAT (150 / 300 m²) z obu stron, zero, bardzo duże metraże
+    # i drobne metraże, dla których kwoty wypadają na połówkach grosza
+    areas = [0.0, 1.0, 149.99, 150.0, 150.0001, 299.99, 300.0, 300.01, 1e9, 1e13]
+    areas += [k / 1000 for k in range(1, 2001)]
+    areas += [k / 10000 for k in range(1, 201)]
+    return areas
+
+
+def test_edge_areas_hit_half_cents():
+    """Zestaw musi zawierać kwoty, na których np.round i round() dają różne grosze."""
+    rs = rules()
+    differs = 0
+    for t in rs.types:
+        x = np.array(_edge_areas()) * t["base_rate"] * rs.overhead
+        differs += int((np.round(x, 2) != np.array([round(float(v), 2) for v in x])).sum())
+    assert differs > 0
+
+
+def test_batch_matches_scalar():
+    areas = _edge_areas()
+    for std in STANDARDS:
+        batch = estimate_offer_batch(areas, [std] * len(areas))
+        for area, got in zip(areas, batch):
+            assert got == estimate_offer(area, std), (area, std)
+
+
+def test_batch_mixed_standards_and_numpy_input():
+    areas = _edge_areas()
+    standards = [STANDARDS[i % len(STANDARDS)] for i in range(len(areas))]
+    batch = estimate_offer_batch(np.array(areas), standards)
+    assert batch == [estimate_offer(a, s) for a, s in zip(areas, standards)]
+
+
+def test_batch_frame():
+    areas = _edge_areas()[:50]
+    standards = [STANDARDS[i % len(STANDARDS)] for i in range(len(areas))]
+    frame = pd.DataFrame({"area_m2": areas, "standard": standards}, index=range(100, 100 + len(areas)))
+    out = estimate_offer_batch(frame)
+    assert list(out.index) == list(frame.index)
+    for rec, a, s in zip(out.to_dict("records"), areas, standards):
+        assert rec == estimate_offer(a, s)
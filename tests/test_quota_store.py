@@ -0,0 +1,91 @@
+import os
+from datetime import date, timedelta
+
+import pytest
+
+from app.quota_store import HEADER, SLOT, QuotaStore, QuotaTableFull, _key
+
+TODAY = date(2026, 3, 10)
+YESTERDAY = TODAY - timedelta(days=1)
+
+
+def _store(tmp_path, slots=4, **kw):
+    return QuotaStore(tmp_path / "quota.bin", tmp_path / "quota.lock", slots=slots, **kw)
+
+
+def _same_start(slots, n):
+    """n identyfikatorów klientów trafiających w ten sam slot startowy (jeden łańcuch)."""
+    out, i = [], 0
+    while len(out) < n:
+        cid = f"client-{i}"
+        if int.from_bytes(_key(cid)[:8], "little") % slots == 0:
+            out.append(cid)
+        i += 1
+    return out
+
+
+def test_consume_stops_at_max(tmp_path):
+    qs = _store(tmp_path, default_max=2)
+    assert [qs.consume("a", TODAY) for _ in range(3)] == [(1, 2), (2, 2), (2, 2)]
+    assert qs.get("a", TODAY) == (2, 2)
+    assert qs.get("a", TODAY + timedelta(days=1)) == (0, 2)
+
+
+def test_create_is_atomic_and_recovers_zeroed_file(tmp_path):
+    path = tmp_path / "quota.bin"
+    path.write_bytes(b"\0" * 100)     # pół-plik po awarii starszej wersji
+    qs = _store(tmp_path)
+    qs.consume("a", TODAY)
+    assert path.stat().st_size == HEADER.size + 4 * SLOT.size
+    assert [p.name for p in tmp_path.iterdir() if p.name.endswith(".tmp")] == []
+    # drugi proces (osobna instancja) widzi ten sam plik
+    assert _store(tmp_path).get("a", TODAY) == (1, 3)
+
+
+def test_previous_day_slots_are_reused(tmp_path):
+    qs = _store(tmp_path)
+    old = _same_start(4, 4)
+    for cid in old:
+        qs.consume(cid, YESTERDAY)
+    with pytest.raises(QuotaTableFull):
+        qs.consume("nowy", YESTERDAY)
+    # nowy dzień: wczorajsze sloty są nagrobkami, tablica znów przyjmuje wpisy
+    for cid in old:
+        assert qs.consume(cid, TODAY) == (1, 3)
+    assert qs.get(old[0], YESTERDAY) == (0, 3)
+
+
+def test_lagging_clock_does_not_overwrite_new_day(tmp_path):
+    qs = _store(tmp_path)
+    a, b, c = _same_start(4, 3)
+    qs.consume(a, TODAY)
+    qs.consume(a, TODAY)
+    # proces z zegarem jeszcze na wczoraj – ten sam łańcuch
+    assert qs.consume(b, YESTERDAY) == (1, 3)
+    assert qs.get(a, TODAY) == (2, 3)
+    assert qs.consume(b, YESTERDAY) == (2, 3)
+    # dzisiejszy wpis może zająć wczorajszy slot, ale nie odwrotnie
+    assert qs.consume(c, TODAY) == (1, 3)
+    assert qs.consume(a, TODAY) == (3, 3)
+    assert qs.consume(b, YESTERDAY) == (1, 3)
+    assert qs.get(a, TODAY) == (3, 3)
+    assert qs.get(c, TODAY) == (1, 3)
+
+
+def test_today_entry_behind_yesterday_tombstone_is_found(tmp_path):
+    qs = _store(tmp_path)
+    a, b = _same_start(4, 2)
+    qs.consume(a, YESTERDAY)          # slot 0: wczoraj
+    qs.consume(b, YESTERDAY)          # slot 1: wczoraj
+    qs.consume(b, TODAY)              # zajmuje nagrobek w slocie 0
+    qs.consume(a, TODAY)              # slot 1 (nagrobek)
+    assert qs.get(a, TODAY) == (1, 3)
+    assert qs.get(b, TODAY) == (1, 3)
+
+
+def test_instances_share_counts(tmp_path):
+    one, two = _store(tmp_path, slots=64), _store(tmp_path, slots=64)
+    one.consume("x", TODAY)
+    two.consume("x", TODAY)
+    assert one.get("x", TODAY) == (2, 3)
+    assert os.path.exists(tmp_path / "quota.lock")
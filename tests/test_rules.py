@@ -0,0 +1,99 @@
+import random
+
+import pytest
+
+from app import rules as rules_mod
+from app.rules import KeywordMatcher
+
+# dawna logika (ręczne 'kw' in s) – punkt odniesienia dla skompilowanych reguł
+_RATES = {"malowanie": 45, "podłogi": 120, "łazienka": 1800, "kuchnia": 1500, "remont kompleksowy": 700}
+_STANDARD_MUL = {"ekonomiczny": 0.9, "standard": 1.0, "premium": 1.25}
+
+
+def _old_scope(scope, area_m2, standard, location):
+    s = (scope or "").lower()
+    m2 = float(area_m2 or 0)
+    rate = 0
+    items = []
+    if "malow" in s:
+        items.append({"name": "Malowanie", "unit": "m²", "qty": m2, "rate": _RATES["malowanie"]})
+        rate += _RATES["malowanie"]
+    if "podł" in s or "podl" in s:
+        items.append({"name": "Układanie podłogi", "unit": "m²", "qty": m2, "rate": _RATES["podłogi"]})
+        rate += _RATES["podłogi"]
+    if "łaz" in s:
+        items.append({"name": "Remont łazienki", "unit": "m²", "qty": m2, "rate": _RATES["łazienka"]})
+        rate += _RATES["łazienka"]
+    if "kuch" in s:
+        items.append({"name": "Remont kuchni", "unit": "m²", "qty": m2, "rate": _RATES["kuchnia"]})
+        rate += _RATES["kuchnia"]
+    if "kompleks" in s:
+        items = [{"name": "Remont kompleksowy", "unit": "m²", "qty": m2, "rate": _RATES["remont kompleksowy"]}]
+        rate = _RATES["remont kompleksowy"]
+    std_mul = _STANDARD_MUL.get(standard, 1.0)
+    loc_mul = 1.0 if ("kraków" in location.lower() or "krakow" in location.lower()) else 1.1
+    subtotal = round(rate * m2 * std_mul * loc_mul)
+    buffer = round(subtotal * 0.08)
+    return {"items": items, "subtotal": subtotal, "buffer": buffer, "total": subtotal + buffer}
+
+
+def _old_type_code(std):
+    if "budowa" in std or "dom" in std:
+        return 0
+    if "kamienica" in std:
+        return 1
+    if "deweloperski" in std:
+        return 2
+    return 3
+
+
+_FRAGMENTS = ["malow", "malowanie", "podł", "podłogi", "podl", "łaz", "łazienka", "kuch", "kuchnia",
+              "kompleks", "kompleksowy", "budowa", "dom", "domu", "kamienica", "kamienic", "deweloperski",
+              "blok", "kraków", "Krakow", "KRAKÓW", "wrocław", "ma", "ło", "ś", " ", "-", ",", "x", "PODŁ"]
+
+
+def _texts(n, seed=0):
+    rnd = random.Random(seed)
+    out = ["", " ", "malowaniepodłogi", "kompleksowy remont łazienki i kuchni", "budowa domu", "dom"]
+    for _ in range(n):
+        out.append("".join(rnd.choice(_FRAGMENTS) for _ in range(rnd.randint(0, 6))))
+    return out
+
+
+@pytest.fixture(scope="module")
+def rs():
+    return rules_mod._load(rules_mod.RULES_PATH)
+
+
+def test_scope_matches_old_keyword_checks(rs):
+    rnd = random.Random(1)
+    texts = _texts(3000)
+    for scope in texts:
+        area = rnd.choice([0, 1, 12.5, 48, 333])
+        standard = rnd.choice(["ekonomiczny", "standard", "premium", "Premium", "lux"])
+        location = rnd.choice(texts)
+        got = rs.estimate_scope(scope, area, standard, location)
+        want = _old_scope(scope, area, standard, location)
+        assert {k: got[k] for k in want} == want, (scope, location)
+
+
+def test_type_code_matches_old_keyword_checks(rs):
+    for text in _texts(3000, seed=2):
+        std = text.lower()
+        assert rs.type_code(std) == _old_type_code(std), std
+
+
+def test_matcher_reports_overlapping_and_nested_keywords():
+    patterns = [("ab", 0), ("b", 1), ("abc", 2), ("bcd", 3), ("c", 4), ("ab", 5)]
+    m = KeywordMatcher(patterns)
+    rnd = random.Random(3)
+    for _ in range(2000):
+        text = "".join(rnd.choice("abcdx") for _ in range(rnd.randint(0, 8)))
+        want = frozenset(owner for kw, owner in patterns if kw in text)
+        assert m.owners(text) == want, text
+        assert m.owners(text) == want     # drugi raz z pamięci
+
+
+def test_empty_matcher():
+    m = KeywordMatcher([("", 0)])
+    assert m.owners("cokolwiek") == frozenset()
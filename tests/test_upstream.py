@@ -0,0 +1,194 @@
+import asyncio
+import threading
+
+import httpx
+import openai
+import pytest
+
+from app import upstream
+from app.upstream import Deadline, Limiter
+
+
+def _rate_limited():
+    response = httpx.Response(429, request=httpx.Request("POST", "https://api.openai.com/v1/chat/completions"))
+    return openai.RateLimitError("rate limited", response=response, body=None)
+
+
+@pytest.fixture
+def limiter(monkeypatch):
+    lim = Limiter(max_inflight=1, max_queue=4)
+    monkeypatch.setattr(upstream, "limiter", lim)
+    monkeypatch.setattr(upstream, "_retry_delay", lambda exc, attempt: 0.01)
+    return lim
+
+
+@pytest.fixture
+def held_during_backoff(monkeypatch, limiter):
+    """Ile slotów było zajętych w chwili decyzji o ponowieniu (przed przerwą)."""
+    seen = []
+    retry_after = upstream._retry_after
+
+    def spy(e, attempt, deadline):
+        seen.append(limiter.inflight)
+        return retry_after(e, attempt, deadline)
+
+    monkeypatch.setattr(upstream, "_retry_after", spy)
+    return seen
+
+
+def test_with_retries_releases_slot_between_attempts(limiter, held_during_backoff):
+    attempts = []
+
+    def call(timeout):
+        attempts.append(limiter.inflight)
+        if len(attempts) < 3:
+            raise _rate_limited()
+        return "ok"
+
+    assert upstream.with_retries(call, Deadline(5)) == "ok"
+    assert attempts == [1, 1, 1]
+    assert held_during_backoff == [0, 0]
+    assert limiter.inflight == 0
+    assert limiter.retries == 2
+
+
+def test_with_retries_gives_up(limiter, monkeypatch):
+    monkeypatch.setattr(upstream, "MAX_RETRIES", 1)
+
+    def call(timeout):
+        raise _rate_limited()
+
+    with pytest.raises(upstream.UpstreamRateLimited):
+        upstream.with_retries(call, Deadline(5))
+    assert limiter.inflight == 0
+
+
+def test_astream_holds_slot_only_for_successful_stream(limiter, held_during_backoff):
+    attempts = []
+
+    async def open_stream(timeout):
+        attempts.append(limiter.inflight)
+        if len(attempts) < 2:
+            raise _rate_limited()
+        return "stream"
+
+    async def main():
+        async with upstream.astream(open_stream, Deadline(5)) as stream:
+            assert stream == "stream"
+            assert limiter.inflight == 1
+        assert limiter.inflight == 0
+
+    asyncio.run(main())
+    assert attempts == [1, 1]
+    assert held_during_backoff == [0]
+
+
+def test_astream_releases_on_error(limiter):
+    async def open_stream(timeout):
+        raise ValueError("zły request")
+
+    async def main():
+        with pytest.raises(ValueError):
+            async with upstream.astream(open_stream, Deadline(5)):
+                pass
+
+    asyncio.run(main())
+    assert limiter.inflight == 0
+
+
+def test_limiter_hands_slots_over_in_fifo_order():
+    lim = Limiter(max_inflight=1, max_queue=8)
+    lim.acquire(Deadline(1))
+    order, threads = [], []
+    for i in range(5):
+        t = threading.Thread(target=lambda i=i: (lim.acquire(Deadline(5)), order.append(i), lim.release()))
+        t.start()
+        threads.append(t)
+        while lim.waiting < i + 1:     # kolejność wejścia do kolejki = kolejność startu
+            pass
+    lim.release()
+    for t in threads:
+        t.join(5)
+    assert order == list(range(5))
+    assert lim.inflight == 0 and lim.waiting == 0
+
+
+def test_async_waiters_fifo_with_threads():
+    lim = Limiter(max_inflight=1, max_queue=8)
+    lim.acquire(Deadline(1))
+    order = []
+
+    async def coro(i):
+        async with lim.aslot(Deadline(5)):
+            order.append(i)
+            await asyncio.sleep(0)
+
+    async def main():
+        t = threading.Thread(target=lambda: (lim.acquire(Deadline(5)), order.append("wątek"), lim.release()))
+        t.start()
+        while lim.waiting < 1:
+            await asyncio.sleep(0)
+        tasks = []
+        for i in range(3):
+            tasks.append(asyncio.create_task(coro(i)))
+            while lim.waiting < i + 2:
+                await asyncio.sleep(0)
+        lim.release()
+        await asyncio.gather(*tasks)
+        t.join(5)
+
+    asyncio.run(main())
+    assert order == ["wątek", 0, 1, 2]
+    assert lim.inflight == 0
+
+
+def test_deadline_while_waiting_is_busy():
+    lim = Limiter(max_inflight=1, max_queue=2)
+    lim.acquire(Deadline(1))
+    with pytest.raises(upstream.UpstreamBusy) as err:
+        lim.acquire(Deadline(0.05))
+    assert err.value.retry_after >= 1
+    assert lim.timeouts == 1 and lim.waiting == 0
+
+    async def main():
+        with pytest.raises(upstream.UpstreamBusy):
+            await lim.aacquire(Deadline(0.05))
+
+    asyncio.run(main())
+    assert lim.timeouts == 2 and lim.waiting == 0
+    lim.release()
+    assert lim.inflight == 0
+
+
+def test_full_queue_is_rejected_at_once():
+    lim = Limiter(max_inflight=1, max_queue=1)
+    lim.acquire(Deadline(1))
+    t = threading.Thread(target=lambda: (lim.acquire(Deadline(5)), lim.release()))
+    t.start()
+    while lim.waiting < 1:
+        pass
+    assert lim.full()
+    with pytest.raises(upstream.UpstreamBusy):
+        lim.acquire(Deadline(5))
+    assert lim.rejected == 1
+    lim.release()
+    t.join(5)
+    assert lim.inflight == 0 and not lim.full()
+
+
+def test_cancelled_waiter_leaves_queue():
+    lim = Limiter(max_inflight=1, max_queue=4)
+    lim.acquire(Deadline(1))
+
+    async def main():
+        task = asyncio.create_task(lim.aacquire(Deadline(5)))
+        while lim.waiting < 1:
+            await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+    assert lim.waiting == 0
+    lim.release()
+    assert lim.inflight == 0